@@ -24,4 +24,5 @@ def should_show_sort_by_relevance():
     """True if configuration support sorting
     questions by search relevance
     """
-    return (django_settings.DATABASE_ENGINE == 'postgresql_psycopg2')
+    from askbot.search.backends import get_search_backend
+    return get_search_backend().supports_relevance
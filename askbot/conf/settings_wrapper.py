@@ -19,12 +19,31 @@ for the most part, so actual values are reliably available only
 at run time
 
 askbot.deps.livesettings is a module developed for satchmo project
+
+values are served from a process-local snapshot dictionary,
+so that a repeated lookup of a setting does not go to the
+cache backend or the database. The snapshot is versioned:
+when any setting changes, the version token stored in the
+cache is replaced and each process drops its snapshot
+the next time it checks the token, which happens at most
+once per ASKBOT_SETTINGS_SNAPSHOT_CHECK_INTERVAL seconds
+(django setting, default is 5)
 """
+import time
 from django.core.cache import cache
+from django.conf import settings as django_settings
+from django.db.models import loading
 from askbot.deps.livesettings import SortedDotDict, config_register
 from askbot.deps.livesettings.functions import config_get
 from askbot.deps.livesettings import signals
 
+SNAPSHOT_VERSION_CACHE_KEY = 'askbot-livesettings-version'
+SNAPSHOT_CHECK_INTERVAL = getattr(
+                            django_settings,
+                            'ASKBOT_SETTINGS_SNAPSHOT_CHECK_INTERVAL',
+                            5
+                        )
+
 class ConfigSettings(object):
     """A very simple Singleton wrapper for settings
     a limitation is that all settings names using this class
@@ -33,6 +52,12 @@ class ConfigSettings(object):
     """
     __instance = None
     __group_map = {}
+    #snapshot is never modified in place, a new dictionary
+    #is assigned instead, so that readers in other threads
+    #always see a consistent mapping
+    __snapshot = {}
+    __snapshot_version = None
+    __snapshot_checked_at = 0
 
     def __init__(self):
         """assigns SortedDotDict to self.__instance if not set"""
@@ -46,12 +71,57 @@ class ConfigSettings(object):
         not the object - this way only very minimal modifications
         will be required in code to convert an app
         depending on django.conf.settings to askbot.deps.livesettings
+
+        values are taken from the process-local snapshot
+        """
+        snapshot = self.get_snapshot()
+        try:
+            return snapshot[key]
+        except KeyError:
+            value = getattr(self.__instance, key).value
+            if loading.app_cache_ready():
+                #before the app cache is loaded livesettings
+                #returns defaults, which must not be memorized
+                new_snapshot = dict(ConfigSettings.__snapshot)
+                new_snapshot[key] = value
+                ConfigSettings.__snapshot = new_snapshot
+            return value
+
+    @classmethod
+    def get_snapshot(cls):
+        """returns dictionary of setting values cached
+        in the current process, the snapshot is dropped
+        if the version token in the cache has changed,
+        the token is checked not more often than once
+        per SNAPSHOT_CHECK_INTERVAL seconds
+        """
+        now = time.time()
+        if now - cls.__snapshot_checked_at >= SNAPSHOT_CHECK_INTERVAL:
+            cls.__snapshot_checked_at = now
+            version = cache.get(SNAPSHOT_VERSION_CACHE_KEY)
+            if version != cls.__snapshot_version:
+                cls.__snapshot = {}
+                cls.__snapshot_version = version
+        return cls.__snapshot
+
+    @classmethod
+    def invalidate_snapshot(cls, **kwargs):
+        """drops the local snapshot and replaces the version
+        token in the cache, so that other processes drop
+        their snapshots too
         """
-        return getattr(self.__instance, key).value
+        version = '%.6f' % time.time()
+        cache.set(SNAPSHOT_VERSION_CACHE_KEY, version)
+        cls.__snapshot = {}
+        cls.__snapshot_version = version
+        cls.__snapshot_checked_at = time.time()
 
     def update(self, key, value):
         setting = config_get(self.__group_map[key], key) 
         setting.update(value)
+        #value might have been set to the same thing
+        #in which case the signal is not sent
+        self.invalidate_snapshot()
 
     def register(self, value):
         """registers the setting
@@ -94,6 +164,7 @@ class ConfigSettings(object):
         cache.set('askbot-livesettings', out)
 
 
+signals.configuration_value_changed.connect(ConfigSettings.invalidate_snapshot)
 signals.configuration_value_changed.connect(ConfigSettings.prime_cache)
 #settings instance to be used elsewhere in the project
 settings = ConfigSettings()
@@ -0,0 +1,20 @@
+"""fix_related_tags management command
+to run type (on the command line:)
+
+python manage.py fix_related_tags
+"""
+from django.core.management.base import NoArgsCommand
+from django.db import transaction
+from askbot import models
+
+class Command(NoArgsCommand):
+    """Command class for "fix_related_tags"
+    """
+
+    @transaction.commit_on_success
+    def handle_noargs(self, **options):
+        """recalculates the table of tags used together,
+        which is used to show the related tags
+        """
+        pair_count = models.TagCooccurrence.objects.rebuild()
+        print 'Counted questions for %d pairs of tags' % pair_count
@@ -1,3 +1,4 @@
+from django.core import management
 from django.core.management.base import NoArgsCommand
 from django.db import connection
 import os.path
@@ -21,3 +22,10 @@ class Command(NoArgsCommand):
             cursor.execute(fts_init_query)
         finally:
             cursor.close()
+
+        #vectors are calculated in batches and only where missing,
+        #to recalculate all of them run rebuild_postgresql_full_text_search
+        management.call_command(
+                        'rebuild_postgresql_full_text_search',
+                        missing_only = True
+                    )
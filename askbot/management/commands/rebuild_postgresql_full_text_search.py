@@ -0,0 +1,233 @@
+"""rebuild_postgresql_full_text_search management command
+to run type (on the command line:)
+
+python manage.py rebuild_postgresql_full_text_search
+
+recalculates column text_search_vector of comments, answers
+and questions in batches of rows with consecutive ids,
+each batch is committed separately and rows whose vectors
+are already up to date are not rewritten,
+so the command can be interrupted and run again at any time
+
+the tables are recalculated bottom-up, each one once: vectors of
+the answers and questions are made with one set-based UPDATE per batch
+from the vectors of their comments and answers, the triggers merging
+changed rows into the parent posts are turned off for the session
+with the setting askbot.merge_search_vectors, which requires
+PostgreSQL 9.2 or custom_variable_classes = 'askbot' in postgresql.conf,
+on the other servers the triggers are left on and merge the vectors
+of the changed rows into the parent posts as usual
+"""
+import sys
+from optparse import make_option
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.contrib.contenttypes.models import ContentType
+from askbot import models
+
+#tables in the order of dependency - vectors of the answers
+#include comments and vectors of the questions include both
+TABLES = ('comment', 'answer', 'question')
+
+#vector of the row's own text and names of the dependent
+#vectors aggregated from the rows of the other tables
+VECTOR_EXPRESSIONS = {
+    'comment': ('get_comment_tsv(t.comment)', ()),
+    'answer': ('get_answer_tsv(t.text)', ('comments',)),
+    'question': (
+        'get_question_tsv(t.title, t.text, t.tagnames)',
+        ('comments', 'answers')
+    ),
+}
+
+#vectors of the comments and of the answers grouped by
+#the parent post, for the range of ids of the parent posts
+DEPENDENT_VECTOR_QUERIES = {
+    'comments': """
+        SELECT object_id AS parent_id,
+            concat_tsvectors(
+                coalesce(text_search_vector, to_tsvector(''))
+            ) AS vector
+        FROM comment
+        WHERE content_type_id = %(content_type_id)s
+        AND object_id >= %(start_id)s AND object_id < %(end_id)s
+        GROUP BY object_id
+    """,
+    'answers': """
+        SELECT question_id AS parent_id,
+            concat_tsvectors(
+                coalesce(text_search_vector, to_tsvector(''))
+            ) AS vector
+        FROM answer
+        WHERE deleted = false
+        AND question_id >= %(start_id)s AND question_id < %(end_id)s
+        GROUP BY question_id
+    """,
+}
+
+UPDATE_QUERY = """
+    UPDATE %(table)s SET text_search_vector = v.vector
+    FROM (
+        SELECT t.id, %(vector)s AS vector
+        FROM %(table)s t %(joins)s
+        WHERE t.id >= %%(start_id)s AND t.id < %%(end_id)s
+    ) v
+    WHERE %(table)s.id = v.id AND %(condition)s
+"""
+
+UPDATE_CONDITION = '%s.text_search_vector IS DISTINCT FROM v.vector'
+UPDATE_MISSING_CONDITION = '%s.text_search_vector IS NULL'
+
+def get_update_query(table, missing_only = False):
+    """returns query recalculating the vectors of
+    the range of ids in the table
+    """
+    vector, dependencies = VECTOR_EXPRESSIONS[table]
+    vectors = [vector]
+    joins = list()
+    for name in dependencies:
+        joins.append(
+            'LEFT JOIN (%s) %s ON %s.parent_id = t.id' \
+            % (DEPENDENT_VECTOR_QUERIES[name], name, name)
+        )
+        vectors.append("coalesce(%s.vector, to_tsvector(''))" % name)
+    if missing_only:
+        condition = UPDATE_MISSING_CONDITION % table
+    else:
+        condition = UPDATE_CONDITION % table
+    return UPDATE_QUERY % {
+                'table': table,
+                'vector': ' || '.join(vectors),
+                'joins': ' '.join(joins),
+                'condition': condition
+            }
+
+def can_disable_merge_triggers():
+    """True if the server accepts the custom setting
+    askbot.merge_search_vectors: PostgreSQL 9.2 and later
+    accept any prefixed setting, the older versions only those
+    listed in custom_variable_classes
+    """
+    cursor = connection.cursor()
+    cursor.execute('SHOW server_version_num')
+    if int(cursor.fetchone()[0]) >= 90200:
+        return True
+    cursor.execute('SHOW custom_variable_classes')
+    classes = cursor.fetchone()[0] or ''
+    return 'askbot' in [name.strip() for name in classes.split(',')]
+
+class Command(BaseCommand):
+    "The command object itself"
+
+    help = """Recalculates full text search vectors in batches.
+
+Tables are processed in the order: comment, answer, question.
+To resume an interrupted run, use --table and --start-id with
+the values printed last by the interrupted command.
+"""
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size',
+            action = 'store',
+            type = 'int',
+            dest = 'batch_size',
+            default = 1000,
+            help = 'number of consecutive ids updated in one transaction'
+        ),
+        make_option('--table',
+            action = 'store',
+            type = 'str',
+            dest = 'table',
+            default = TABLES[0],
+            help = 'table to start with: comment, answer or question'
+        ),
+        make_option('--start-id',
+            action = 'store',
+            type = 'int',
+            dest = 'start_id',
+            default = 0,
+            help = 'id of the first row in the first table'
+        ),
+        make_option('--missing-only',
+            action = 'store_true',
+            dest = 'missing_only',
+            default = False,
+            help = 'only calculate vectors that were not yet calculated'
+        ),
+    )
+
+    def handle(self, *args, **options):
+        if options['table'] not in TABLES:
+            raise CommandError('--table must be one of %s' % ', '.join(TABLES))
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be a positive number')
+
+        content_type_ids = {
+            'answer': ContentType.objects.get_for_model(models.Answer).id,
+            'question': ContentType.objects.get_for_model(models.Question).id,
+        }
+
+        self.disable_merge_triggers = can_disable_merge_triggers()
+        if not self.disable_merge_triggers:
+            print 'askbot.merge_search_vectors is not supported by the ' + \
+                'server, parent posts will be updated by the triggers'
+
+        first_table_index = TABLES.index(options['table'])
+        start_id = options['start_id']
+        for table in TABLES[first_table_index:]:
+            query = get_update_query(table, options['missing_only'])
+            self.update_table(
+                        table,
+                        query,
+                        content_type_ids.get(table),
+                        start_id,
+                        options['batch_size']
+                    )
+            start_id = 0
+
+    def update_table(self, table, query, content_type_id, start_id, batch_size):
+        """runs the update query on batches of ids
+        and prints the progress
+        """
+        cursor = connection.cursor()
+        cursor.execute('SELECT MAX(id) FROM %s' % table)
+        max_id = cursor.fetchone()[0]
+        if max_id is None:
+            print 'Table %s is empty' % table
+            return
+
+        updated_count = 0
+        for batch_start in xrange(start_id, max_id + 1, batch_size):
+            batch_end = batch_start + batch_size
+            updated_count += self.update_batch(
+                                            query,
+                                            {
+                                                'start_id': batch_start,
+                                                'end_id': batch_end,
+                                                'content_type_id': content_type_id
+                                            }
+                                        )
+            sys.stdout.write(
+                '\r%s: updated %d rows, next --start-id=%d (max id %d)' \
+                % (table, updated_count, batch_end, max_id)
+            )
+            sys.stdout.flush()
+        print ''
+
+    @transaction.commit_manually
+    def update_batch(self, query, params):
+        """updates one batch of rows in its own transaction,
+        with the vectors of the parent posts left to this command
+        where the server allows turning off the merge triggers,
+        returns number of updated rows
+        """
+        try:
+            cursor = connection.cursor()
+            if self.disable_merge_triggers:
+                cursor.execute("SET LOCAL askbot.merge_search_vectors = 'off'")
+            cursor.execute(query, params)
+            row_count = cursor.rowcount
+        except:
+            transaction.rollback()
+            raise
+        transaction.commit()
+        return row_count
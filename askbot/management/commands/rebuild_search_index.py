@@ -0,0 +1,80 @@
+"""rebuild_search_index management command
+to run type (on the command line:)
+
+python manage.py rebuild_search_index
+
+builds the full text index of the questions used
+by the askbot.search.backends.InvertedIndexSearchBackend
+"""
+import datetime
+import sys
+from django.core.management.base import NoArgsCommand
+from askbot import models
+from askbot.search.backends import get_search_backend
+from askbot.search.backends import InvertedIndexSearchBackend
+from askbot.search.inverted_index import get_document
+from askbot.utils import console
+
+BATCH_SIZE = 100
+
+class Command(NoArgsCommand):
+    """Command class for "rebuild_search_index"
+    """
+
+    def handle_noargs(self, **options):
+        backend = get_search_backend()
+        if not isinstance(backend, InvertedIndexSearchBackend):
+            print 'Search index is not used, set ASKBOT_SEARCH_BACKEND to'
+            print 'askbot.search.backends.InvertedIndexSearchBackend'
+            return
+
+        started_at = datetime.datetime.now()
+        index = backend.index
+        index.clear()
+
+        question_ids = list(
+                        models.Question.objects.filter(
+                            deleted = False
+                        ).values_list('id', flat = True)
+                    )
+        total_count = len(question_ids)
+        sys.stdout.write('Indexing questions: ')
+        for start in xrange(0, total_count, BATCH_SIZE):
+            batch_ids = question_ids[start:start + BATCH_SIZE]
+            self.index_questions(index, batch_ids)
+            progress = 100 * float(start + len(batch_ids)) / total_count
+            console.print_progress('%6.2f%%', progress)
+        print '%6.2f%%' % 100
+        lock_file = index.lock_directory()
+        try:
+            index.save()
+        finally:
+            index.unlock_directory(lock_file)
+
+        #questions modified while the index was built
+        updated_questions = models.Question.objects.filter(
+                                        last_activity_at__gte = started_at
+                                    )
+        for question in updated_questions:
+            backend.update_question(question)
+        print 'Indexed %d questions' % total_count
+
+    def index_questions(self, index, question_ids):
+        """adds questions to the index in memory,
+        answers are read for the whole batch in one query
+        """
+        answer_texts = dict()
+        answers = models.Answer.objects.filter(
+                                question__id__in = question_ids,
+                                deleted = False
+                            ).values_list('question', 'text')
+        for question_id, text in answers:
+            answer_texts.setdefault(question_id, list()).append(text)
+
+        questions = models.Question.objects.filter(id__in = question_ids)
+        for question in questions:
+            document = get_document(
+                                question,
+                                answer_texts.get(question.id)
+                            )
+            index.add_document(question.id, document)
@@ -0,0 +1,210 @@
+"""recompute_badges management command
+to run type (on the command line:)
+
+python manage.py recompute_badges
+
+evaluates the criteria of the badges over the whole database,
+one aggregate query per badge, and adds the missing awards,
+with --delete-undeserved also removes the awards that the current
+data does not justify any more, e.g. after the thresholds were raised
+
+awards are inserted in bulk without the notifications
+and the activity records, the award counts of the badges
+and the gold, silver and bronze counts of the users
+are recalculated at the end
+"""
+import datetime
+from optparse import make_option
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from askbot import const
+from askbot import models
+from askbot.models import badges
+from askbot.utils.db import bulk_insert
+
+#number of awards deleted with one query
+BATCH_SIZE = 500
+
+LEVEL_COLUMNS = (
+    (const.GOLD_BADGE, 'gold'),
+    (const.SILVER_BADGE, 'silver'),
+    (const.BRONZE_BADGE, 'bronze'),
+)
+
+def get_award_key(badge, user_id, content_type_id, object_id):
+    """single-award badges are identified by the user,
+    multiple-award badges - by the user and the object
+    """
+    if badge.multiple:
+        return (user_id, content_type_id, object_id)
+    return user_id
+
+class Command(BaseCommand):
+    "The command object itself"
+
+    help = 'Recomputes badge awards with aggregate queries'
+    option_list = BaseCommand.option_list + (
+        make_option('--badge',
+            action = 'store',
+            type = 'str',
+            dest = 'badge',
+            default = None,
+            help = 'comma-separated keys of the badges, by default all badges'
+        ),
+        make_option('--delete-undeserved',
+            action = 'store_true',
+            dest = 'delete_undeserved',
+            default = False,
+            help = 'remove awards not justified by the current data'
+        ),
+    )
+
+    def handle(self, *args, **options):
+        if options['badge']:
+            keys = [key.strip() for key in options['badge'].split(',')]
+            for key in keys:
+                if key not in badges.BADGES:
+                    raise CommandError('unknown badge %s' % key)
+        else:
+            keys = sorted(badges.BADGES.keys())
+
+        for key in keys:
+            badge = badges.get_badge(key)
+            added_count, deleted_count = self.recompute_badge(
+                                                badge,
+                                                options['delete_undeserved']
+                                            )
+            if added_count is None:
+                print '%s: awarded only upon events, skipped' % key
+            else:
+                print '%s: added %d, deleted %d awards' \
+                        % (key, added_count, deleted_count)
+
+        self.update_counters()
+
+    @transaction.commit_on_success
+    def recompute_badge(self, badge, delete_undeserved):
+        """returns tuple (number of added awards, number of deleted awards)
+        or (None, None) if the badge cannot be recomputed
+        """
+        deserved_awards = badge.get_deserved_awards()
+        if deserved_awards is None:
+            return None, None
+
+        badge_data = badge.get_stored_data()
+        existing_awards = dict()
+        rows = models.Award.objects.filter(
+                                    badge = badge_data
+                                ).values_list(
+                                    'id', 'user', 'content_type', 'object_id'
+                                )
+        for award_id, user_id, content_type_id, object_id in rows:
+            key = get_award_key(badge, user_id, content_type_id, object_id)
+            existing_awards.setdefault(key, list()).append(award_id)
+
+        new_awards = list()
+        deserved_keys = set()
+        for user_id, content_type_id, object_id in deserved_awards:
+            key = get_award_key(badge, user_id, content_type_id, object_id)
+            if key in deserved_keys:
+                continue
+            deserved_keys.add(key)
+            if key not in existing_awards:
+                new_awards.append((user_id, content_type_id, object_id))
+        self.insert_awards(badge_data, new_awards)
+
+        deleted_count = 0
+        if delete_undeserved:
+            undeserved_ids = list()
+            for key, award_ids in existing_awards.items():
+                if key not in deserved_keys:
+                    undeserved_ids.extend(award_ids)
+            self.delete_awards(undeserved_ids)
+            deleted_count = len(undeserved_ids)
+
+        return len(new_awards), deleted_count
+
+    def insert_awards(self, badge_data, awards):
+        """inserts awards with multi-row INSERT statements,
+        post_save signals of the Award model are not sent
+        """
+        awarded_at = datetime.datetime.now()
+        bulk_insert(
+            models.Award,
+            ('user', 'badge', 'content_type', 'object_id',
+            'awarded_at', 'notified'),
+            [
+                (user_id, badge_data.id, content_type_id,
+                object_id, awarded_at, True) \
+                for user_id, content_type_id, object_id in awards
+            ]
+        )
+
+    def delete_awards(self, award_ids):
+        """deletes awards together with their activity records"""
+        award_content_type = badges.get_content_type_id(models.Award)
+        for start in xrange(0, len(award_ids), BATCH_SIZE):
+            batch_ids = award_ids[start:start + BATCH_SIZE]
+            models.Activity.objects.filter(
+                                content_type__id = award_content_type,
+                                object_id__in = batch_ids
+                            ).delete()
+            models.Award.objects.filter(id__in = batch_ids).delete()
+
+    @transaction.commit_on_success
+    def update_counters(self):
+        """recalculates award counts of the badges and
+        the gold, silver and bronze counts of all users
+        with one UPDATE statement per table
+        """
+        qn = connection.ops.quote_name
+        award_table = qn(models.Award._meta.db_table)
+        badge_table = qn(models.BadgeData._meta.db_table)
+        user_table = qn(models.User._meta.db_table)
+        award_badge_column = qn(models.Award._meta.get_field('badge').column)
+        award_user_column = qn(models.Award._meta.get_field('user').column)
+
+        cursor = connection.cursor()
+        cursor.execute(
+            'UPDATE %(badge)s SET awarded_count = ('
+                'SELECT COUNT(*) FROM %(award)s '
+                'WHERE %(award)s.%(badge_id)s = %(badge)s.id'
+            ')' % {
+                'badge': badge_table,
+                'award': award_table,
+                'badge_id': award_badge_column
+            }
+        )
+
+        badge_ids = dict()
+        for badge_id, slug in models.BadgeData.objects.values_list('id', 'slug'):
+            try:
+                level = badges.get_badge(slug).level
+            except KeyError:
+                continue
+            badge_ids.setdefault(level, list()).append(badge_id)
+
+        assignments = list()
+        params = list()
+        for level, column in LEVEL_COLUMNS:
+            level_badge_ids = badge_ids.get(level)
+            if not level_badge_ids:
+                assignments.append('%s = 0' % qn(column))
+                continue
+            assignments.append(
+                '%(column)s = (SELECT COUNT(*) FROM %(award)s '
+                'WHERE %(award)s.%(user_id)s = %(user)s.id '
+                'AND %(award)s.%(badge_id)s IN (%(ids)s))' % {
+                    'column': qn(column),
+                    'award': award_table,
+                    'user': user_table,
+                    'user_id': award_user_column,
+                    'badge_id': award_badge_column,
+                    'ids': ', '.join(['%s'] * len(level_badge_ids))
+                }
+            )
+            params.extend(level_badge_ids)
+        cursor.execute(
+            'UPDATE %s SET %s' % (user_table, ', '.join(assignments)),
+            params
+        )
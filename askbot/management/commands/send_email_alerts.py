@@ -1,10 +1,37 @@
+"""send_email_alerts management command
+to run type (on the command line:)
+
+python manage.py send_email_alerts
+
+sends delayed (daily and weekly) email digests of the
+updated questions. Users are processed in batches:
+
+* subscriptions of all users are read with one query
+  and users without subscriptions due now are skipped
+* questions updated within the reporting windows of the batch
+  are read once, with their followers, tags, views and answer
+  authors among the users of the batch, the same is done for
+  the comments and mentions, then the questions are selected
+  for each user of the batch in memory
+* revisions, answers and previous email alerts of all
+  questions selected for the batch are read at once
+  and counted for each user in memory
+* messages of the batch are sent, with --workers > 1
+  by several threads at a time
+* only after the message is sent the subscriptions
+  of the user are marked as reported, so if the command
+  is interrupted, the next run continues with the users
+  who did not receive their messages yet
+"""
 import datetime
-from django.core.management.base import NoArgsCommand
+import threading
+import Queue
+from optparse import make_option
+from django.core.management.base import BaseCommand, CommandError
 from django.db import connection
-from django.db.models import Q, F
 from askbot.models import User, Question, Answer, Tag, QuestionRevision
 from askbot.models import AnswerRevision, Activity, EmailFeedSetting
-from askbot.models import Comment
+from askbot.models import Comment, QuestionView, ActivityAuditStatus
 from django.utils.translation import ugettext as _
 from django.utils.translation import ungettext
 from django.conf import settings as django_settings
@@ -12,16 +39,502 @@ from askbot.conf import settings as askbot_settings
 from django.utils.datastructures import SortedDict
 from django.contrib.contenttypes.models import ContentType
 from askbot import const
+from askbot import exceptions
 from askbot.utils import mail
 
 DEBUG_THIS_COMMAND = False
 
-def get_all_origin_posts(mentions):
-    origin_posts = set()
-    for mention in mentions:
-        post = mention.content_object
-        origin_posts.add(post.get_origin_post())
-    return list(origin_posts)
+def get_feed_window_start(user, feed):
+    """returns the earliest time of the last activity on the
+    questions to be considered for the feed - the previous report
+    minus one more reporting period, so that the questions updated
+    while the previous report was being sent are not missed,
+    questions emailed already are skipped later anyway
+    """
+    window_start = user.date_joined
+    if feed.reported_at is not None:
+        delta = EmailFeedSetting.DELTA_TABLE[feed.frequency]
+        window_start = max(window_start, feed.reported_at - delta)
+    return window_start
+
+def get_question_m2m_pairs(field_name, since, user_ids = None):
+    """returns list of tuples (question id, related object id)
+    of the many to many relation of the open questions
+    active since the given time, when user_ids are given,
+    only the pairs with these related users are returned
+    """
+    qn = connection.ops.quote_name
+    meta = Question._meta
+    field = meta.get_field(field_name)
+    sql = 'SELECT m.%(question_id)s, m.%(related_id)s ' \
+            'FROM %(m2m)s m INNER JOIN %(question)s q ' \
+            'ON q.%(id)s = m.%(question_id)s ' \
+            'WHERE q.%(deleted)s = %%s AND q.%(closed)s = %%s ' \
+            'AND q.%(last_activity_at)s >= %%s' % {
+                'question_id': qn(field.m2m_column_name()),
+                'related_id': qn(field.m2m_reverse_name()),
+                'm2m': qn(field.m2m_db_table()),
+                'question': qn(meta.db_table),
+                'id': qn(meta.pk.column),
+                'deleted': qn(meta.get_field('deleted').column),
+                'closed': qn(meta.get_field('closed').column),
+                'last_activity_at': qn(meta.get_field('last_activity_at').column),
+            }
+    params = [False, False, since]
+    if user_ids is not None:
+        user_ids = list(user_ids)
+        if len(user_ids) == 0:
+            return list()
+        sql += ' AND m.%s IN (%s)' % (
+                            qn(field.m2m_reverse_name()),
+                            ', '.join(['%s'] * len(user_ids))
+                        )
+        params.extend(user_ids)
+    cursor = connection.cursor()
+    cursor.execute(sql, params)
+    return cursor.fetchall()
+
+def get_mentioned_questions(user_ids, cutoff_time):
+    """returns dictionary {user id: list of tuples (question id, time)}
+    with the questions where the users were mentioned before the cutoff time
+    """
+    mentions = ActivityAuditStatus.objects.filter(
+                                user__id__in = list(user_ids),
+                                activity__activity_type = const.TYPE_ACTIVITY_MENTION,
+                                activity__active_at__lt = cutoff_time
+                            ).values_list(
+                                'user', 'activity', 'activity__question',
+                                'activity__active_at'
+                            )
+    mentioned_questions = dict()
+    for user_id, mention_id, question_id, mentioned_at in mentions:
+        if question_id is None:
+            #mentions recorded before the question field was added
+            mention = Activity.objects.get(id = mention_id)
+            question_id = mention.content_object.get_origin_post().id
+        mentioned_questions.setdefault(user_id, list()).append(
+                                                    (question_id, mentioned_at)
+                                                )
+    return mentioned_questions
+
+def get_commented_questions(user_ids, cutoff_time):
+    """returns dictionary {user id: list of tuples (question id, time)}
+    with one item per comment made by other users on the posts
+    by the users before the cutoff time
+    """
+    comments = Comment.objects.filter(added_at__lt = cutoff_time)
+    commented_questions = dict()
+
+    question_type = ContentType.objects.get_for_model(Question)
+    question_comments = list(
+        comments.filter(
+                    content_type = question_type,
+                    object_id__in = Question.objects.filter(
+                                            author__id__in = list(user_ids)
+                                        ).values('id')
+                ).values_list('object_id', 'user', 'added_at')
+    )
+    if question_comments:
+        question_authors = dict(
+            Question.objects.filter(
+                        id__in = set([c[0] for c in question_comments])
+                    ).values_list('id', 'author')
+        )
+        for question_id, commenter_id, added_at in question_comments:
+            author_id = question_authors[question_id]
+            if commenter_id != author_id:
+                commented_questions.setdefault(author_id, list()).append(
+                                                        (question_id, added_at)
+                                                    )
+
+    answer_type = ContentType.objects.get_for_model(Answer)
+    answer_comments = list(
+        comments.filter(
+                    content_type = answer_type,
+                    object_id__in = Answer.objects.filter(
+                                            author__id__in = list(user_ids)
+                                        ).values('id')
+                ).values_list('object_id', 'user', 'added_at')
+    )
+    if answer_comments:
+        answer_data = dict(
+            (answer_id, (author_id, question_id)) \
+            for answer_id, author_id, question_id in Answer.objects.filter(
+                        id__in = set([c[0] for c in answer_comments])
+                    ).values_list('id', 'author', 'question')
+        )
+        for answer_id, commenter_id, added_at in answer_comments:
+            author_id, question_id = answer_data[answer_id]
+            if commenter_id != author_id:
+                commented_questions.setdefault(author_id, list()).append(
+                                                        (question_id, added_at)
+                                                    )
+
+    return commented_questions
+
+def group_by_question(records):
+    """returns dictionary {question id: list of tuples}
+    made of the records, where the first item is the question id
+    """
+    grouped = dict()
+    for record in records:
+        grouped.setdefault(record[0], list()).append(record[1:])
+    return grouped
+
+
+class UpdatedQuestions(object):
+    """questions updated within the reporting windows of a batch
+    of users, read once per batch together with the followers,
+    answer authors, tags and views, then selected for each
+    subscriber in memory
+    """
+    def __init__(self, users, feeds_by_user):
+        user_ids = [user.id for user in users]
+        #question id -> (author id, last activity by, last activity at)
+        self.questions = dict()
+        self.question_ids = list()#sorted by the latest activity first
+        self.views = dict()
+        self.followers = dict()
+        self.answer_authors = dict()
+        self.tag_ids = dict()
+
+        self.commented_questions = dict()
+        self.mentioned_questions = dict()
+
+        mentions_cutoff = None
+        for user in users:
+            for feed in feeds_by_user[user.id]:
+                if feed.feed_type == 'm_and_c' and feed.should_send_now():
+                    cutoff_time = feed.get_previous_report_cutoff_time()
+                    if mentions_cutoff is None or cutoff_time > mentions_cutoff:
+                        mentions_cutoff = cutoff_time
+        if mentions_cutoff is not None:
+            self.commented_questions = get_commented_questions(
+                                                        user_ids,
+                                                        mentions_cutoff
+                                                    )
+            self.mentioned_questions = get_mentioned_questions(
+                                                        user_ids,
+                                                        mentions_cutoff
+                                                    )
+
+        since = None
+        tags_needed = False
+        for user in users:
+            for feed in feeds_by_user[user.id]:
+                if feed.feed_type == 'm_and_c' or not feed.should_send_now():
+                    continue
+                window_start = get_feed_window_start(user, feed)
+                if since is None or window_start < since:
+                    since = window_start
+                if feed.feed_type == 'q_all':
+                    tags_needed = True
+        if since is not None:
+            self.load_window(user_ids, since, tags_needed)
+
+        mentioned_ids = set()
+        for records in self.mentioned_questions.values():
+            mentioned_ids.update([record[0] for record in records])
+        self.add_questions(user_ids, mentioned_ids)
+
+    def load_window(self, user_ids, since, tags_needed):
+        """loads the open questions active since the given time,
+        the batch users who follow or answered them and their tags
+        """
+        self.load_questions(
+                    user_ids,
+                    last_activity_at__gte = since,
+                    deleted = False,
+                    closed = False
+                )
+
+        pairs = get_question_m2m_pairs('followed_by', since, user_ids)
+        for question_id, user_id in pairs:
+            self.followers.setdefault(question_id, set()).add(user_id)
+
+        answers = Answer.objects.filter(
+                                author__id__in = user_ids,
+                                question__last_activity_at__gte = since,
+                                question__deleted = False,
+                                question__closed = False
+                            ).values_list('question', 'author')
+        for question_id, user_id in answers:
+            self.answer_authors.setdefault(question_id, set()).add(user_id)
+
+        if tags_needed:
+            for question_id, tag_id in get_question_m2m_pairs('tags', since):
+                self.tag_ids.setdefault(question_id, set()).add(tag_id)
+
+    def load_questions(self, user_ids, **filters):
+        """adds data of the open questions selected by the filters
+        and their views by the given users
+        """
+        questions = Question.objects.filter(**filters).values_list(
+                                'id', 'author', 'last_activity_by',
+                                'last_activity_at'
+                            )
+        for question_id, author_id, last_activity_by_id, last_activity_at \
+            in questions:
+            self.questions[question_id] = (
+                                    author_id,
+                                    last_activity_by_id,
+                                    last_activity_at
+                                )
+
+        view_filters = dict()
+        for key, value in filters.items():
+            view_filters['question__' + key] = value
+        views = QuestionView.objects.filter(
+                                    who__id__in = user_ids,
+                                    **view_filters
+                                ).values_list('question', 'who', 'when')
+        for question_id, user_id, viewed_at in views:
+            self.views.setdefault((question_id, user_id), list()).append(viewed_at)
+
+        self.question_ids = self.questions.keys()
+        self.question_ids.sort(
+            lambda x, y: cmp(self.questions[y][2], self.questions[x][2])
+        )
+
+    def add_questions(self, user_ids, question_ids):
+        """loads the open questions given by id, which
+        are missing because they are not updated recently
+        """
+        question_ids = set(question_ids) - set(self.questions.keys())
+        if question_ids:
+            self.load_questions(
+                        user_ids,
+                        id__in = list(question_ids),
+                        deleted = False,
+                        closed = False
+                    )
+
+    def select(self, user, is_selected, since = None):
+        """returns tuple of two lists of ids of the questions
+        passing the test ``is_selected(question_id)``, the first list
+        with the questions not seen by the user, the second - with the
+        questions seen before the last activity, questions last
+        updated by the user or before the user joined are left out,
+        both lists start with the most recently updated questions
+        """
+        not_seen = list()
+        seen_before_last_mod = list()
+        for question_id in self.question_ids:
+            author_id, last_activity_by_id, last_activity_at = \
+                                            self.questions[question_id]
+            if last_activity_by_id == user.id:
+                continue
+            if last_activity_at < user.date_joined:
+                continue
+            if since is not None and last_activity_at < since:
+                continue
+            if not is_selected(question_id):
+                continue
+            viewed_at = self.views.get((question_id, user.id))
+            if viewed_at is None:
+                not_seen.append(question_id)
+            elif min(viewed_at) < last_activity_at:
+                seen_before_last_mod.append(question_id)
+        return not_seen, seen_before_last_mod
+
+    def get_commented_question_ids(self, user, cutoff_time):
+        """returns list of question ids with one item per comment
+        on the posts by the user made before the cutoff time
+        """
+        return [
+            question_id for question_id, commented_at \
+            in self.commented_questions.get(user.id, list()) \
+            if commented_at < cutoff_time
+        ]
+
+    def get_mentioned_question_ids(self, user, cutoff_time):
+        """returns list of ids of the questions where the
+        user was mentioned before the cutoff time
+        """
+        return [
+            question_id for question_id, mentioned_at \
+            in self.mentioned_questions.get(user.id, list()) \
+            if mentioned_at < cutoff_time
+        ]
+
+    def is_author(self, user, question_id):
+        return self.questions[question_id][0] == user.id
+
+    def is_follower(self, user, question_id):
+        return user.id in self.followers.get(question_id, ())
+
+    def is_answerer(self, user, question_id):
+        return user.id in self.answer_authors.get(question_id, ())
+
+    def has_tags(self, question_id, tag_ids):
+        return len(self.tag_ids.get(question_id, set()) & tag_ids) > 0
+
+
+class QuestionUpdates(object):
+    """revisions, answers and email alerts about a batch
+    of questions, read with one query per kind of record
+    and then counted for each user in memory
+    """
+    def __init__(self, question_ids, user_ids):
+        question_ids = list(question_ids)
+        self.question_revisions = group_by_question(
+            QuestionRevision.objects.filter(
+                                question__id__in = question_ids
+                            ).values_list(
+                                'question', 'author', 'revised_at', 'revision'
+                            )
+        )
+        self.answers = group_by_question(
+            Answer.objects.filter(
+                                question__id__in = question_ids,
+                                deleted = False
+                            ).values_list(
+                                'question', 'author', 'added_at'
+                            )
+        )
+        self.answer_revisions = group_by_question(
+            AnswerRevision.objects.filter(
+                                answer__question__id__in = question_ids,
+                                answer__deleted = False
+                            ).values_list(
+                                'answer__question', 'author', 'revised_at'
+                            )
+        )
+
+        question_type = ContentType.objects.get_for_model(Question)
+        email_activities = Activity.objects.filter(
+                                user__id__in = list(user_ids),
+                                content_type = question_type,
+                                object_id__in = question_ids,
+                                activity_type = const.TYPE_ACTIVITY_EMAIL_UPDATE_SENT
+                            ).values_list('user', 'object_id', 'id', 'active_at')
+        self.email_activities = dict()
+        for user_id, question_id, activity_id, active_at in email_activities:
+            key = (user_id, question_id)
+            if key in self.email_activities:
+                raise Exception(
+                                'server error - multiple question email activities '
+                                'found per user-question pair'
+                                )
+            self.email_activities[key] = (activity_id, active_at)
+
+    def get_email_activity(self, user, question):
+        """returns tuple (id of the activity, time when
+        the user was emailed about the question), id is None
+        if the user was never emailed about the question
+        """
+        return self.email_activities.get(
+                            (user.id, question.id),
+                            (None, datetime.datetime(1970, 1, 1))#long time ago
+                        )
+
+    def get_question_revisions(self, user, question, since):
+        """returns list of revision numbers and times
+        of the revisions made by others since the given time
+        """
+        return [
+            (revision, revised_at) for author_id, revised_at, revision \
+            in self.question_revisions.get(question.id, list()) \
+            if revised_at > since and author_id != user.id
+        ]
+
+    def count_updates(self, records, user, question, since):
+        count = 0
+        for author_id, updated_at in records.get(question.id, list()):
+            if updated_at > since and author_id != user.id:
+                count += 1
+        return count
+
+    def count_answers(self, user, question, since):
+        return self.count_updates(self.answers, user, question, since)
+
+    def count_answer_revisions(self, user, question, since):
+        return self.count_updates(self.answer_revisions, user, question, since)
+
+
+class Digest(object):
+    """email message for one user, together with
+    the records to be saved after the message is sent
+    """
+    def __init__(self, user, subject_line, body_text, recipient_email):
+        self.user = user
+        self.subject_line = subject_line
+        self.body_text = body_text
+        self.recipient_email = recipient_email
+        self.sent = False
+
+    def send(self, connection):
+        try:
+            mail.send_mail(
+                subject_line = self.subject_line,
+                body_text = self.body_text,
+                recipient_list = [self.recipient_email],
+                raise_on_failure = True,
+                connection = connection
+            )
+            self.sent = True
+        except exceptions.EmailNotSent:
+            self.sent = False
+
+def send_digests(digests, worker_count, on_sent = None):
+    """sends the messages with the given number of threads,
+    each thread uses its own connection to the mail server
+
+    on_sent is called in the calling thread with each
+    digest right after it is sent, so that the sent digests
+    are recorded even if the sending is interrupted
+    """
+    if len(digests) == 0:
+        return
+
+    if worker_count < 2:
+        connection = mail.get_connection()
+        try:
+            for digest in digests:
+                digest.send(connection)
+                if digest.sent and on_sent:
+                    on_sent(digest)
+        finally:
+            connection.close()
+        return
+
+    queue = Queue.Queue()
+    for digest in digests:
+        queue.put(digest)
+    #digests that were tried, or None when a worker stops
+    finished = Queue.Queue()
+
+    def worker():
+        try:
+            connection = mail.get_connection()
+            try:
+                while True:
+                    try:
+                        digest = queue.get_nowait()
+                    except Queue.Empty:
+                        return
+                    digest.send(connection)
+                    finished.put(digest)
+            finally:
+                connection.close()
+        finally:
+            finished.put(None)
+
+    threads = list()
+    for i in range(min(worker_count, len(digests))):
+        thread = threading.Thread(target = worker)
+        thread.start()
+        threads.append(thread)
+
+    running_count = len(threads)
+    while running_count > 0:
+        digest = finished.get()
+        if digest is None:
+            running_count -= 1
+        elif digest.sent and on_sent:
+            on_sent(digest)
+    for thread in threads:
+        thread.join()
 
 #todo: refactor this as class
 def extend_question_list(
@@ -118,89 +631,79 @@ def get_update_subject_line(question_dict):
 
     return mail.prefix_the_subject_line(subject_line)
 
-class Command(NoArgsCommand):
-    def handle_noargs(self, **options):
+class Command(BaseCommand):
+    help = 'Sends delayed email alerts about the updated questions'
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size',
+            action = 'store',
+            type = 'int',
+            dest = 'batch_size',
+            default = 100,
+            help = 'number of users whose alerts are prepared together'
+        ),
+        make_option('--workers',
+            action = 'store',
+            type = 'int',
+            dest = 'workers',
+            default = 1,
+            help = 'number of threads sending the messages'
+        ),
+    )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be a positive number')
+        if options['workers'] < 1:
+            raise CommandError('--workers must be a positive number')
         try:
             try:
-                self.send_email_alerts()
+                self.send_email_alerts(
+                            batch_size = options['batch_size'],
+                            worker_count = options['workers']
+                        )
             except Exception, e:
                 print e
         finally:
             connection.close()
 
-    def get_updated_questions_for_user(self,user):
+    def get_feeds_by_user(self):
+        """returns dictionary {user id: list of feeds}
+        with delayed subscriptions of the users who
+        have at least one subscription due now
         """
-        retreive relevant question updates for the user
-        according to their subscriptions and recorded question
-        views
+        feeds_by_user = dict()
+        feeds = EmailFeedSetting.objects.exclude(frequency__in=('n', 'i'))
+        for feed in feeds:
+            feeds_by_user.setdefault(feed.subscriber_id, list()).append(feed)
+
+        for user_id, user_feeds in feeds_by_user.items():
+            should_proceed = False
+            for feed in user_feeds:
+                if feed.should_send_now() == True:
+                    should_proceed = True
+                    break
+            #shortcirquit - if there is no ripe feed to work on for this user
+            if should_proceed == False:
+                del feeds_by_user[user_id]
+        return feeds_by_user
+
+    def get_updated_questions_for_user(self, user, user_feeds, updated):
         """
+        select relevant question updates for the user
+        according to their subscriptions and recorded question
+        views from the questions updated for the whole batch
 
-        user_feeds = EmailFeedSetting.objects.filter(
-                                                subscriber=user
-                                            ).exclude(
-                                                frequency__in=('n', 'i')
-                                            )
-
-        should_proceed = False
-        for feed in user_feeds:
-            if feed.should_send_now() == True:
-                should_proceed = True
-                break
-
-        #shortcirquit - if there is no ripe feed to work on for this user
-        if should_proceed == False:
-            return {}
-
-        #these are placeholders for separate query sets per question group
-        #there are four groups - one for each EmailFeedSetting.feed_type
-        #and each group has subtypes A and B
-        #that's because of the strange thing commented below
-        #see note on Q and F objects marked with todo tag
-        q_sel_A = None
-        q_sel_B = None
-
-        q_ask_A = None
-        q_ask_B = None
-
-        q_ans_A = None
-        q_ans_B = None
-
-        q_all_A = None
-        q_all_B = None
-
-        #base question query set for this user
-        #basic things - not deleted, not closed, not too old
-        #not last edited by the same user
-        base_qs = Question.objects.exclude(
-                                last_activity_by=user
-                            ).exclude(
-                                last_activity_at__lt=user.date_joined#exclude old stuff
-                            ).exclude(
-                                deleted=True
-                            ).exclude(
-                                closed=True
-                            ).order_by('-last_activity_at')
-        #todo: for some reason filter on did not work as expected ~Q(viewed__who=user) | 
-        #      Q(viewed__who=user,viewed__when__lt=F('last_activity_at'))
-        #returns way more questions than you might think it should
-        #so because of that I've created separate query sets Q_set2 and Q_set3
-        #plus two separate queries run faster!
-
-        #build two two queries based
-
-        #questions that are not seen by the user at all
-        not_seen_qs = base_qs.filter(~Q(viewed__who=user))
-        #questions that were seen, but before last modification
-        seen_before_last_mod_qs = base_qs.filter(
-                                    Q(
-                                        viewed__who=user,
-                                        viewed__when__lt=F('last_activity_at')
-                                    )
-                                )
+        returns tuple of the ordered dictionary of question ids
+        with the metadata and the list of feeds to be marked
+        as reported after the alert is sent
+        """
+        reported_feeds = list()
 
-        #shorten variables for convenience
-        Q_set_A = not_seen_qs
-        Q_set_B = seen_before_last_mod_qs
+        #ids of the selected questions for each feed type
+        #in two groups - questions that are not seen by the user at all
+        #and questions that were seen, but before last modification
+        #the first group goes into the report first
+        selections = dict()
 
         for feed in user_feeds:
             if feed.feed_type == 'm_and_c':
@@ -210,87 +713,79 @@ class Command(NoArgsCommand):
                 #http://askbot.org/en/question/96/
                 continue
 
-            #each group of updates represented by the corresponding
-            #query set has it's own cutoff time
+            #each group of updates has it's own cutoff time
             #that cutoff time is computed for each user individually
-            #and stored as a parameter "cutoff_time"
 
             #we won't send email for a given question if an email has been
             #sent after that cutoff_time
-            if feed.should_send_now():
-                if DEBUG_THIS_COMMAND == False:
-                    feed.mark_reported_now()
-                cutoff_time = feed.get_previous_report_cutoff_time() 
-
-                if feed.feed_type == 'q_sel':
-                    q_sel_A = Q_set_A.filter(followed_by=user)
-                    q_sel_A.cutoff_time = cutoff_time #store cutoff time per query set
-                    q_sel_B = Q_set_B.filter(followed_by=user)
-                    q_sel_B.cutoff_time = cutoff_time #store cutoff time per query set
-
-                elif feed.feed_type == 'q_ask':
-                    q_ask_A = Q_set_A.filter(author=user)
-                    q_ask_A.cutoff_time = cutoff_time
-                    q_ask_B = Q_set_B.filter(author=user)
-                    q_ask_B.cutoff_time = cutoff_time
-
-                elif feed.feed_type == 'q_ans':
-                    q_ans_A = Q_set_A.filter(answers__author=user)
-                    q_ans_A = q_ans_A[:askbot_settings.MAX_ALERTS_PER_EMAIL]
-                    q_ans_A.cutoff_time = cutoff_time
-
-                    q_ans_B = Q_set_B.filter(answers__author=user)
-                    q_ans_B = q_ans_B[:askbot_settings.MAX_ALERTS_PER_EMAIL]
-                    q_ans_B.cutoff_time = cutoff_time
-
-                elif feed.feed_type == 'q_all':
-                    if user.email_tag_filter_strategy == 'ignored':
-
-                        ignored_tags = Tag.objects.filter(
-                                                user_selections__reason='bad',
-                                                user_selections__user=user
-                                            )
-
-                        wk = user.ignored_tags.strip().split()
-                        ignored_by_wildcards = Tag.objects.get_by_wildcards(wk)
-
-                        q_all_A = Q_set_A.exclude(
-                                        tags__in = ignored_tags
-                                    ).exclude(
-                                        tags__in = ignored_by_wildcards
-                                    )
+            if not feed.should_send_now():
+                continue
+            if DEBUG_THIS_COMMAND == False:
+                reported_feeds.append(feed)
+            cutoff_time = feed.get_previous_report_cutoff_time()
+            limit = None
+
+            if feed.feed_type == 'q_sel':
+                is_selected = lambda question_id: \
+                                    updated.is_follower(user, question_id)
+
+            elif feed.feed_type == 'q_ask':
+                is_selected = lambda question_id: \
+                                    updated.is_author(user, question_id)
+
+            elif feed.feed_type == 'q_ans':
+                is_selected = lambda question_id: \
+                                    updated.is_answerer(user, question_id)
+                limit = askbot_settings.MAX_ALERTS_PER_EMAIL
+
+            elif feed.feed_type == 'q_all':
+                #interesting and ignored tags with the wildcards
+                #resolved, possibly cached for the whole run
+                tag_filter = Tag.objects.get_filter_for_user(user)
+                if user.email_tag_filter_strategy == const.EXCLUDE_IGNORED:
+                    ignored_tag_ids = set(tag_filter.ignored_tag_ids)
+                    is_selected = lambda question_id: \
+                            not updated.has_tags(question_id, ignored_tag_ids)
+                else:
+                    selected_tag_ids = set(tag_filter.interesting_tag_ids)
+                    is_selected = lambda question_id: \
+                            updated.has_tags(question_id, selected_tag_ids)
+                limit = askbot_settings.MAX_ALERTS_PER_EMAIL
+            else:
+                continue
 
-                        q_all_B = Q_set_B.exclude(
-                                        tags__in = ignored_tags
-                                    ).exclude(
-                                        tags__in = ignored_by_wildcards
+            not_seen, seen_before_last_mod = updated.select(
+                                        user,
+                                        is_selected,
+                                        since = get_feed_window_start(user, feed)
                                     )
-                    else:
-                        selected_tags = Tag.objects.filter(
-                                                user_selections__reason='good',
-                                                user_selections__user=user
-                                            )
-
-                        wk = user.interesting_tags.strip().split()
-                        selected_by_wildcards = Tag.objects.get_by_wildcards(wk)
-
-                        tag_filter = Q(tags__in = list(selected_tags)) \
-                                    | Q(tags__in = list(selected_by_wildcards))
-
-                        q_all_A = Q_set_A.filter( tag_filter )
-                        q_all_B = Q_set_B.filter( tag_filter )
-
-                    q_all_A = q_all_A[:askbot_settings.MAX_ALERTS_PER_EMAIL]
-                    q_all_B = q_all_B[:askbot_settings.MAX_ALERTS_PER_EMAIL]
-                    q_all_A.cutoff_time = cutoff_time
-                    q_all_B.cutoff_time = cutoff_time
+            if limit is not None:
+                not_seen = not_seen[:limit]
+                seen_before_last_mod = seen_before_last_mod[:limit]
+            selections[feed.feed_type] = (
+                                    not_seen,
+                                    seen_before_last_mod,
+                                    cutoff_time
+                                )
 
         #build ordered list questions for the email report
         q_list = SortedDict()
 
+        def extend_with_selection(feed_type, limit = False):
+            if feed_type in selections:
+                not_seen, seen_before_last_mod, cutoff_time = \
+                                                    selections[feed_type]
+                extend_question_list(
+                            not_seen, q_list,
+                            cutoff_time = cutoff_time, limit = limit
+                        )
+                extend_question_list(
+                            seen_before_last_mod, q_list,
+                            cutoff_time = cutoff_time, limit = limit
+                        )
+
         #todo: refactor q_list into a separate class?
-        extend_question_list(q_sel_A, q_list)
-        extend_question_list(q_sel_B, q_list)
+        extend_with_selection('q_sel')
 
         #build list of comment and mention responses here
         #it is separate because posts are not marked as changed
@@ -298,108 +793,63 @@ class Command(NoArgsCommand):
         #mention responses could be collected in the loop above, but
         #it is inconvenient, because feed_type m_and_c bundles the two
         #also we collect metadata for these here
-        try:
-            feed = user_feeds.get(feed_type='m_and_c')
-            if feed.should_send_now():
-                cutoff_time = feed.get_previous_report_cutoff_time()
-                comments = Comment.objects.filter(
-                                            added_at__lt = cutoff_time,
-                                        ).exclude(
-                                            user = user
-                                        )
-                q_commented = list() 
-                for c in comments:
-                    post = c.content_object
-                    if post.author != user:
-                        continue
-
-                    #skip is post was seen by the user after
-                    #the comment posting time
-                    q_commented.append(post.get_origin_post())
-
-                extend_question_list(
-                                q_commented,
-                                q_list,
-                                cutoff_time = cutoff_time,
-                                add_comment = True
-                            )
-
-                mentions = Activity.objects.get_mentions(
-                                                    mentioned_at__lt = cutoff_time,
-                                                    mentioned_whom = user
-                                                )
-
-                #print 'have %d mentions' % len(mentions)
-                #MM = Activity.objects.filter(activity_type = const.TYPE_ACTIVITY_MENTION)
-                #print 'have %d total mentions' % len(MM)
-                #for m in MM:
-                #    print m
-
-                mention_posts = get_all_origin_posts(mentions)
-                q_mentions_id = [q.id for q in mention_posts]
+        for feed in user_feeds:
+            if feed.feed_type != 'm_and_c' or not feed.should_send_now():
+                continue
 
-                q_mentions_A = Q_set_A.filter(id__in = q_mentions_id)
-                q_mentions_A.cutoff_time = cutoff_time
-                extend_question_list(q_mentions_A, q_list, add_mention=True)
+            cutoff_time = feed.get_previous_report_cutoff_time()
+            q_commented = updated.get_commented_question_ids(user, cutoff_time)
+            extend_question_list(
+                            q_commented,
+                            q_list,
+                            cutoff_time = cutoff_time,
+                            add_comment = True
+                        )
 
-                q_mentions_B = Q_set_B.filter(id__in = q_mentions_id)
-                q_mentions_B.cutoff_time = cutoff_time
-                extend_question_list(q_mentions_B, q_list, add_mention=True)
-        except EmailFeedSetting.DoesNotExist:
-            pass
+            q_mentions_id = set(
+                updated.get_mentioned_question_ids(user, cutoff_time)
+            )
+            q_mentions_A, q_mentions_B = updated.select(
+                        user,
+                        lambda question_id: question_id in q_mentions_id
+                    )
+            extend_question_list(
+                            q_mentions_A,
+                            q_list,
+                            cutoff_time = cutoff_time,
+                            add_mention = True
+                        )
+            extend_question_list(
+                            q_mentions_B,
+                            q_list,
+                            cutoff_time = cutoff_time,
+                            add_mention = True
+                        )
 
         if user.email_tag_filter_strategy == const.INCLUDE_INTERESTING:
-            extend_question_list(q_all_A, q_list)
-            extend_question_list(q_all_B, q_list)
-
-        extend_question_list(q_ask_A, q_list, limit=True)
-        extend_question_list(q_ask_B, q_list, limit=True)
+            extend_with_selection('q_all')
 
-        extend_question_list(q_ans_A, q_list, limit=True)
-        extend_question_list(q_ans_B, q_list, limit=True)
+        extend_with_selection('q_ask', limit = True)
+        extend_with_selection('q_ans', limit = True)
 
         if user.email_tag_filter_strategy == const.EXCLUDE_IGNORED:
-            extend_question_list(q_all_A, q_list, limit=True)
-            extend_question_list(q_all_B, q_list, limit=True)
+            extend_with_selection('q_all', limit = True)
 
-        ctype = ContentType.objects.get_for_model(Question)
-        EMAIL_UPDATE_ACTIVITY = const.TYPE_ACTIVITY_EMAIL_UPDATE_SENT
+        return q_list, reported_feeds
 
-        #up to this point we still don't know if emails about
-        #collected questions were sent recently
-        #the next loop examines activity record and decides
-        #for each question, whether it needs to be included or not
-        #into the report
+    def count_question_updates(self, user, q_list, updates):
+        """fills meta_data of each question with counts of
+        new edits, answers, etc since the last email to the user
+        about the question, marks questions that need to be skipped
+        because an email about them was sent recently enough
 
-        for q, meta_data in q_list.items():
-            #this loop edits meta_data for each question
-            #so that user will receive counts on new edits new answers, etc
-            #and marks questions that need to be skipped
-            #because an email about them was sent recently enough
+        returns list of tuples (email activity id or None, question)
+        for the questions to be reported
+        """
+        reported_questions = list()
 
-            #also it keeps a record of latest email activity per question per user
-            try:
-                #todo: is it possible to use content_object here, instead of
-                #content type and object_id pair?
-                update_info = Activity.objects.get(
-                                            user=user,
-                                            content_type=ctype,
-                                            object_id=q.id,
-                                            activity_type=EMAIL_UPDATE_ACTIVITY
-                                        )
-                emailed_at = update_info.active_at
-            except Activity.DoesNotExist:
-                update_info = Activity(
-                                        user=user, 
-                                        content_object=q, 
-                                        activity_type=EMAIL_UPDATE_ACTIVITY
-                                    )
-                emailed_at = datetime.datetime(1970, 1, 1)#long time ago
-            except Activity.MultipleObjectsReturned:
-                raise Exception(
-                                'server error - multiple question email activities '
-                                'found per user-question pair'
-                                )
+        for q, meta_data in q_list.items():
+            activity_id, emailed_at = updates.get_email_activity(user, q)
 
             cutoff_time = meta_data['cutoff_time']#cutoff time for the question
 
@@ -412,153 +862,224 @@ class Command(NoArgsCommand):
 
             #collect info on all sorts of news that happened after
             #the most recent emailing to the user about this question
-            q_rev = QuestionRevision.objects.filter(
-                                                question=q,
-                                                revised_at__gt=emailed_at
-                                            )
-
-            q_rev = q_rev.exclude(author=user)
+            q_rev = updates.get_question_revisions(user, q, emailed_at)
 
             #now update all sorts of metadata per question
             meta_data['q_rev'] = len(q_rev)
-            if len(q_rev) > 0 and q.added_at == q_rev[0].revised_at:
+            #latest of the new revisions is the first one - question is new
+            if len(q_rev) > 0 and q.added_at == max(q_rev)[1]:
                 meta_data['q_rev'] = 0
                 meta_data['new_q'] = True
             else:
                 meta_data['new_q'] = False
-                
-            new_ans = Answer.objects.filter(
-                                            question=q,
-                                            added_at__gt=emailed_at,
-                                            deleted=False,
-                                        )
-
-            new_ans = new_ans.exclude(author=user)
-            meta_data['new_ans'] = len(new_ans)
-            ans_rev = AnswerRevision.objects.filter(
-                                            answer__question = q,
-                                            answer__deleted = False,
-                                            revised_at__gt = emailed_at
-                                        )
-            ans_rev = ans_rev.exclude(author=user)
-            meta_data['ans_rev'] = len(ans_rev)
+
+            meta_data['new_ans'] = updates.count_answers(user, q, emailed_at)
+            meta_data['ans_rev'] = updates.count_answer_revisions(
+                                                                user,
+                                                                q,
+                                                                emailed_at
+                                                            )
 
             comments = meta_data.get('comments', 0)
             mentions = meta_data.get('mentions', 0)
 
-            #print meta_data
             #finally skip question if there are no news indeed
-            if len(q_rev) + len(new_ans) + len(ans_rev) + comments + mentions == 0:
+            if len(q_rev) + meta_data['new_ans'] + meta_data['ans_rev'] \
+                + comments + mentions == 0:
                 meta_data['skip'] = True
-                #print 'skipping'
             else:
                 meta_data['skip'] = False
-                #print 'not skipping'
-                update_info.active_at = datetime.datetime.now() 
-                if DEBUG_THIS_COMMAND == False:
-                    update_info.save() #save question email update activity 
-        #q_list is actually an ordered dictionary
-        #print 'user %s gets %d' % (user.username, len(q_list.keys()))
-        #todo: sort question list by update time
-        return q_list 
-
-    def send_email_alerts(self):
-        #does not change the database, only sends the email
-        #todo: move this to template
-        for user in User.objects.all():
-            #todo: q_list is a dictionary, not a list
-            q_list = self.get_updated_questions_for_user(user)
-            if len(q_list.keys()) == 0:
-                continue
-            num_q = 0
-            for question, meta_data in q_list.items():
-                if meta_data['skip']:
-                    del q_list[question]
-                else:
-                    num_q += 1
-            if num_q > 0:
-                url_prefix = askbot_settings.APP_URL
-                subject_line = get_update_subject_line(q_list)
-                #todo: send this to special log
-                #print 'have %d updated questions for %s' % (num_q, user.username)
-                text = ungettext('%(name)s, this is an update message header for %(num)d question', 
-                            '%(name)s, this is an update message header for %(num)d questions',num_q) \
-                                % {'num':num_q, 'name':user.username}
-
-                text += '<ul>'
-                items_added = 0
-                items_unreported = 0
-                for q, meta_data in q_list.items():
-                    act_list = []
-                    if meta_data['skip']:
-                        continue
-                    if items_added >= askbot_settings.MAX_ALERTS_PER_EMAIL:
-                        items_unreported = num_q - items_added #may be inaccurate actually, but it's ok
-                        
-                    else:
-                        items_added += 1
-                        if meta_data['new_q']:
-                            act_list.append(_('new question'))
-                        format_action_count('%(num)d rev', meta_data['q_rev'],act_list)
-                        format_action_count('%(num)d ans', meta_data['new_ans'],act_list)
-                        format_action_count('%(num)d ans rev',meta_data['ans_rev'],act_list)
-                        act_token = ', '.join(act_list)
-                        text += '<li><a href="%s?sort=latest">%s</a> <font color="#777777">(%s)</font></li>' \
-                                    % (url_prefix + q.get_absolute_url(), q.title, act_token)
-                text += '</ul>'
-                text += '<p></p>'
-                #if len(q_list.keys()) >= askbot_settings.MAX_ALERTS_PER_EMAIL:
-                #    text += _('There may be more questions updated since '
-                #                'you have logged in last time as this list is '
-                #                'abridged for your convinience. Please visit '
-                #                'the askbot and see what\'s new!<br>'
-                #              )
-
-                text += _(
-                            'Please visit the askbot and see what\'s new! '
-                            'Could you spread the word about it - '
-                            'can somebody you know help answering those questions or '
-                            'benefit from posting one?'
-                        )
+                reported_questions.append((activity_id, q))
 
-                feeds = EmailFeedSetting.objects.filter(
-                                                        subscriber=user,
-                                                    )
-                feed_freq = [feed.frequency for feed in feeds]
-                text += '<p></p>'
-                if 'd' in feed_freq:
-                    text += _('Your most frequent subscription setting is \'daily\' '
-                               'on selected questions. If you are receiving more than one '
-                               'email per day'
-                               'please tell about this issue to the askbot administrator.'
-                               )
-                elif 'w' in feed_freq:
-                    text += _('Your most frequent subscription setting is \'weekly\' '
-                               'if you are receiving this email more than once a week '
-                               'please report this issue to the askbot administrator.'
-                               )
-                text += ' '
-                text += _(
-                            'There is a chance that you may be receiving links seen '
-                            'before - due to a technicality that will eventually go away. '
+        return reported_questions
+
+    def record_alerts_sent(self, user, reported_feeds, reported_questions):
+        """marks feeds as reported and saves the time when
+        the user was emailed about the questions
+        """
+        if DEBUG_THIS_COMMAND == True:
+            return
+        now = datetime.datetime.now()
+        if reported_feeds:
+            EmailFeedSetting.objects.filter(
+                        id__in = [feed.id for feed in reported_feeds]
+                    ).update(reported_at = now)
+
+        activity_ids = list()
+        for activity_id, question in reported_questions:
+            if activity_id is None:
+                Activity(
+                    user = user,
+                    content_object = question,
+                    activity_type = const.TYPE_ACTIVITY_EMAIL_UPDATE_SENT,
+                    active_at = now
+                ).save()
+            else:
+                activity_ids.append(activity_id)
+        if activity_ids:
+            Activity.objects.filter(id__in = activity_ids).update(active_at = now)
+
+    def send_email_alerts(self, batch_size = 100, worker_count = 1):
+        feeds_by_user = self.get_feeds_by_user()
+        user_ids = feeds_by_user.keys()
+        user_ids.sort()
+        for start in xrange(0, len(user_ids), batch_size):
+            batch_ids = user_ids[start:start + batch_size]
+            users = User.objects.filter(id__in = batch_ids).order_by('id')
+            self.send_batch(users, feeds_by_user, worker_count)
+
+    def send_batch(self, users, feeds_by_user, worker_count):
+        """prepares and sends alerts to a batch of users"""
+        users = list(users)
+        updated = UpdatedQuestions(users, feeds_by_user)
+
+        selections = list()
+        question_ids = set()
+        for user in users:
+            user_feeds = feeds_by_user[user.id]
+            q_list, reported_feeds = self.get_updated_questions_for_user(
+                                                                user,
+                                                                user_feeds,
+                                                                updated
+                                                            )
+            selections.append((user, user_feeds, q_list, reported_feeds))
+            question_ids.update(q_list.keys())
+
+        #replace question ids with the questions
+        questions = Question.objects.in_bulk(list(question_ids))
+        for user, user_feeds, q_list, reported_feeds in selections:
+            for question_id in q_list.keys():
+                meta_data = q_list.pop(question_id)
+                if question_id in questions:
+                    q_list[questions[question_id]] = meta_data
+
+        updates = None
+        if question_ids:
+            updates = QuestionUpdates(
+                            question_ids,
+                            [user.id for user in users]
                         )
 
-                link = url_prefix + user.get_profile_url() + '?sort=email_subscriptions'
-                text += _(
-                    'go to %(email_settings_link)s to change '
-                    'frequency of email updates or '
-                    '%(admin_email)s administrator'
-                ) % {
-                    'email_settings_link': link,
-                    'admin_email': django_settings.ADMINS[0][1]
-                }
-                if DEBUG_THIS_COMMAND == True:
-                    recipient_email = django_settings.ADMINS[0][1]
-                else:
-                    recipient_email = user.email
+        digests = list()
+        quiet_users = list()
+        for user, user_feeds, q_list, reported_feeds in selections:
+            reported_questions = list()
+            if len(q_list.keys()) > 0:
+                reported_questions = self.count_question_updates(
+                                                            user,
+                                                            q_list,
+                                                            updates
+                                                        )
+            if reported_questions:
+                digest = self.make_digest(user, user_feeds, q_list)
+                digest.reported_feeds = reported_feeds
+                digest.reported_questions = reported_questions
+                digests.append(digest)
+            else:
+                quiet_users.append((user, reported_feeds))
+
+        for user, reported_feeds in quiet_users:
+            self.record_alerts_sent(user, reported_feeds, list())
+
+        #each message is recorded as soon as it is sent,
+        #messages that failed to send will be
+        #prepared again during the next run
+        send_digests(digests, worker_count, on_sent = self.record_digest_sent)
+
+    def record_digest_sent(self, digest):
+        self.record_alerts_sent(
+                        digest.user,
+                        digest.reported_feeds,
+                        digest.reported_questions
+                    )
+
+    def make_digest(self, user, user_feeds, q_list):
+        """returns :class:`Digest` with the message about
+        the questions in q_list, which are not marked to skip
+        """
+        #todo: move this to template
+        num_q = 0
+        for question, meta_data in q_list.items():
+            if meta_data['skip']:
+                del q_list[question]
+            else:
+                num_q += 1
+
+        url_prefix = askbot_settings.APP_URL
+        subject_line = get_update_subject_line(q_list)
+        #todo: send this to special log
+        #print 'have %d updated questions for %s' % (num_q, user.username)
+        text = ungettext('%(name)s, this is an update message header for %(num)d question', 
+                    '%(name)s, this is an update message header for %(num)d questions',num_q) \
+                        % {'num':num_q, 'name':user.username}
+
+        text += '<ul>'
+        items_added = 0
+        items_unreported = 0
+        for q, meta_data in q_list.items():
+            act_list = []
+            if meta_data['skip']:
+                continue
+            if items_added >= askbot_settings.MAX_ALERTS_PER_EMAIL:
+                items_unreported = num_q - items_added #may be inaccurate actually, but it's ok
+                
+            else:
+                items_added += 1
+                if meta_data['new_q']:
+                    act_list.append(_('new question'))
+                format_action_count('%(num)d rev', meta_data['q_rev'],act_list)
+                format_action_count('%(num)d ans', meta_data['new_ans'],act_list)
+                format_action_count('%(num)d ans rev',meta_data['ans_rev'],act_list)
+                act_token = ', '.join(act_list)
+                text += '<li><a href="%s?sort=latest">%s</a> <font color="#777777">(%s)</font></li>' \
+                            % (url_prefix + q.get_absolute_url(), q.title, act_token)
+        text += '</ul>'
+        text += '<p></p>'
+        #if len(q_list.keys()) >= askbot_settings.MAX_ALERTS_PER_EMAIL:
+        #    text += _('There may be more questions updated since '
+        #                'you have logged in last time as this list is '
+        #                'abridged for your convinience. Please visit '
+        #                'the askbot and see what\'s new!<br>'
+        #              )
+
+        text += _(
+                    'Please visit the askbot and see what\'s new! '
+                    'Could you spread the word about it - '
+                    'can somebody you know help answering those questions or '
+                    'benefit from posting one?'
+                )
 
-                mail.send_mail(
-                    subject_line = subject_line,
-                    body_text = text,
-                    recipient_list = [recipient_email]
+        feed_freq = [feed.frequency for feed in user_feeds]
+        text += '<p></p>'
+        if 'd' in feed_freq:
+            text += _('Your most frequent subscription setting is \'daily\' '
+                       'on selected questions. If you are receiving more than one '
+                       'email per day'
+                       'please tell about this issue to the askbot administrator.'
+                       )
+        elif 'w' in feed_freq:
+            text += _('Your most frequent subscription setting is \'weekly\' '
+                       'if you are receiving this email more than once a week '
+                       'please report this issue to the askbot administrator.'
+                       )
+        text += ' '
+        text += _(
+                    'There is a chance that you may be receiving links seen '
+                    'before - due to a technicality that will eventually go away. '
                 )
+
+        link = url_prefix + user.get_profile_url() + '?sort=email_subscriptions'
+        text += _(
+            'go to %(email_settings_link)s to change '
+            'frequency of email updates or '
+            '%(admin_email)s administrator'
+        ) % {
+            'email_settings_link': link,
+            'admin_email': django_settings.ADMINS[0][1]
+        }
+        if DEBUG_THIS_COMMAND == True:
+            recipient_email = django_settings.ADMINS[0][1]
+        else:
+            recipient_email = user.email
+
+        return Digest(user, subject_line, text, recipient_email)
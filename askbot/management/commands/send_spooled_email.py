@@ -0,0 +1,143 @@
+"""send_spooled_email management command
+to run type (on the command line:)
+
+python manage.py send_spooled_email
+
+sends messages stored in the directory ASKBOT_EMAIL_SPOOL_DIR,
+each batch of messages is sent over one connection to the mail server,
+which is reopened if the server disconnects, messages that could
+not be sent stay in the directory and are sent by the next run
+of the command
+"""
+import os
+import smtplib
+import time
+from optparse import make_option
+from django.core.management.base import BaseCommand, CommandError
+from askbot.utils import mail
+
+#messages claimed by a sender longer ago than this
+#number of seconds are considered abandoned
+CLAIM_TIMEOUT = 3600
+
+class Command(BaseCommand):
+    "The command object itself"
+
+    help = 'Sends messages stored in the email spool directory'
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size',
+            action = 'store',
+            type = 'int',
+            dest = 'batch_size',
+            default = 100,
+            help = 'number of messages sent over one connection'
+        ),
+    )
+
+    def handle(self, *args, **options):
+        if not mail.EMAIL_SPOOL_DIR:
+            raise CommandError('ASKBOT_EMAIL_SPOOL_DIR is not set')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be a positive number')
+
+        self.release_abandoned_messages()
+
+        sent_count = 0
+        failed_count = 0
+        message_paths = mail.get_spooled_message_paths()
+        batch_size = options['batch_size']
+        for start in xrange(0, len(message_paths), batch_size):
+            batch = list()
+            for message_path in message_paths[start:start + batch_size]:
+                claimed = mail.claim_spooled_message(message_path)
+                if claimed is not None:
+                    batch.append(claimed)
+            batch_sent_count = self.send_batch(batch)
+            sent_count += batch_sent_count
+            failed_count += len(batch) - batch_sent_count
+
+        print 'Sent %d messages' % sent_count
+        if failed_count:
+            print '%d messages could not be sent and stay in the spool' % failed_count
+
+    def send_batch(self, batch):
+        """sends messages over one connection, if the server
+        disconnects, the connection is reopened and the message
+        is sent again, if that fails too, the batch is stopped,
+        messages that were not sent are returned to the spool,
+        returns number of the sent messages
+        """
+        if len(batch) == 0:
+            return 0
+        sent_count = 0
+        unsent = list(batch)
+        connection = None
+        try:
+            try:
+                connection = mail.get_connection()
+            except Exception, error:
+                print 'Could not connect to the mail server: %s' % unicode(error)
+                return 0
+
+            reconnected = False
+            while unsent:
+                msg, claimed_path = unsent[0]
+                try:
+                    msg.connection = connection
+                    msg.send()
+                except smtplib.SMTPServerDisconnected, error:
+                    self.close_connection(connection)
+                    connection = None
+                    if reconnected:
+                        print 'Mail server disconnected: %s' % unicode(error)
+                        return sent_count
+                    reconnected = True
+                    try:
+                        connection = mail.get_connection()
+                    except Exception, error:
+                        print 'Could not reconnect to the mail server: %s' \
+                                                            % unicode(error)
+                        return sent_count
+                    continue
+                except Exception, error:
+                    print 'Could not send message: %s' % unicode(error)
+                    self.release_message(claimed_path)
+                    unsent.pop(0)
+                    continue
+                os.remove(claimed_path)
+                unsent.pop(0)
+                sent_count += 1
+                reconnected = False
+        finally:
+            for msg, claimed_path in unsent:
+                self.release_message(claimed_path)
+            if connection is not None:
+                self.close_connection(connection)
+        return sent_count
+
+    def close_connection(self, connection):
+        """closes connection, which may be already broken"""
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def release_message(self, claimed_path):
+        """returns the message to the spool"""
+        message_path = claimed_path[:-len(mail.CLAIMED_MESSAGE_EXTENSION)]
+        os.rename(claimed_path, message_path)
+
+    def release_abandoned_messages(self):
+        """returns to the spool messages claimed by
+        senders that were interrupted
+        """
+        claimed_paths = mail.get_spooled_message_paths(
+                                    extension = mail.CLAIMED_MESSAGE_EXTENSION
+                                )
+        now = time.time()
+        for claimed_path in claimed_paths:
+            try:
+                if now - os.path.getmtime(claimed_path) > CLAIM_TIMEOUT:
+                    self.release_message(claimed_path)
+            except OSError:
+                continue
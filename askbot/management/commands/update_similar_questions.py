@@ -0,0 +1,63 @@
+"""update_similar_questions management command
+to run type (on the command line:)
+
+python manage.py update_similar_questions
+
+recalculates similar questions shown on the question page,
+with --active-since-hours only the questions active
+during the given number of hours are processed,
+so the command can be run periodically, e.g. from cron
+"""
+import datetime
+import sys
+from optparse import make_option
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from askbot import models
+from askbot.utils import console
+
+BATCH_SIZE = 100
+
+class Command(BaseCommand):
+    "The command object itself"
+
+    help = 'Recalculates the similar questions'
+    option_list = BaseCommand.option_list + (
+        make_option('--active-since-hours',
+            action = 'store',
+            type = 'int',
+            dest = 'active_since_hours',
+            default = None,
+            help = 'only update questions active during this number of hours'
+        ),
+    )
+
+    def handle(self, *args, **options):
+        questions = models.Question.objects.filter(deleted = False)
+        hours = options['active_since_hours']
+        if hours is not None:
+            if hours < 1:
+                raise CommandError('--active-since-hours must be a positive number')
+            active_since = datetime.datetime.now() - datetime.timedelta(0, hours * 3600)
+            questions = questions.filter(last_activity_at__gte = active_since)
+
+        question_ids = list(questions.values_list('id', flat = True))
+        total_count = len(question_ids)
+        if total_count == 0:
+            print 'There are no questions to update'
+            return
+
+        sys.stdout.write('Updating similar questions: ')
+        for start in xrange(0, total_count, BATCH_SIZE):
+            batch_ids = question_ids[start:start + BATCH_SIZE]
+            self.update_questions(batch_ids)
+            progress = 100 * float(start + len(batch_ids)) / total_count
+            console.print_progress('%6.2f%%', progress)
+        print '%6.2f%%' % 100
+        print 'Updated similar questions of %d questions' % total_count
+
+    @transaction.commit_on_success
+    def update_questions(self, question_ids):
+        """updates one batch of questions in its own transaction"""
+        questions = models.Question.objects.filter(id__in = question_ids)
+        models.SimilarQuestion.objects.rebuild(questions)
@@ -0,0 +1,186 @@
+"""Cache of complete pages served to the anonymous visitors
+who do not send any cookies. Without a session,
+such pages are fully determined by the url, so they
+can be rendered once and served to all such visitors.
+
+Only the questions listing and the question pages are cached,
+listings requested with invalid search parameters are not.
+Cached pages are stored for ASKBOT_ANONYMOUS_PAGE_CACHE_TIMEOUT
+seconds (django setting, 0 - the default - disables the cache)
+and are dropped when posts are added, edited or voted.
+
+To enable the cache, add
+'askbot.middleware.anon_page_cache.AnonymousPageCacheMiddleware'
+to the MIDDLEWARE_CLASSES right before the ViewLogMiddleware,
+so that pages taken from the cache do not start a new session.
+"""
+import time
+from django.conf import settings as django_settings
+from django.core.cache import cache
+from django.db.models import signals as django_signals
+from django.http import HttpResponse
+from django.utils.hashcompat import md5_constructor
+from askbot.forms import AdvancedSearchForm
+from askbot.models import signals
+from askbot.models import Answer, Comment, Question, Vote
+from askbot.models.question import question_view_buffer
+from askbot.utils import functions
+from askbot.views.readers import questions as questions_view
+from askbot.views.readers import question as question_view
+
+PAGE_CACHE_TIMEOUT = getattr(
+                        django_settings,
+                        'ASKBOT_ANONYMOUS_PAGE_CACHE_TIMEOUT',
+                        0
+                    )
+LISTING_GENERATION_KEY = 'askbot-page-generation-listing'
+QUESTION_GENERATION_KEY = 'askbot-page-generation-question-%d'
+
+def get_generation(key):
+    """returns the generation token stored under the key,
+    a missing token is replaced with a new one, so that
+    pages stored under the token lost in the cache
+    are never matched again
+    """
+    generation = cache.get(key)
+    if generation is None:
+        generation = renew_generation(key)
+    return generation
+
+def renew_generation(key):
+    """stores a new generation token under the key,
+    which effectively drops all pages cached with the old one
+    """
+    generation = '%.6f' % time.time()
+    cache.set(key, generation, PAGE_CACHE_TIMEOUT * 10)
+    return generation
+
+def get_listing_cache_key(request, view_kwargs):
+    """key of the questions listing page,
+    made of the normalized search parameters,
+    or None if the parameters are not valid,
+    such pages are not cached
+    """
+    form = AdvancedSearchForm(request.GET)
+    if not form.is_valid():
+        return None
+    search_params = list()
+    for name, value in form.cleaned_data.items():
+        if not value:
+            continue
+        if isinstance(value, (set, list, tuple)):
+            value = sorted(value)
+        search_params.append((name, value))
+    search_params.sort()
+    key_data = repr((
+                    view_kwargs.get('category_name', ''),
+                    search_params,
+                    get_generation(LISTING_GENERATION_KEY)
+                ))
+    return 'askbot-page-listing-' + md5_constructor(key_data).hexdigest()
+
+def get_question_page_cache_key(request, view_kwargs):
+    """key of the question page, the path is included
+    because pages with the wrong slug are redirected
+    """
+    question_id = int(view_kwargs['id'])
+    key_data = repr((
+                    request.path,
+                    sorted(request.GET.items()),
+                    get_generation(QUESTION_GENERATION_KEY % question_id)
+                ))
+    return 'askbot-page-question-' + md5_constructor(key_data).hexdigest()
+
+def is_cacheable_request(request):
+    """True for anonymous, cookie-less non-ajax GET requests"""
+    if PAGE_CACHE_TIMEOUT == 0:
+        return False
+    return request.method == 'GET' \
+        and len(request.COOKIES) == 0 \
+        and not request.is_ajax()
+
+
+class AnonymousPageCacheMiddleware(object):
+    """serves cached pages to the visitors without cookies
+    and stores the pages rendered for them
+    """
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not is_cacheable_request(request):
+            return None
+
+        if view_func == questions_view:
+            key = get_listing_cache_key(request, view_kwargs)
+        elif view_func == question_view:
+            key = get_question_page_cache_key(request, view_kwargs)
+        else:
+            return None
+        if key is None:
+            return None
+
+        cached_page = cache.get(key)
+        if cached_page is None:
+            request.askbot_page_cache_key = key
+            return None
+
+        if view_func == question_view \
+            and functions.not_a_robot_request(request):
+            #views are still counted
+            question_view_buffer.add(int(view_kwargs['id']), 1)
+            question_view_buffer.flush_if_due()
+
+        content, content_type = cached_page
+        return HttpResponse(content, mimetype = content_type)
+
+    def process_response(self, request, response):
+        key = getattr(request, 'askbot_page_cache_key', None)
+        if key and response.status_code == 200:
+            cached_page = (response.content, response['Content-Type'])
+            cache.set(key, cached_page, PAGE_CACHE_TIMEOUT)
+        return response
+
+
+def get_question_id(post):
+    """returns id of the question to which the post belongs
+    without loading the question, or None if the parent
+    of the comment is already deleted
+    """
+    if isinstance(post, Question):
+        return post.id
+    elif isinstance(post, Answer):
+        return post.question_id
+    elif isinstance(post, Comment) and post.content_object is not None:
+        return get_question_id(post.content_object)
+    return None
+
+def drop_cached_pages(post = None):
+    """drops cached listings and, if post is given,
+    cached pages of the question to which the post belongs
+    """
+    if PAGE_CACHE_TIMEOUT == 0:
+        return
+    renew_generation(LISTING_GENERATION_KEY)
+    if post is not None:
+        question_id = get_question_id(post)
+        if question_id is not None:
+            renew_generation(QUESTION_GENERATION_KEY % question_id)
+
+def drop_pages_of_updated_post(post, **kwargs):
+    """called upon signal post_updated"""
+    drop_cached_pages(post)
+
+def drop_pages_of_changed_post(instance, **kwargs):
+    """called when post is saved or deleted"""
+    drop_cached_pages(instance)
+
+def drop_pages_of_voted_post(instance, **kwargs):
+    """called when vote is saved or deleted"""
+    drop_cached_pages(instance.content_object)
+
+signals.post_updated.connect(drop_pages_of_updated_post)
+django_signals.post_save.connect(drop_pages_of_changed_post, sender = Question)
+django_signals.post_save.connect(drop_pages_of_changed_post, sender = Answer)
+django_signals.post_delete.connect(drop_pages_of_changed_post, sender = Question)
+django_signals.post_delete.connect(drop_pages_of_changed_post, sender = Answer)
+django_signals.post_delete.connect(drop_pages_of_changed_post, sender = Comment)
+django_signals.post_save.connect(drop_pages_of_voted_post, sender = Vote)
+django_signals.post_delete.connect(drop_pages_of_voted_post, sender = Vote)
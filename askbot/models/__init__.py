@@ -2,6 +2,7 @@ import logging
 import re
 import hashlib
 import datetime
+import uuid
 import urllib
 from django.core.urlresolvers import reverse, NoReverseMatch
 from django.db.models import signals as django_signals
@@ -21,9 +22,11 @@ from askbot import const
 from askbot.conf import settings as askbot_settings
 from askbot.models.question import Question, QuestionRevision
 from askbot.models.question import QuestionView, AnonymousQuestion
-from askbot.models.question import FavoriteQuestion
+from askbot.models.question import FavoriteQuestion, SimilarQuestion
+from askbot.models.question import bump_content_generation
 from askbot.models.answer import Answer, AnonymousAnswer, AnswerRevision
-from askbot.models.tag import Tag, MarkedTag
+from askbot.models.tag import Tag, MarkedTag, TagCooccurrence
+from askbot.models.tag import invalidate_user_tag_filter, update_tag_set_version
 from askbot.models.meta import Vote, Comment
 from askbot.models.user import EmailFeedSetting, ActivityAuditStatus, Activity
 from askbot.models import signals
@@ -33,12 +36,21 @@ from askbot.models.repute import BadgeData, Award, Repute
 from askbot import auth
 from askbot.utils.decorators import auto_now_timestamp
 from askbot.utils.slug import slugify
-from askbot.utils.diff import textDiff as htmldiff
 from askbot.utils import mail
+from askbot.utils import deferred
+from askbot.utils.buffers import FlushingBuffer
 from askbot import startup_procedures
 
 startup_procedures.run()
 
+#number of seconds during which last_seen timestamps
+#of the same day visits are kept in memory, 0 - save immediately
+USER_VISIT_FLUSH_INTERVAL = getattr(
+                                django_settings,
+                                'ASKBOT_USER_VISIT_FLUSH_INTERVAL',
+                                0
+                            )
+
 def get_model(model_name):
     return models.get_model('askbot', model_name)
 
@@ -900,6 +912,7 @@ def user_mark_tags(self, tagnames, wildcards, reason = None, action = None):
             marked_ts.update(reason=reason)
             cleaned_tagnames = tagnames
 
+    invalidate_user_tag_filter(self)
     return cleaned_tagnames, cleaned_wildcards
 
 @auto_now_timestamp
@@ -1011,6 +1024,10 @@ def user_delete_question(
             tag.used_count = tag.used_count - 1 
         tag.save()
 
+    TagCooccurrence.objects.update_question_tags(
+        previous_tag_ids = question.tags.values_list('id', flat = True)
+    )
+
     signals.delete_question_or_answer.send(
         sender = question.__class__,
         instance = question,
@@ -1093,6 +1110,10 @@ def user_restore_post(
                     tag.deleted_by = None
                     tag.deleted_at = None 
                     tag.save()
+            TagCooccurrence.objects.update_question_tags(
+                tag_ids = post.tags.values_list('id', flat = True)
+            )
+        bump_content_generation()
     else:
         raise NotImplementedError()
 
@@ -1724,6 +1745,19 @@ def user_increment_response_count(user):
     """
     user.new_response_count += 1
 
+def increment_response_counts(users):
+    """increment response counters of the users
+    by one with a single UPDATE statement,
+    the user objects themselves are not modified
+    """
+    user_ids = set([user.id for user in users])
+    if user_ids:
+        User.objects.filter(
+                    id__in = list(user_ids)
+                ).update(
+                    new_response_count = models.F('new_response_count') + 1
+                )
+
 def user_decrement_response_count(user, amount=1):
     """decrement response count for the user 
     by one, log critical error if count would go below zero
@@ -1788,6 +1822,7 @@ def user_update_wildcard_tag_selections(
     self.interesting_tags = ' '.join(interesting)
     self.ignored_tags = ' '.join(ignored)
     self.save()
+    invalidate_user_tag_filter(self)
     return new_tags
 
 
@@ -1891,27 +1926,22 @@ User.add_to_class(
     )
 
 #todo: move this to askbot/utils ??
-def format_instant_notification_email(
-                                        to_user = None,
+def get_instant_notification_post_data(
                                         from_user = None,
                                         post = None,
                                         update_type = None,
-                                        template = None,
                                     ):
     """
-    returns text of the instant notification body
-    and subject line
+    returns the subject line and the dictionary of
+    the template variables of the instant notification,
+    which are the same for all recipients of the update
 
-    that is built when post is updated
     only update_types in const.RESPONSE_ACTIVITY_TYPE_MAP_FOR_TEMPLATES
     are supported
     """
 
     site_url = askbot_settings.APP_URL
     origin_post = post.get_origin_post()
-    #todo: create a better method to access "sub-urls" in user views
-    user_subscriptions_url = site_url + to_user.get_absolute_url() + \
-                            '?sort=email_subscriptions'
 
     if update_type == 'question_comment':
         assert(isinstance(post, Comment))
@@ -1952,9 +1982,8 @@ def format_instant_notification_email(
         assert('comment' not in update_type)
         revisions = post.revisions.all()[:2]
         assert(len(revisions) == 2)
-        content_preview = htmldiff(
-                            revisions[1].as_html(),
-                            revisions[0].as_html(),
+        content_preview = revisions[0].get_diff_html(
+                            revisions[1],
                             ins_start = '<b><u style="background-color:#cfc">',
                             ins_end = '</u></b>',
                             del_start = '<del style="color:#600;background-color:#fcc">',
@@ -1980,14 +2009,92 @@ def format_instant_notification_email(
 
     update_data = {
         'update_author_name': from_user.username,
-        'receiving_user_name': to_user.username,
         'content_preview': content_preview,#post.get_snippet()
         'update_type': update_type,
         'post_url': site_url + post.get_absolute_url(),
         'origin_post_title': origin_post.title,
-        'user_subscriptions_url': user_subscriptions_url,
     }
     subject_line = mail.prefix_the_subject_line(subject_line)
+    return subject_line, update_data
+
+def get_recipient_data(to_user):
+    """returns template variables of the instant
+    notification that are specific to the recipient
+    """
+    #todo: create a better method to access "sub-urls" in user views
+    user_subscriptions_url = askbot_settings.APP_URL + \
+                            to_user.get_absolute_url() + \
+                            '?sort=email_subscriptions'
+    return {
+        'receiving_user_name': to_user.username,
+        'user_subscriptions_url': user_subscriptions_url,
+    }
+
+
+class InstantNotificationFormatter(object):
+    """formats instant notifications about one update
+    for many recipients - the diff, the content preview
+    and the template are calculated and rendered once,
+    with placeholders in place of the recipient data,
+    which are then replaced for each recipient
+    """
+    RECIPIENT_FIELDS = ('receiving_user_name', 'user_subscriptions_url')
+
+    def __init__(
+                self,
+                from_user = None,
+                post = None,
+                update_type = None,
+                template = None
+            ):
+        self.subject_line, update_data = get_instant_notification_post_data(
+                                                from_user = from_user,
+                                                post = post,
+                                                update_type = update_type
+                                            )
+        #placeholders are unique, so that they
+        #cannot be matched by the content of the post
+        token = uuid.uuid4().hex
+        self.placeholders = dict()
+        for field in self.RECIPIENT_FIELDS:
+            placeholder = '%s:%s:%s' % (token, field, token)
+            self.placeholders[field] = placeholder
+            update_data[field] = placeholder
+        self.body_text = template.render(Context(update_data))
+
+    def format(self, to_user):
+        """returns subject line and body of the message to the user"""
+        body_text = self.body_text
+        recipient_data = get_recipient_data(to_user)
+        for field, placeholder in self.placeholders.items():
+            body_text = body_text.replace(placeholder, recipient_data[field])
+        return self.subject_line, body_text
+
+
+def format_instant_notification_email(
+                                        to_user = None,
+                                        from_user = None,
+                                        post = None,
+                                        update_type = None,
+                                        template = None,
+                                    ):
+    """
+    returns text of the instant notification body
+    and subject line
+
+    that is built when post is updated
+    only update_types in const.RESPONSE_ACTIVITY_TYPE_MAP_FOR_TEMPLATES
+    are supported
+
+    to notify many users about the same update
+    use :class:`InstantNotificationFormatter`
+    """
+    subject_line, update_data = get_instant_notification_post_data(
+                                            from_user = from_user,
+                                            post = post,
+                                            update_type = update_type
+                                        )
+    update_data.update(get_recipient_data(to_user))
     return subject_line, template.render(Context(update_data))
 
 #todo: action
@@ -2016,25 +2123,31 @@ def send_instant_notifications_about_activity_in_post(
     update_type_map = const.RESPONSE_ACTIVITY_TYPE_MAP_FOR_TEMPLATES
     update_type = update_type_map[update_activity.activity_type]
 
-    origin_post = post.get_origin_post()
-    for user in recipients:
+    if len(recipients) == 0:
+        return
 
-        subject_line, body_text = format_instant_notification_email(
-                        to_user = user,
+    #parts of the message that do not depend on the recipient
+    #are prepared once for the whole update
+    formatter = InstantNotificationFormatter(
                         from_user = update_activity.user,
                         post = post,
                         update_type = update_type,
-                        template = template,
+                        template = template
                     )
-        #todo: this could be packaged as an "action" - a bundle
-        #of executive function with the activity log recording
-        mail.send_mail(
-            subject_line = subject_line,
-            body_text = body_text,
-            recipient_list = [user.email],
-            related_object = origin_post,
-            activity_type = const.TYPE_ACTIVITY_EMAIL_UPDATE_SENT
+    messages = list()
+    for user in recipients:
+        subject_line, body_text = formatter.format(user)
+        messages.append(
+            mail.make_message(
+                subject_line = subject_line,
+                body_text = body_text,
+                recipient_list = [user.email]
+            )
         )
+    #all messages go over one connection to the mail server
+    #todo: this could be packaged as an "action" - a bundle
+    #of executive function with the activity log recording
+    mail.send_messages(messages)
 
 
 #todo: move to utils
@@ -2064,7 +2177,8 @@ def record_post_update_activity(
 
     from askbot.tasks import record_post_update_task
 
-    record_post_update_task.delay(
+    deferred.defer(
+        record_post_update_task,
         post_id = post.id,
         post_content_type_id = ContentType.objects.get_for_model(post).id,
         newly_mentioned_user_id_list = [u.id for u in newly_mentioned_users],
@@ -2091,18 +2205,32 @@ def record_award_event(instance, created, **kwargs):
         activity.save()
         activity.add_recipients([instance.user])
 
+        #counters are incremented in the database, because
+        #the badge and the user objects may be held in memory
+        #for a while, e.g. by the badge engine
         instance.badge.awarded_count += 1
-        instance.badge.save()
+        BadgeData.objects.filter(
+                    id = instance.badge.id
+                ).update(
+                    awarded_count = models.F('awarded_count') + 1
+                )
 
         badge = get_badge(instance.badge.slug)
 
-        if badge.level == const.GOLD_BADGE:
-            instance.user.gold += 1
-        if badge.level == const.SILVER_BADGE:
-            instance.user.silver += 1
-        if badge.level == const.BRONZE_BADGE:
-            instance.user.bronze += 1
-        instance.user.save()
+        level_fields = {
+            const.GOLD_BADGE: 'gold',
+            const.SILVER_BADGE: 'silver',
+            const.BRONZE_BADGE: 'bronze',
+        }
+        field = level_fields.get(badge.level)
+        if field is not None:
+            user = instance.user
+            setattr(user, field, getattr(user, field) + 1)
+            User.objects.filter(
+                        id = user.id
+                    ).update(
+                        **{field: models.F(field) + 1}
+                    )
 
 def notify_award_message(instance, created, **kwargs):
     """
@@ -2141,14 +2269,56 @@ def record_answer_accepted(instance, created, **kwargs):
                                 )
         activity.add_recipients(recipients)
 
+def flush_user_visits(visits):
+    """saves buffered last_seen timestamps
+    visits is a dictionary {user_id: timestamp}
+
+    timestamps are rounded down to the minute, so that
+    a single UPDATE statement covers all users seen
+    within the same minute
+    """
+    user_ids_by_minute = dict()
+    for user_id, timestamp in visits.items():
+        minute = timestamp.replace(second = 0, microsecond = 0)
+        user_ids_by_minute.setdefault(minute, list()).append(user_id)
+
+    for minute, user_ids in user_ids_by_minute.items():
+        #last_seen might have been already moved forward
+        #by a visit on the next day, which is saved immediately
+        User.objects.filter(
+                    id__in = user_ids,
+                    last_seen__lt = minute
+                ).update(last_seen = minute)
+
+user_visit_buffer = FlushingBuffer(
+                        flush_function = flush_user_visits,
+                        merge_function = max,
+                        interval = USER_VISIT_FLUSH_INTERVAL,
+                        background = True
+                    )
+
 def record_user_visit(user, timestamp, **kwargs):
     """
     when user visits any pages, we update the last_seen and
     consecutive_days_visit_count
+
+    the visit counter and the badges are only looked at
+    when calendar day of the visit changes, other visits
+    just move last_seen forward - with a single column update,
+    or, if the ASKBOT_USER_VISIT_FLUSH_INTERVAL setting
+    is set - via the buffer flushed in bulk
     """
     prev_last_seen = user.last_seen
     user.last_seen = timestamp
-    if (user.last_seen - prev_last_seen).days == 1:
+    if timestamp.date() == prev_last_seen.date():
+        if USER_VISIT_FLUSH_INTERVAL:
+            user_visit_buffer.add(user.id, timestamp)
+            user_visit_buffer.flush_if_due()
+        else:
+            User.objects.filter(id = user.id).update(last_seen = timestamp)
+        return
+
+    if (timestamp.date() - prev_last_seen.date()).days == 1:
         user.consecutive_days_visit_count += 1
         award_badges_signal.send(None,
             event = 'site_visit',
@@ -2156,7 +2326,10 @@ def record_user_visit(user, timestamp, **kwargs):
             context_object = user,
             timestamp = timestamp
         )
-    user.save()
+    User.objects.filter(id = user.id).update(
+                last_seen = timestamp,
+                consecutive_days_visit_count = user.consecutive_days_visit_count
+            )
 
 
 def record_vote(instance, created, **kwargs):
@@ -2328,6 +2501,108 @@ def post_stored_anonymous_content(
             for aa in aa_list:
                 aa.publish(user)
 
+def invalidate_cached_post_fragments(post):
+    """drops cached rendered fragments of the post,
+    for comments - fragments of the parent post
+    """
+    from askbot.skins.loaders import invalidate_post_fragments
+    if isinstance(post, Comment):
+        post = post.content_object
+    if post is None:#parent post is already deleted
+        return
+    invalidate_post_fragments(post)
+
+def invalidate_fragments_of_updated_post(post, **kwargs):
+    """called upon signal post_updated"""
+    invalidate_cached_post_fragments(post)
+
+def invalidate_fragments_of_changed_post(instance, **kwargs):
+    """called when post is saved without post_updated signal,
+    e.g. accepted as best or deleted, or when comment is deleted
+    """
+    invalidate_cached_post_fragments(instance)
+
+def invalidate_fragments_of_voted_post(instance, **kwargs):
+    """called when vote is saved or deleted"""
+    invalidate_cached_post_fragments(instance.content_object)
+
+def update_search_index(post, **kwargs):
+    """called when question or answer is saved,
+    deleted or retagged and with signal tags_updated
+    """
+    from askbot.search.backends import get_search_backend
+    if isinstance(post, Answer):
+        post = post.question
+    get_search_backend().update_question(post)
+
+def update_search_index_for_question(question, **kwargs):
+    """called upon signal tags_updated"""
+    update_search_index(question)
+
+def update_search_index_for_deleted_answer(instance, **kwargs):
+    """called when answer is marked as deleted"""
+    update_search_index(instance)
+
+def remove_question_from_search_index(instance, **kwargs):
+    """called when question is deleted from the database"""
+    from askbot.search.backends import get_search_backend
+    get_search_backend().remove_question(instance.id)
+
+def update_tag_cooccurrences_for_removed_question(instance, **kwargs):
+    """called before question is deleted from the database,
+    counts of deleted questions were updated when they
+    were marked as deleted
+    """
+    if instance.deleted == False:
+        TagCooccurrence.objects.update_question_tags(
+            previous_tag_ids = instance.tags.values_list('id', flat = True)
+        )
+
+def update_similar_questions(question, **kwargs):
+    """called upon signal tags_updated, similar questions
+    are recalculated off the request path
+    """
+    from askbot.tasks import update_similar_questions_task
+    deferred.defer(update_similar_questions_task, question_id = question.id)
+
+def update_similar_questions_for_deleted_question(instance, **kwargs):
+    """called when question is marked as deleted"""
+    update_similar_questions(instance)
+
+def record_similar_question_links(instance, **kwargs):
+    """called before question is deleted from the database,
+    remembers the questions listing it as similar
+    """
+    instance._listing_question_ids = list(
+        SimilarQuestion.objects.filter(
+                        similar_question = instance
+                    ).values_list('question', flat = True)
+    )
+
+def backfill_similar_questions(instance, **kwargs):
+    """called when question is deleted from the database"""
+    question_ids = getattr(instance, '_listing_question_ids', None)
+    if question_ids:
+        from askbot.tasks import backfill_similar_questions_task
+        deferred.defer(
+            backfill_similar_questions_task,
+            question_ids = question_ids
+        )
+
+def record_content_changed(**kwargs):
+    """called when questions or answers are added, edited,
+    retagged or deleted, outdates the cached search results
+    """
+    bump_content_generation()
+
+def record_tag_added(instance, created, **kwargs):
+    """new tag may match wildcards of the cached tag filters"""
+    if created:
+        update_tag_set_version()
+
+def record_tag_removed(instance, **kwargs):
+    update_tag_set_version()
+
 def set_user_has_custom_avatar_flag(instance, created, **kwargs):
     instance.user.update_has_custom_avatar()
 
@@ -2380,6 +2655,69 @@ signals.post_updated.connect(
                        )
 signals.site_visited.connect(record_user_visit)
 
+#cached fragments of the question page
+signals.post_updated.connect(invalidate_fragments_of_updated_post)
+django_signals.post_save.connect(
+                        invalidate_fragments_of_changed_post,
+                        sender=Question
+                    )
+django_signals.post_save.connect(
+                        invalidate_fragments_of_changed_post,
+                        sender=Answer
+                    )
+django_signals.post_delete.connect(
+                        invalidate_fragments_of_changed_post,
+                        sender=Comment
+                    )
+django_signals.post_save.connect(invalidate_fragments_of_voted_post, sender=Vote)
+django_signals.post_delete.connect(invalidate_fragments_of_voted_post, sender=Vote)
+
+#full text search index
+signals.post_updated.connect(update_search_index, sender=Question)
+signals.post_updated.connect(update_search_index, sender=Answer)
+signals.tags_updated.connect(update_search_index_for_question)
+signals.delete_question_or_answer.connect(
+                        update_search_index_for_deleted_answer,
+                        sender=Answer
+                    )
+django_signals.post_delete.connect(
+                        remove_question_from_search_index,
+                        sender=Question
+                    )
+
+#counts of the tags used together
+django_signals.pre_delete.connect(
+                        update_tag_cooccurrences_for_removed_question,
+                        sender=Question
+                    )
+
+#precalculated similar questions
+signals.tags_updated.connect(update_similar_questions)
+signals.delete_question_or_answer.connect(
+                        update_similar_questions_for_deleted_question,
+                        sender=Question
+                    )
+django_signals.pre_delete.connect(
+                        record_similar_question_links,
+                        sender=Question
+                    )
+django_signals.post_delete.connect(
+                        backfill_similar_questions,
+                        sender=Question
+                    )
+
+#cached search results
+signals.post_updated.connect(record_content_changed, sender=Question)
+signals.post_updated.connect(record_content_changed, sender=Answer)
+signals.tags_updated.connect(record_content_changed)
+signals.delete_question_or_answer.connect(record_content_changed)
+django_signals.post_delete.connect(record_content_changed, sender=Question)
+django_signals.post_delete.connect(record_content_changed, sender=Answer)
+
+#cached tag filters of the users
+django_signals.post_save.connect(record_tag_added, sender=Tag)
+django_signals.post_delete.connect(record_tag_removed, sender=Tag)
+
 #todo: wtf??? what is x=x about?
 
 Question = Question
@@ -2409,6 +2747,7 @@ __all__ = [
         'QuestionRevision',
         'QuestionView',
         'FavoriteQuestion',
+        'SimilarQuestion',
         'AnonymousQuestion',
 
         'Answer',
@@ -2419,6 +2758,7 @@ __all__ = [
         'Comment',
         'Vote',
         'MarkedTag',
+        'TagCooccurrence',
 
         'BadgeData',
         'Award',
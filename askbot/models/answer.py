@@ -13,7 +13,6 @@ from askbot.models import content
 from askbot import const
 from askbot.utils.slug import slugify
 from askbot.utils import markup
-from askbot.utils.html import sanitize_html
 
 class AnswerManager(models.Manager):
     def create_new(
@@ -230,11 +229,15 @@ class Answer(content.Content, DeletableContent):
         return list(recipients)
 
     def get_user_vote(self, user):
+        """returns vote of the user for the answer or None,
+        to load votes for many posts at once use
+        Vote.objects.get_votes_for_posts()
+        """
         if user.is_anonymous():
             return None
 
-        votes = self.votes.filter(user=user)
-        if votes and votes.count() > 0:
+        votes = list(self.votes.filter(user=user)[:1])
+        if votes:
             return votes[0]
         else:
             return None
@@ -265,8 +268,7 @@ class AnswerRevision(ContentRevision):
         return self.answer.question.title
 
     def as_html(self):
-        markdowner = markup.get_parser()
-        return sanitize_html(markdowner.convert(self.text))
+        return markup.markdown_to_html(self.text)
 
     class Meta(ContentRevision.Meta):
         db_table = u'answer_revision'
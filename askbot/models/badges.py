@@ -16,20 +16,101 @@ adde it to BADGES dictionary, register with event in EVENTS_TO_BADGES
 and make sure that a signal `award_badges_signal` is sent with the
 corresponding event name, actor (user object), context_object and optionally
 - timestamp
+
+Badges that implement method get_deserved_awards can also
+be recomputed for the whole database at once with the
+management command recompute_badges.
+
+By default badges are considered right when the signal is sent.
+If django setting ASKBOT_BADGE_EVENT_INTERVAL is set, events are
+queued by the :class:`BadgeEngine` and evaluated in batches by a
+background thread every that many seconds, with the BadgeData records
+and the single-award badges of the users held in the process memory.
+Events pending when the process stops are lost.
 """
 import datetime
+import logging
+import threading
+import time
 from django.template.defaultfilters import slugify
 from django.contrib.contenttypes.models import ContentType
+from django.contrib.auth.models import User
+from django.db.models import Count, Max, F
 from django.utils.translation import ugettext as _
 from django.dispatch import Signal
+from django.conf import settings as django_settings
+from django.db import transaction
 from askbot.models.repute import BadgeData, Award
 from askbot.models.user import Activity
-from askbot.models.meta import Comment
+from askbot.models.meta import Comment, Vote
+from askbot.models.question import Question
 from askbot.models.question import FavoriteQuestion as Fave#name collision
+from askbot.models.answer import Answer
+from askbot.models.tag import Tag
 from askbot import const
 from askbot.conf import settings as askbot_settings
 from askbot.utils.decorators import auto_now_timestamp
 
+#seconds between evaluations of the queued badge events,
+#None - evaluate badges right when the event happens
+BADGE_EVENT_INTERVAL = getattr(
+                        django_settings,
+                        'ASKBOT_BADGE_EVENT_INTERVAL',
+                        None
+                    )
+
+def get_content_type_id(model):
+    return ContentType.objects.get_for_model(model).id
+
+def get_object_awards(queryset, user_field):
+    """returns list of tuples (user id, content type id, object id)
+    awarding the user in user_field for each object of the queryset
+    """
+    content_type_id = get_content_type_id(queryset.model)
+    rows = queryset.values_list(user_field, 'id')
+    return [(user_id, content_type_id, obj_id) for user_id, obj_id in rows]
+
+def get_counted_awards(queryset, user_field, min_count):
+    """returns list of tuples (user id, content type id, object id)
+    for the users having at least min_count objects in the queryset,
+    with a single aggregate query, awards are given
+    for the last object of each user
+    """
+    content_type_id = get_content_type_id(queryset.model)
+    rows = queryset.order_by().values(
+                            user_field
+                        ).annotate(
+                            object_count = Count('id'),
+                            last_id = Max('id')
+                        ).filter(
+                            object_count__gte = min_count
+                        )
+    return [
+        (row[user_field], content_type_id, row['last_id']) for row in rows
+    ]
+
+def get_counted_generic_awards(queryset, user_field, min_count):
+    """same as :func:`get_counted_awards`, but the awards
+    are given for the objects referred to by the generic
+    foreign key of the last object, e.g. the voted post
+    """
+    awards = get_counted_awards(queryset, user_field, min_count)
+    last_ids = [obj_id for user_id, content_type_id, obj_id in awards]
+    generic_awards = list()
+    for start in xrange(0, len(last_ids), 500):
+        generic_awards.extend(
+            queryset.model.objects.filter(
+                                    id__in = last_ids[start:start + 500]
+                                ).values_list(
+                                    user_field, 'content_type', 'object_id'
+                                )
+        )
+    return generic_awards
+
+def get_post_model(post_type):
+    return {'question': Question, 'answer': Answer}[post_type]
+
+
 class Badge(object):
     """base class for the badges
 
@@ -55,8 +136,12 @@ class Badge(object):
         self.description = description
         self.multiple = multiple
         self.css_class = const.BADGE_CSS_CLASSES[self.level]
+        #:class:`BadgeEngine` evaluating the badge, if any
+        self.engine = None
 
     def get_stored_data(self):
+        if self.engine is not None:
+            return self.engine.get_badge_data(self.key)
         data, created = BadgeData.objects.get_or_create(slug = self.key)
         return data
 
@@ -87,7 +172,10 @@ class Badge(object):
     def award(self, recipient = None, context_object = None, timestamp = None):
         """do award, the recipient was proven to deserve"""
 
-        if self.multiple == False:
+        if self.engine is not None:
+            if self.engine.has_award(self, recipient, context_object):
+                return False
+        elif self.multiple == False:
             if recipient.badges.filter(slug = self.key).count() != 0:
                 return False
         else:
@@ -110,6 +198,8 @@ class Badge(object):
                     content_object = context_object
                 )
         award.save()#note: there are signals that listen to saving the Award
+        if self.engine is not None:
+            self.engine.record_award(self, recipient, context_object)
         return True
 
     def consider_award(self, actor = None,
@@ -123,6 +213,13 @@ class Badge(object):
         """
         return self.award(actor, context_object, timestamp)
 
+    def get_deserved_awards(self):
+        """returns list of tuples (user id, content type id, object id)
+        of the awards deserved according to the current data,
+        or None if the badge can be awarded only upon the events
+        """
+        return None
+
 class Disciplined(Badge):
     def __init__(self):
         description = _(
@@ -145,6 +242,17 @@ class Disciplined(Badge):
             askbot_settings.DISCIPLINED_BADGE_MIN_UPVOTES:
             return self.award(actor, context_object, timestamp)
 
+    def get_deserved_awards(self):
+        awards = list()
+        for model in (Question, Answer):
+            posts = model.objects.filter(
+                        deleted = True,
+                        deleted_by = F('author'),
+                        score__gte = askbot_settings.DISCIPLINED_BADGE_MIN_UPVOTES
+                    )
+            awards.extend(get_object_awards(posts, 'author'))
+        return awards
+
 class PeerPressure(Badge):
     def __init__(self):
         description = _(
@@ -168,6 +276,18 @@ class PeerPressure(Badge):
             return self.award(actor, context_object, timestamp)
         return False
 
+    def get_deserved_awards(self):
+        max_score = -1 * askbot_settings.PEER_PRESSURE_BADGE_MIN_DOWNVOTES
+        awards = list()
+        for model in (Question, Answer):
+            posts = model.objects.filter(
+                        deleted = True,
+                        deleted_by = F('author'),
+                        score__lte = max_score
+                    )
+            awards.extend(get_object_awards(posts, 'author'))
+        return awards
+
 class Teacher(Badge):
     def __init__(self):
         description = _(
@@ -190,10 +310,16 @@ class Teacher(Badge):
             return self.award(context_object.author, context_object, timestamp)
         return False
 
+    def get_deserved_awards(self):
+        answers = Answer.objects.filter(
+                        score__gte = askbot_settings.TEACHER_BADGE_MIN_UPVOTES
+                    )
+        return get_counted_awards(answers, 'author', 1)
+
 class FirstVote(Badge):
     """this badge is not awarded directly, but through
     Supporter and Critic, which must provide
-    * key, name and description properties through __new__ call
+    * key, name, description and vote properties through __new__ call
     """
     def __init__(self):
         super(FirstVote, self).__init__(
@@ -210,10 +336,15 @@ class FirstVote(Badge):
             return False
         return self.award(actor, context_object, timestamp)
 
+    def get_deserved_awards(self):
+        votes = Vote.objects.filter(vote = self.vote)
+        return get_counted_generic_awards(votes, 'user', 1)
+
 class Supporter(FirstVote):
     """first upvote"""
     def __new__(cls):
         self = super(Supporter, cls).__new__(cls)
+        self.vote = Vote.VOTE_UP
         self.key = 'supporter'
         self.name = _('Supporter')
         self.description = _('First upvote')
@@ -223,6 +354,7 @@ class Critic(FirstVote):
     """like supporter, but for downvote"""
     def __new__(cls):
         self = super(Critic, cls).__new__(cls)
+        self.vote = Vote.VOTE_DOWN
         self.key = 'critic'
         self.name = _('Critic')
         self.description = _('First downvote')
@@ -244,9 +376,16 @@ class CivicDuty(Badge):
             context_object = None, timestamp = None):
         if context_object.post_type not in ('question', 'answer'):
             return False
-        if actor.votes.count() == askbot_settings.CIVIC_DUTY_BADGE_MIN_VOTES:
+        if actor.votes.count() >= askbot_settings.CIVIC_DUTY_BADGE_MIN_VOTES:
             return self.award(actor, context_object, timestamp)
 
+    def get_deserved_awards(self):
+        return get_counted_generic_awards(
+                            Vote.objects.all(),
+                            'user',
+                            askbot_settings.CIVIC_DUTY_BADGE_MIN_VOTES
+                        )
+
 class SelfLearner(Badge):
     def __init__(self):
         description = _('Answered own question with at least %(num)s up votes')
@@ -271,6 +410,13 @@ class SelfLearner(Badge):
         if question.author == answer.author and answer.score >= min_upvotes:
             self.award(context_object.author, context_object, timestamp)
 
+    def get_deserved_awards(self):
+        answers = Answer.objects.filter(
+                    author = F('question__author'),
+                    score__gte = askbot_settings.SELF_LEARNER_BADGE_MIN_UPVOTES
+                )
+        return get_object_awards(answers, 'author')
+
 class QualityPost(Badge):
     """Generic Badge for Nice/Good/Great Question or Answer
     this badge is not used directly but is instantiated
@@ -298,6 +444,14 @@ class QualityPost(Badge):
             return self.award(context_object.author, context_object, timestamp)
         return False
 
+    def get_deserved_awards(self):
+        posts = get_post_model(self.post_type).objects.filter(
+                                            score__gte = self.min_votes
+                                        )
+        if self.multiple:
+            return get_object_awards(posts, 'author')
+        return get_counted_awards(posts, 'author', 1)
+
 class NiceAnswer(QualityPost):
     def __new__(cls):
         self = super(NiceAnswer, cls).__new__(cls)
@@ -408,6 +562,10 @@ class FrequentedQuestion(Badge):
             return self.award(context_object.author, context_object, timestamp)
         return False
 
+    def get_deserved_awards(self):
+        questions = Question.objects.filter(view_count__gte = self.min_views)
+        return get_object_awards(questions, 'author')
+
 class PopularQuestion(FrequentedQuestion):
     def __new__(cls):
         self = super(PopularQuestion, cls).__new__(cls)
@@ -465,6 +623,10 @@ class Scholar(Badge):
             return False
         return self.award(actor, context_object, timestamp)
 
+    def get_deserved_awards(self):
+        answers = Answer.objects.filter(accepted = True)
+        return get_counted_awards(answers, 'question__author', 1)
+
 class VotedAcceptedAnswer(Badge):
     """superclass for Enlightened and Guru badges
     not awarded directly
@@ -488,6 +650,15 @@ class VotedAcceptedAnswer(Badge):
         if answer.score >= self.min_votes and answer.accepted:
             return self.award(answer.author, answer, timestamp)
 
+    def get_deserved_awards(self):
+        answers = Answer.objects.filter(
+                                accepted = True,
+                                score__gte = self.min_votes
+                            )
+        if self.multiple:
+            return get_object_awards(answers, 'author')
+        return get_counted_awards(answers, 'author', 1)
+
 class Enlightened(VotedAcceptedAnswer):
     def __new__(cls):
         self = super(Enlightened, cls).__new__(cls)
@@ -541,6 +712,23 @@ class Necromancer(Badge):
             return self.award(answer.author, answer, timestamp)
         return False
 
+    def get_deserved_awards(self):
+        delta = datetime.timedelta(askbot_settings.NECROMANCER_BADGE_MIN_DELAY)
+        min_score = askbot_settings.NECROMANCER_BADGE_MIN_UPVOTES
+        #date arithmetic differs between the databases,
+        #so the delay is checked on the selected rows
+        rows = Answer.objects.filter(
+                                score__gte = min_score
+                            ).values_list(
+                                'author', 'id', 'added_at', 'question__added_at'
+                            )
+        content_type_id = get_content_type_id(Answer)
+        awards = list()
+        for author_id, answer_id, added_at, question_added_at in rows:
+            if added_at - question_added_at >= delta:
+                awards.append((author_id, content_type_id, answer_id))
+        return awards
+
 class CitizenPatrol(Badge):
     def __init__(self):
         super(CitizenPatrol, self).__init__(
@@ -602,9 +790,17 @@ class EditorTypeBadge(Badge):
             const.TYPE_ACTIVITY_UPDATE_ANSWER
         )
         filters = {'user': actor, 'activity_type__in': atypes}
-        if Activity.objects.filter(**filters).count() == self.min_edits:
+        if Activity.objects.filter(**filters).count() >= self.min_edits:
             return self.award(actor, context_object, timestamp)
 
+    def get_deserved_awards(self):
+        atypes = (
+            const.TYPE_ACTIVITY_UPDATE_QUESTION,
+            const.TYPE_ACTIVITY_UPDATE_ANSWER
+        )
+        activities = Activity.objects.filter(activity_type__in = atypes)
+        return get_counted_generic_awards(activities, 'user', self.min_edits)
+
 class Editor(EditorTypeBadge):
     def __new__(cls):
         self = super(Editor, cls).__new__(cls)
@@ -655,6 +851,12 @@ class Autobiographer(Badge):
             return self.award(user, user, timestamp)
         return False
 
+    def get_deserved_awards(self):
+        users = User.objects.all()
+        for field in ('email', 'real_name', 'website', 'location', 'about'):
+            users = users.exclude(**{field: ''}).exclude(**{field + '__isnull': True})
+        return get_object_awards(users, 'id')
+
 class FavoriteTypeBadge(Badge):
     """subclass must use __new__ and in addition
     must provide min_stars property for the badge
@@ -682,6 +884,22 @@ class FavoriteTypeBadge(Badge):
             return self.award(question.author, question, timestamp)
         return False
 
+    def get_deserved_awards(self):
+        rows = Fave.objects.exclude(
+                            user = F('question__author')
+                        ).order_by().values(
+                            'question', 'question__author'
+                        ).annotate(
+                            fave_count = Count('id')
+                        ).filter(
+                            fave_count__gte = self.min_stars
+                        )
+        content_type_id = get_content_type_id(Question)
+        return [
+            (row['question__author'], content_type_id, row['question'])
+            for row in rows
+        ]
+
 class StellarQuestion(FavoriteTypeBadge):
     def __new__(cls):
         self = super(StellarQuestion, cls).__new__(cls)
@@ -722,6 +940,13 @@ class Enthusiast(Badge):
             return self.award(actor, context_object, timestamp)
         return False
 
+    def get_deserved_awards(self):
+        users = User.objects.filter(
+                    consecutive_days_visit_count__gte = \
+                        askbot_settings.ENTHUSIAST_BADGE_MIN_DAYS
+                )
+        return get_object_awards(users, 'id')
+
 class Commentator(Badge):
     """Commentator is a bronze badge that is 
     awarded once when user posts a certain number of
@@ -744,6 +969,13 @@ class Commentator(Badge):
             return self.award(actor, context_object, timestamp)
         return False
 
+    def get_deserved_awards(self):
+        return get_counted_awards(
+                            Comment.objects.all(),
+                            'user',
+                            askbot_settings.COMMENTATOR_BADGE_MIN_COMMENTS
+                        )
+
 class Taxonomist(Badge):
     """Stub badge"""
     def __init__(self):
@@ -768,6 +1000,13 @@ class Taxonomist(Badge):
             return self.award(tag.created_by, tag, timestamp)
         return False
 
+    def get_deserved_awards(self):
+        tags = Tag.objects.filter(
+                    used_count__gte = askbot_settings.TAXONOMIST_BADGE_MIN_USE_COUNT,
+                    created_by__isnull = False
+                )
+        return get_object_awards(tags, 'created_by')
+
 class Expert(Badge):
     """Stub badge"""
     def __init__(self):
@@ -889,17 +1128,195 @@ award_badges_signal = Signal(
 #event - string name of the event, e.g 'downvote'
 #context_object - database object related to the event, e.g. question
 
+def get_event_badges(event):
+    """returns badge classes considered upon the event"""
+    try:
+        return EVENTS_TO_BADGES[event]
+    except KeyError:
+        raise NotImplementedError('event "%s" is not implemented' % event)
+
+
+class BadgeEngine(object):
+    """queues badge events and evaluates them in batches
+
+    BadgeData records are read once and kept in memory,
+    single-award badges known to be held by the users
+    are remembered until the end of the batch, so that
+    the awards are checked in the database only for the
+    badges not held yet, multiple-award badges given
+    within the batch are remembered as well
+
+    each event is evaluated in its own transaction, an event
+    that fails is logged and skipped, the rest of the batch
+    is still evaluated
+    """
+    def __init__(self, interval = None):
+        self.interval = interval
+        self.badge_data = dict()
+        #user id -> set of keys of the held single-award badges
+        self.held_badges = dict()
+        #tuples (user id, badge key, content type id, object id)
+        self.batch_awards = set()
+        self.events = list()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def get_badge_data(self, key):
+        """returns BadgeData record of the badge"""
+        if len(self.badge_data) == 0:
+            for data in BadgeData.objects.all():
+                self.badge_data[data.slug] = data
+        data = self.badge_data.get(key)
+        if data is None:
+            data, created = BadgeData.objects.get_or_create(slug = key)
+            self.badge_data[key] = data
+        return data
+
+    def get_award_key(self, badge, recipient, context_object):
+        content_type = ContentType.objects.get_for_model(context_object)
+        return (recipient.id, badge.key, content_type.id, context_object.id)
+
+    def has_award(self, badge, recipient, context_object):
+        """True if the badge cannot be awarded again
+        to the recipient for the context object
+        """
+        if badge.multiple == False:
+            held_badges = self.held_badges.setdefault(recipient.id, set())
+            if badge.key in held_badges:
+                return True
+            if recipient.badges.filter(slug = badge.key).count() != 0:
+                held_badges.add(badge.key)
+                return True
+            return False
+
+        award_key = self.get_award_key(badge, recipient, context_object)
+        if award_key in self.batch_awards:
+            return True
+        user_id, badge_key, content_type_id, object_id = award_key
+        return Award.objects.filter(
+                                user__id = user_id,
+                                badge__slug = badge_key,
+                                content_type__id = content_type_id,
+                                object_id = object_id
+                            ).count() != 0
+
+    def record_award(self, badge, recipient, context_object):
+        if badge.multiple == False:
+            self.held_badges.setdefault(recipient.id, set()).add(badge.key)
+        else:
+            self.batch_awards.add(
+                self.get_award_key(badge, recipient, context_object)
+            )
+
+    def evaluate(self, event, actor, context_object, timestamp):
+        """considers all badges of the event"""
+        for badge in get_event_badges(event):
+            badge_instance = badge()
+            badge_instance.engine = self
+            badge_instance.consider_award(actor, context_object, timestamp)
+
+    def add_event(self, event, actor, context_object, timestamp):
+        """queues the event and starts the worker thread
+        if it is not running yet
+
+        only the ids of the actor and of the context object
+        are queued, the rows are read again when the event
+        is evaluated, so that the worker thread never touches
+        the instances held by the request
+        """
+        get_event_badges(event)#fail early on unknown events
+        if context_object is None:
+            context_ref = None
+        else:
+            context_ref = (context_object.__class__, context_object.id)
+        self.lock.acquire()
+        try:
+            self.events.append((event, actor.id, context_ref, timestamp))
+            if self.thread is None and self.interval:
+                self.thread = threading.Thread(target = self.run)
+                self.thread.setDaemon(True)
+                self.thread.start()
+        finally:
+            self.lock.release()
+
+    def pop_events(self):
+        self.lock.acquire()
+        try:
+            events = self.events
+            self.events = list()
+        finally:
+            self.lock.release()
+        return events
+
+    def clear_awards(self):
+        """forgets the remembered awards, they may be
+        outdated by the awards deleted elsewhere or
+        by the transaction rolled back
+        """
+        self.held_badges.clear()
+        self.batch_awards.clear()
+
+    def process_events(self):
+        """evaluates all queued events, each in its own transaction,
+        returns number of the processed events
+        """
+        events = self.pop_events()
+        if len(events) == 0:
+            return 0
+        try:
+            for event, actor_id, context_ref, timestamp in events:
+                try:
+                    self.evaluate_event(event, actor_id, context_ref, timestamp)
+                except Exception, error:
+                    self.clear_awards()
+                    logging.critical(
+                        'badge event %s could not be processed: %s' \
+                        % (event, unicode(error))
+                    )
+        finally:
+            self.clear_awards()
+        return len(events)
+
+    @transaction.commit_on_success
+    def evaluate_event(self, event, actor_id, context_ref, timestamp):
+        """reads the actor and the context object by id
+        and evaluates the event against the current state
+        of the database
+        """
+        actor = User.objects.get(id = actor_id)
+        if context_ref is None:
+            context_object = None
+        else:
+            model, object_id = context_ref
+            context_object = model._default_manager.get(id = object_id)
+        self.evaluate(event, actor, context_object, timestamp)
+
+    def run(self):
+        """body of the worker thread"""
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.process_events()
+            except Exception, error:
+                logging.critical(
+                    'badge events could not be processed: %s' % unicode(error)
+                )
+
+if BADGE_EVENT_INTERVAL:
+    badge_engine = BadgeEngine(interval = BADGE_EVENT_INTERVAL)
+else:
+    badge_engine = None
+
 @auto_now_timestamp
 def award_badges(event = None, actor = None, 
                 context_object = None, timestamp = None, **kwargs):
     """function that is called when signal `award_badges_signal` is sent
     """
-    try:
-        consider_badges = EVENTS_TO_BADGES[event]
-    except KeyError:
-        raise NotImplementedError('event "%s" is not implemented' % event)
+    if badge_engine is not None:
+        badge_engine.add_event(event, actor, context_object, timestamp)
+        return
 
-    for badge in consider_badges:
+    for badge in get_event_badges(event):
         badge_instance = badge()
         badge_instance.consider_award(actor, context_object, timestamp)
 
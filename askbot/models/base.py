@@ -1,15 +1,19 @@
 import datetime
 import cgi
+import operator
+from django.conf import settings as django_settings
+from django.core.cache import cache
 from django.db import models
+from django.utils.hashcompat import md5_constructor
 from django.utils.html import strip_tags
 from django.contrib.auth.models import User
 from django.contrib.contenttypes import generic
 from django.contrib.contenttypes.models import ContentType
 #todo: maybe merge askbot.utils.markup and forum.utils.html
 from askbot.utils import markup
-from askbot.utils.html import sanitize_html
+from askbot.utils.deferred import defer
+from askbot.utils.diff import textDiff as htmldiff
 from django.utils import html
-import logging
 
 #todo: following methods belong to a future common post class
 def parse_post_text(post):
@@ -37,7 +41,7 @@ def parse_post_text(post):
         text = html.urlize(text)
 
     if post._use_markdown:
-        text = sanitize_html(markup.get_parser().convert(text))
+        text = markup.markdown_to_html(text)
 
     #todo, add markdown parser call conditional on
     #post.use_markdown flag
@@ -45,24 +49,35 @@ def parse_post_text(post):
     mentioned_authors = list()
     removed_mentions = list()
     if '@' in text:
-        op = post.get_origin_post()
-        anticipated_authors = op.get_author_list(
+        #every username that can match a mention starts with
+        #one of the name seeds, so all candidates are found
+        #with a single query
+        #empty seeds, e.g. from "@ " would match all users
+        extra_name_seeds = filter(None, markup.extract_mentioned_name_seeds(text))
+        if extra_name_seeds:
+            seed_filter = reduce(
+                            operator.or_,
+                            [
+                                models.Q(username__startswith = name_seed)
+                                for name_seed in extra_name_seeds
+                            ]
+                        )
+            anticipated_authors = list(User.objects.filter(seed_filter))
+        else:
+            anticipated_authors = list()
+
+        if markup.has_ambiguous_usernames(anticipated_authors):
+            #it is important to preserve order here so that authors of post 
+            #get mentioned first
+            op = post.get_origin_post()
+            post_authors = op.get_author_list(
                                     include_comments = True,
                                     recursive = True 
                                 )
-
-        extra_name_seeds = markup.extract_mentioned_name_seeds(text)
-
-        extra_authors = set()
-        for name_seed in extra_name_seeds:
-            extra_authors.update(User.objects.filter(
-                                        username__startswith = name_seed
-                                    )
-                            )
-
-        #it is important to preserve order here so that authors of post 
-        #get mentioned first
-        anticipated_authors += list(extra_authors)
+            anticipated_authors = post_authors + [
+                        user for user in anticipated_authors
+                        if user not in post_authors
+                    ]
 
         mentioned_authors, post_html = markup.mentionize_text(
                                                 text, 
@@ -115,10 +130,6 @@ def parse_and_save_post(post, author = None, **kwargs):
     if hasattr(post, 'summary'):
         post.summary = strip_tags(post.html)[:120]
 
-    #delete removed mentions
-    for rm in removed_mentions:
-        rm.delete()
-
     created = post.pk is None
 
     #this save must precede saving the mention activity
@@ -127,15 +138,18 @@ def parse_and_save_post(post, author = None, **kwargs):
 
     timestamp = post.get_time_of_last_edit()
 
-    #create new mentions
-    for u in newly_mentioned_users:
-        from askbot.models.user import Activity
-        Activity.objects.create_new_mention(
-                                mentioned_whom = u,
-                                mentioned_in = post,
-                                mentioned_by = author,
-                                mentioned_at = timestamp
-                            )
+    #mention activity records are updated off the request path
+    from askbot import tasks
+    if newly_mentioned_users or removed_mentions:
+        defer(
+            tasks.record_mentions_task,
+            post_id = post.id,
+            post_content_type_id = ContentType.objects.get_for_model(post).id,
+            mentioned_user_id_list = [u.id for u in newly_mentioned_users],
+            removed_mention_id_list = [rm.id for rm in removed_mentions],
+            mentioned_by_id = author.id,
+            timestamp = timestamp
+        )
 
     #todo: this is handled in signal because models for posts
     #are too spread out
@@ -149,12 +163,7 @@ def parse_and_save_post(post, author = None, **kwargs):
                     sender = post.__class__
                 )
 
-    try:
-        from askbot.conf import settings as askbot_settings
-        if askbot_settings.GOOGLE_SITEMAP_CODE != '':
-            ping_google()
-    except Exception:
-        logging.debug('cannot ping google - did you register with them?')
+    tasks.schedule_google_ping()
 
 class UserContent(models.Model):
     user = models.ForeignKey(User, related_name='%(class)ss')
@@ -186,6 +195,14 @@ class DeletableContent(models.Model):
         app_label = 'askbot'
 
 
+#diffs between pairs of revisions are cached for that many seconds,
+#0 - diffs are not cached
+REVISION_DIFF_CACHE_TIMEOUT = getattr(
+                                django_settings,
+                                'ASKBOT_REVISION_DIFF_CACHE_TIMEOUT',
+                                0
+                            )
+
 class ContentRevision(models.Model):
     """
         Base class for QuestionRevision and AnswerRevision
@@ -206,6 +223,40 @@ class ContentRevision(models.Model):
         """
         raise NotImplementedError()
 
+    def get_diff_html(self, previous_revision, **diff_markup):
+        """returns html diff of the previous revision and this one,
+        keyword arguments are the ins_start, ins_end, del_start
+        and del_end tags of :func:`askbot.utils.diff.textDiff`
+
+        revisions do not change, so the diffs are cached
+        per pair of revisions and the markup
+        """
+        if not REVISION_DIFF_CACHE_TIMEOUT:
+            return htmldiff(
+                        previous_revision.as_html(),
+                        self.as_html(),
+                        **diff_markup
+                    )
+
+        markup_hash = md5_constructor(
+                            repr(sorted(diff_markup.items()))
+                        ).hexdigest()
+        cache_key = 'askbot-revision-diff-%s-%d-%d-%s' % (
+                                    self._meta.db_table,
+                                    previous_revision.id,
+                                    self.id,
+                                    markup_hash
+                                )
+        diff = cache.get(cache_key)
+        if diff is None:
+            diff = htmldiff(
+                        previous_revision.as_html(),
+                        self.as_html(),
+                        **diff_markup
+                    )
+            cache.set(cache_key, diff, REVISION_DIFF_CACHE_TIMEOUT)
+        return diff
+
 
 class AnonymousContent(models.Model):
     """
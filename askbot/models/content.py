@@ -93,56 +93,58 @@ class Content(models.Model):
 
         return comment
 
-    def get_global_instant_notification_subscribers(self):
-        """returns a set of subscribers to post according to tag filters
-        both - subscribers who ignore tags or who follow only
-        specific tags
+    def get_global_instant_notification_subscriber_ids(self):
+        """returns a set of ids of the subscribers to post
+        according to tag filters both - subscribers who ignore tags
+        or who follow only specific tags
         """
-        tags = self.tags.all()
-
-        subscriber_set = set()
+        tag_ids = list(self.tags.values_list('id', flat = True))
+
+        #tag marks of all users on the tags of the question
+        interested_user_ids = set()
+        ignoring_user_ids = set()
+        if tag_ids:
+            tag_marks = MarkedTag.objects.filter(
+                                        tag__id__in = tag_ids
+                                    ).values_list('user', 'reason')
+            for user_id, reason in tag_marks:
+                if reason == 'good':
+                    interested_user_ids.add(user_id)
+                elif reason == 'bad':
+                    ignoring_user_ids.add(user_id)
 
         global_subscriptions = EmailFeedSetting.objects.filter(
-                                                    feed_type = 'q_all',
-                                                    frequency = 'i'
-                                                )
+                                feed_type = 'q_all',
+                                frequency = 'i'
+                            ).values_list(
+                                'subscriber',
+                                'subscriber__email_tag_filter_strategy'
+                            )
 
-        #segment of users who have tag filter turned off
-        global_subscribers = User.objects.filter(
-            email_tag_filter_strategy = const.INCLUDE_ALL
-        )
-        subscriber_set.update(global_subscribers)
-
-        #segment of users who want emails on selected questions only
-        interesting_tag_selections = MarkedTag.objects.filter(
-                                                    tag__in = tags,
-                                                    reason = 'good'
-                                                )
-        global_interested_subscribers = User.objects.filter(
-            tag_selections__in = interesting_tag_selections
-        ).filter(
-            notification_subscriptions__in = global_subscriptions
-        ).filter(
-            email_tag_filter_strategy = const.INCLUDE_INTERESTING 
-        )
-        subscriber_set.update(global_interested_subscribers)
-
-        #segment of users who want to exclude ignored tags
-        ignored_tag_selections = MarkedTag.objects.filter(
-                                                    tag__in = tags,
-                                                    reason = 'bad'
-                                                )
-
-        global_non_ignoring_subscribers = User.objects.exclude(
-            tag_selections__in = ignored_tag_selections
-        ).filter(
-            notification_subscriptions__in = global_subscriptions,
-        ).filter(
-            email_tag_filter_strategy = const.EXCLUDE_IGNORED
-        )
-        subscriber_set.update(global_non_ignoring_subscribers)
-        return subscriber_set
+        subscriber_ids = set()
+        for user_id, strategy in global_subscriptions:
+            if strategy == const.INCLUDE_ALL:
+                #segment of users who have tag filter turned off
+                subscriber_ids.add(user_id)
+            elif strategy == const.INCLUDE_INTERESTING:
+                #segment of users who want emails on selected questions only
+                if user_id in interested_user_ids:
+                    subscriber_ids.add(user_id)
+            elif strategy == const.EXCLUDE_IGNORED:
+                #segment of users who want to exclude ignored tags
+                if user_id not in ignoring_user_ids:
+                    subscriber_ids.add(user_id)
+        return subscriber_ids
 
+    def get_global_instant_notification_subscribers(self):
+        """returns a set of subscribers to post according to tag filters
+        both - subscribers who ignore tags or who follow only
+        specific tags
+        """
+        subscriber_ids = self.get_global_instant_notification_subscriber_ids()
+        if not subscriber_ids:
+            return set()
+        return set(User.objects.filter(id__in = list(subscriber_ids)))
 
     def get_instant_notification_subscribers(
                                 self,
@@ -157,75 +159,67 @@ class Content(models.Model):
         parameter "potential_subscribers" is not used here,
         but left for the uniformity of the interface (Comment method does use it)
 
+        the subscribers are selected as sets of user ids,
+        only the users who are finally notified are loaded
+
         comment class has it's own variant which does have quite a bit
         of duplicated code at the moment
         """
-        #print '------------------'
-        #print 'in content function'
-        subscriber_set = set()
-        #print 'potential subscribers: ', potential_subscribers
+        subscriber_ids = set()
+        feeds = EmailFeedSetting.objects
 
         #1) mention subscribers - common to questions and answers
         if mentioned_users:
-            mention_subscribers = EmailFeedSetting.objects.filter_subscribers(
-                                            potential_subscribers = mentioned_users,
-                                            feed_type = 'm_and_c',
-                                            frequency = 'i'
-                                        )
-            subscriber_set.update(mention_subscribers)
+            subscriber_ids.update(
+                feeds.filter_subscriber_ids(
+                    feed_type = 'm_and_c',
+                    frequency = 'i',
+                    subscriber__in = [user.id for user in mentioned_users]
+                )
+            )
 
         origin_post = self.get_origin_post()
 
-        #print origin_post
-
         #2) individually selected - make sure that users
         #are individual subscribers to this question
-        selective_subscribers = origin_post.followed_by.all()
-        #print 'question followers are ', [s for s in selective_subscribers]
-        if selective_subscribers:
-            selective_subscribers = EmailFeedSetting.objects.filter_subscribers(
-                                potential_subscribers = selective_subscribers,
-                                feed_type = 'q_sel',
-                                frequency = 'i'
-                            )
-            subscriber_set.update(selective_subscribers)
-            #print 'selective subscribers: ', selective_subscribers
+        subscriber_ids.update(
+            feeds.filter_subscriber_ids(
+                feed_type = 'q_sel',
+                frequency = 'i',
+                subscriber__followed_questions = origin_post
+            )
+        )
 
         #3) whole forum subscribers
-        global_subscribers = origin_post.get_global_instant_notification_subscribers()
-        subscriber_set.update(global_subscribers)
+        subscriber_ids.update(
+            origin_post.get_global_instant_notification_subscriber_ids()
+        )
 
         #4) question asked by me (todo: not "edited_by_me" ???)
-        question_author = origin_post.author
-        if EmailFeedSetting.objects.filter(
-                                            subscriber = question_author,
-                                            frequency = 'i',
-                                            feed_type = 'q_ask'
-                                        ):
-            subscriber_set.add(question_author)
-
-        #4) questions answered by me -make sure is that people 
-        #are authors of the answers to this question
-        #todo: replace this with a query set method
-        answer_authors = set()
-        for answer in origin_post.answers.all():
-            authors = answer.get_author_list()
-            answer_authors.update(authors)
-
-        if answer_authors:
-            answer_subscribers = EmailFeedSetting.objects.filter_subscribers(
-                                    potential_subscribers = answer_authors,
-                                    frequency = 'i',
-                                    feed_type = 'q_ans',
-                                )
-            subscriber_set.update(answer_subscribers)
-            #print 'answer subscribers: ', answer_subscribers
-
-        #print 'exclude_list is ', exclude_list
-        subscriber_set -= set(exclude_list)
-
-        #print 'final subscriber set is ', subscriber_set
-        return list(subscriber_set)
+        subscriber_ids.update(
+            feeds.filter_subscriber_ids(
+                feed_type = 'q_ask',
+                frequency = 'i',
+                subscriber = origin_post.author_id
+            )
+        )
+
+        #5) questions answered by me - people who
+        #authored revisions of the answers to this question
+        subscriber_ids.update(
+            feeds.filter_subscriber_ids(
+                feed_type = 'q_ans',
+                frequency = 'i',
+                subscriber__answerrevisions__answer__question = origin_post
+            )
+        )
+
+        if exclude_list:
+            subscriber_ids -= set([user.id for user in exclude_list])
+
+        if not subscriber_ids:
+            return list()
+        return list(User.objects.filter(id__in = list(subscriber_ids)))
 
     def get_latest_revision(self):
         return self.revisions.all().order_by('-revised_at')[0]
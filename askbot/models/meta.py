@@ -1,6 +1,7 @@
 import datetime
 from django.contrib.contenttypes.models import ContentType
 from django.db import models
+from django.contrib.auth.models import User
 from django.utils import html as html_utils
 from django.utils.translation import ugettext as _
 from askbot import const
@@ -28,6 +29,42 @@ class VoteManager(models.Manager):
         else:
             return 0
 
+    def get_votes_for_posts(self, user = None, posts = None):
+        """returns dictionary of votes given by the user
+        to any of the posts, with a single query.
+        The posts may be of different types,
+        e.g. a question and its answers
+
+        keys of the dictionary are the post objects,
+        because ids of posts of different types may coincide
+        values are the Vote objects,
+        posts not voted by the user are not in the dictionary
+        """
+        if user is None or user.is_anonymous() or not posts:
+            return {}
+
+        posts_by_type = dict()
+        for post in posts:
+            content_type = ContentType.objects.get_for_model(post)
+            posts_by_type.setdefault(content_type.id, dict())[post.id] = post
+
+        post_filter = None
+        for content_type_id, type_posts in posts_by_type.items():
+            type_filter = models.Q(
+                                content_type__id = content_type_id,
+                                object_id__in = type_posts.keys()
+                            )
+            if post_filter is None:
+                post_filter = type_filter
+            else:
+                post_filter |= type_filter
+
+        votes = dict()
+        for vote in self.filter(post_filter, user = user):
+            post = posts_by_type[vote.content_type_id][vote.object_id]
+            votes[post] = vote
+        return votes
+
 
 class Vote(base.MetaContent, base.UserContent):
     VOTE_UP = +1
@@ -189,55 +226,47 @@ class Comment(base.MetaContent, base.UserContent):
 
         argument potential_subscribers is required as it saves on db hits
         """
-        #print 'in meta function'
-        #print 'potential subscribers: ', potential_subscribers
-
-        subscriber_set = set()
+        subscriber_ids = set()
+        feeds = EmailFeedSetting.objects
 
+        potential_subscriber_ids = set()
         if potential_subscribers:
-            potential_subscribers = set(potential_subscribers)
-        else:
-            potential_subscribers = set()
-
+            potential_subscriber_ids.update(
+                [user.id for user in potential_subscribers]
+            )
         if mentioned_users:
-            potential_subscribers.update(mentioned_users)
-
-        if potential_subscribers:
-            comment_subscribers = EmailFeedSetting.objects.filter_subscribers(
-                                        potential_subscribers = potential_subscribers,
-                                        feed_type = 'm_and_c',
-                                        frequency = 'i'
-                                    )
-            subscriber_set.update(comment_subscribers)
-            #print 'comment subscribers: ', comment_subscribers
+            potential_subscriber_ids.update(
+                [user.id for user in mentioned_users]
+            )
+
+        if potential_subscriber_ids:
+            subscriber_ids.update(
+                feeds.filter_subscriber_ids(
+                    feed_type = 'm_and_c',
+                    frequency = 'i',
+                    subscriber__in = list(potential_subscriber_ids)
+                )
+            )
 
         origin_post = self.get_origin_post()
-        selective_subscribers = origin_post.followed_by.all()
-        if selective_subscribers:
-            selective_subscribers = EmailFeedSetting.objects.filter_subscribers(
-                                    potential_subscribers = selective_subscribers,
-                                    feed_type = 'q_sel',
-                                    frequency = 'i'
-                                )
-            for subscriber in selective_subscribers:
-                if origin_post.passes_tag_filter_for_user(subscriber):
-                    subscriber_set.add(subscriber)
-
-            subscriber_set.update(selective_subscribers)
-            #print 'selective subscribers: ', selective_subscribers
-
-        global_subscribers = origin_post.get_global_instant_notification_subscribers()
-        #print 'global subscribers: ', global_subscribers
-
-        subscriber_set.update(global_subscribers)
-
-        #print 'exclude list is: ', exclude_list
-        if exclude_list:
-            subscriber_set -= set(exclude_list)
+        subscriber_ids.update(
+            feeds.filter_subscriber_ids(
+                feed_type = 'q_sel',
+                frequency = 'i',
+                subscriber__followed_questions = origin_post
+            )
+        )
+
+        subscriber_ids.update(
+            origin_post.get_global_instant_notification_subscriber_ids()
+        )
 
-        #print 'final list of subscribers:', subscriber_set
+        if exclude_list:
+            subscriber_ids -= set([user.id for user in exclude_list])
 
-        return list(subscriber_set)
+        if not subscriber_ids:
+            return list()
+        return list(User.objects.filter(id__in = list(subscriber_ids)))
 
     def get_time_of_last_edit(self):
         return self.added_at
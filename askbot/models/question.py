@@ -1,27 +1,31 @@
-import logging
 import datetime
+import math
+import operator
+import time
 from django.conf import settings
-from django.utils.datastructures import SortedDict
+from django.core.cache import cache
 from django.db import models
 from django.contrib.auth.models import User
 from django.utils.http import urlquote as django_urlquote
 from django.core.urlresolvers import reverse
 from django.core import exceptions as django_exceptions
-from django.contrib.sitemaps import ping_google
 from django.utils.translation import ugettext as _
+from django.utils.hashcompat import md5_constructor
 import askbot
 import askbot.conf
 from askbot import exceptions
-from askbot.models.tag import Tag
+from askbot.models.tag import Tag, TagCooccurrence
 from askbot.models.base import AnonymousContent, DeletableContent, ContentRevision
 from askbot.models.base import parse_post_text, parse_and_save_post
 from askbot.models import content
 from askbot.models import signals
+from askbot.search.backends import get_search_backend
 from askbot import const
+from askbot.utils.buffers import FlushingBuffer
+from askbot.utils import keyset
 from askbot.utils.lists import LazyList
 from askbot.utils.slug import slugify
 from askbot.utils import markup
-from askbot.utils.html import sanitize_html
 
 #todo: too bad keys are duplicated see const sort methods
 QUESTION_ORDER_BY_MAP = {
@@ -36,6 +40,113 @@ QUESTION_ORDER_BY_MAP = {
     'relevance-desc': None#this is a special case for postges only
 }
 
+#number of seconds during which question views are
+#counted in memory before the update, 0 - update immediately
+QUESTION_VIEW_FLUSH_INTERVAL = getattr(
+                                settings,
+                                'ASKBOT_QUESTION_VIEW_FLUSH_INTERVAL',
+                                0
+                            )
+
+#number of similar questions stored for each question
+SIMILAR_QUESTIONS_COUNT = 10
+#at most this many most recently active questions
+#are compared with the question for each of its tags
+SIMILAR_QUESTION_CANDIDATES_PER_TAG = 200
+
+#number of seconds to keep ids of the questions found
+#by run_advanced_search in the cache, 0 - do not cache
+SEARCH_RESULT_CACHE_TIMEOUT = getattr(
+                                settings,
+                                'ASKBOT_SEARCH_RESULT_CACHE_TIMEOUT',
+                                0
+                            )
+#at most this many first ids of the search result are cached
+SEARCH_RESULT_CACHE_SIZE = 1000
+#changes when questions or answers are added, deleted or retagged
+CONTENT_GENERATION_CACHE_KEY = 'askbot-content-generation'
+#results sorted by the votes are not cached, because
+#votes change the order without changing the content generation
+UNCACHED_SORT_METHODS = ('votes-desc', 'votes-asc')
+
+QUESTION_LIST_SELECT_RELATED = (
+    'last_activity_by__id',
+    'last_activity_by__username',
+    'last_activity_by__reputation',
+    'last_activity_by__gold',
+    'last_activity_by__silver',
+    'last_activity_by__bronze',
+    'last_activity_by__country',
+    'last_activity_by__show_country',
+)
+
+def normalize_search_query(query):
+    """returns the text search query in lower case with
+    the whitespace collapsed, or None if the query is empty
+    """
+    if query:
+        query = ' '.join(query.lower().split())
+    return query or None
+
+def get_content_generation():
+    """returns the token of the current state of the content"""
+    generation = cache.get(CONTENT_GENERATION_CACHE_KEY)
+    if generation is None:
+        generation = bump_content_generation()
+    return generation
+
+def bump_content_generation():
+    """makes all cached search results outdated"""
+    generation = '%.6f' % time.time()
+    cache.set(CONTENT_GENERATION_CACHE_KEY, generation)
+    return generation
+
+
+class CachedSearchResult(object):
+    """ordered list of questions found by the search,
+    made of the cached list of the first question ids
+    and the total count, so that the questions are
+    fetched by ids page by page without running the search
+
+    the object can be passed to the django Paginator,
+    items beyond the cached ids are read from the queryset
+    """
+    def __init__(self, queryset, question_ids, count):
+        self.queryset = queryset
+        self.question_ids = question_ids
+        self._count = count
+
+    def count(self):
+        return self._count
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        return iter(self[:self._count])
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            return self[key:key + 1][0]
+
+        start, stop, step = key.indices(self._count)
+        if stop > len(self.question_ids):
+            return self.queryset[key]
+
+        page_ids = self.question_ids[start:stop]
+        questions = Question.objects.filter(
+                                    id__in = page_ids
+                                ).select_related(
+                                    *QUESTION_LIST_SELECT_RELATED
+                                )
+        questions_by_id = dict([(question.id, question) for question in questions])
+        #deleted in the meantime questions are skipped
+        return [
+            questions_by_id[question_id] for question_id in page_ids
+            if question_id in questions_by_id
+        ]
+
+
 class QuestionQuerySet(models.query.QuerySet):
     def create_new(
                 self,
@@ -86,30 +197,7 @@ class QuestionQuerySet(models.query.QuerySet):
         """returns a query set of questions,
         matching the full text query
         """
-        if settings.DATABASE_ENGINE == 'mysql':
-            return self.filter(
-                        models.Q(title__search = search_query) \
-                       | models.Q(text__search = search_query) \
-                       | models.Q(tagnames__search = search_query) \
-                       | models.Q(answers__text__search = search_query)
-                    )
-        elif settings.DATABASE_ENGINE == 'postgresql_psycopg2':
-            rank_clause = "ts_rank(question.text_search_vector, to_tsquery(%s))";
-            search_query = '&'.join(search_query.split())
-            extra_params = ("'" + search_query + "'",)
-            extra_kwargs = {
-                'select': {'relevance': rank_clause},
-                'where': ['text_search_vector @@ to_tsquery(%s)'],
-                'params': extra_params,
-                'select_params': extra_params,
-            }
-            return self.extra(**extra_kwargs)
-        else:
-            #fallback to dumb title match search
-            return self.extra(
-                        where=['title like %s'],
-                        params=['%' + search_query + '%']
-                    )
+        return get_search_backend().filter_questions(self, search_query)
 
     def run_advanced_search(
                         self,
@@ -128,7 +216,9 @@ class QuestionQuerySet(models.query.QuerySet):
                             const.DEFAULT_POST_SCOPE
                         )
 
-        search_query = search_state.query
+        #the same normalized query is used for the search
+        #and for the key of the cached result
+        search_query = normalize_search_query(search_state.query)
         tag_selector = search_state.tags
         author_selector = search_state.author
 
@@ -139,6 +229,8 @@ class QuestionQuerySet(models.query.QuerySet):
                         )
 
         qs = self.filter(deleted=False)#todo - add a possibility to see deleted questions
+        #True if the result depends on the user, not only on the search state
+        user_filtered = False
 
         #return metadata
         meta_data = {}
@@ -178,6 +270,7 @@ class QuestionQuerySet(models.query.QuerySet):
                     raise Exception('UNANSWERED_QUESTION_MEANING setting is wrong')
             elif scope_selector == 'favorite':
                 qs = qs.filter(favorited_by = request_user)
+                user_filtered = True
 
         #user contributed questions & answers
         if author_selector:
@@ -195,105 +288,67 @@ class QuestionQuerySet(models.query.QuerySet):
         #get users tag filters
         ignored_tag_names = None
         if request_user and request_user.is_authenticated():
-            uid_str = str(request_user.id)
-            #mark questions tagged with interesting tags
-            #a kind of fancy annotation, would be nice to avoid it
-            interesting_tags = Tag.objects.filter(
-                                    user_selections__user=request_user,
-                                    user_selections__reason='good'
-                                )
-            ignored_tags = Tag.objects.filter(
-                                    user_selections__user=request_user,
-                                    user_selections__reason='bad'
-                                )
+            #tag ids are resolved once per user, including the wildcards
+            tag_filter = Tag.objects.get_filter_for_user(request_user)
+            meta_data['tag_filter'] = tag_filter
 
-            meta_data['interesting_tag_names'] = [tag.name for tag in interesting_tags]
+            meta_data['interesting_tag_names'] = list(
+                                            tag_filter.interesting_tag_names
+                                        )
 
-            ignored_tag_names = [tag.name for tag in ignored_tags]
-            meta_data['ignored_tag_names'] = ignored_tag_names
+            ignored_tag_names = list(tag_filter.ignored_tag_names)
+            meta_data['ignored_tag_names'] = list(ignored_tag_names)
 
-            if interesting_tags or request_user.has_interesting_wildcard_tags():
-                #expensive query
-                if request_user.display_tag_filter_strategy == \
+            if (tag_filter.has_interesting_tags() \
+                or request_user.has_interesting_wildcard_tags()) \
+                and request_user.display_tag_filter_strategy == \
                         const.INCLUDE_INTERESTING:
-                    #filter by interesting tags only
-                    interesting_tag_filter = models.Q(tags__in = interesting_tags)
-                    if request_user.has_interesting_wildcard_tags():
-                        interesting_wildcards = request_user.interesting_tags.split()
-                        extra_interesting_tags = Tag.objects.get_by_wildcards(
-                                                            interesting_wildcards
-                                                        )
-                        interesting_tag_filter |= models.Q(tags__in = extra_interesting_tags)
-
-                    qs = qs.filter(interesting_tag_filter)
-                else:
-                    #simply annotate interesting questions
-                    qs = qs.extra(
-                        select = SortedDict([
-                            (
-                                'interesting_score',
-                                'SELECT COUNT(1) FROM askbot_markedtag, question_tags '
-                                 + 'WHERE askbot_markedtag.user_id = %s '
-                                 + 'AND askbot_markedtag.tag_id = question_tags.tag_id '
-                                 + 'AND askbot_markedtag.reason = \'good\' '
-                                 + 'AND question_tags.question_id = question.id'
-                            ),
-                                ]),
-                        select_params = (uid_str,),
-                     )
-            # get the list of interesting and ignored tags (interesting_tag_names, ignored_tag_names) = (None, None)
-
-            if ignored_tags or request_user.has_ignored_wildcard_tags():
-                if request_user.display_tag_filter_strategy == const.EXCLUDE_IGNORED:
-                    #exclude ignored tags if the user wants to
-                    qs = qs.exclude(tags__in=ignored_tags)
-                    if request_user.has_ignored_wildcard_tags():
-                        ignored_wildcards = request_user.ignored_tags.split()
-                        extra_ignored_tags = Tag.objects.get_by_wildcards(
-                                                            ignored_wildcards
-                                                        )
-                        qs = qs.exclude(tags__in = extra_ignored_tags)
-                else:
-                    #annotate questions tagged with ignored tags
-                    #expensive query
-                    qs = qs.extra(
-                        select = SortedDict([
-                            (
-                                'ignored_score',
-                                'SELECT COUNT(1) '
-                                  + 'FROM askbot_markedtag, question_tags '
-                                  + 'WHERE askbot_markedtag.user_id = %s '
-                                  + 'AND askbot_markedtag.tag_id = question_tags.tag_id '
-                                  + 'AND askbot_markedtag.reason = \'bad\' '
-                                  + 'AND question_tags.question_id = question.id'
-                            )
-                                ]),
-                        select_params = (uid_str, )
-                     )
+                #filter by interesting tags only
+                qs = qs.filter(
+                        tags__id__in = list(tag_filter.interesting_tag_ids)
+                    )
+                user_filtered = True
+
+            if tag_filter.has_ignored_tags() \
+                and request_user.display_tag_filter_strategy == \
+                        const.EXCLUDE_IGNORED:
+                #exclude ignored tags if the user wants to
+                qs = qs.exclude(
+                        tags__id__in = list(tag_filter.ignored_tag_ids)
+                    )
+                user_filtered = True
+            #otherwise the questions on the displayed page
+            #are annotated with tag_filter.annotate_questions
 
         if sort_method != 'relevance-desc':
             #relevance sort is set in the extra statement
             #only for postgresql
             orderby = QUESTION_ORDER_BY_MAP[sort_method]
-            qs = qs.order_by(orderby)
+            #order by id too, so that pages can be read with keyset.filter_after
+            qs = qs.order_by(orderby, keyset.get_tie_breaker(orderby))
 
         qs = qs.distinct()
-        qs = qs.select_related(
-                        'last_activity_by__id',
-                        'last_activity_by__username',
-                        'last_activity_by__reputation',
-                        'last_activity_by__gold',
-                        'last_activity_by__silver',
-                        'last_activity_by__bronze',
-                        'last_activity_by__country',
-                        'last_activity_by__show_country',
-                    )
+        qs = qs.select_related(*QUESTION_LIST_SELECT_RELATED)
 
         related_tags = Tag.objects.get_related_to_search(
                                         questions = qs,
                                         search_state = search_state,
                                         ignored_tag_names = ignored_tag_names
                                     )
+
+        if SEARCH_RESULT_CACHE_TIMEOUT \
+            and sort_method not in UNCACHED_SORT_METHODS:
+            if user_filtered:
+                user_id = request_user.id
+            else:
+                user_id = None
+            qs = self.get_cached_search_result(
+                                    qs,
+                                    query = search_query,
+                                    search_state = search_state,
+                                    category = category,
+                                    user_id = user_id
+                                )
         if askbot_settings.USE_WILDCARD_TAGS == True \
             and request_user.is_authenticated() == True:
             tagnames = request_user.interesting_tags
@@ -302,6 +357,53 @@ class QuestionQuerySet(models.query.QuerySet):
             meta_data['ignored_tag_names'].extend(tagnames.split())
         return qs, meta_data, related_tags
 
+    def get_cached_search_result(
+                        self,
+                        questions,
+                        query = None,
+                        search_state = None,
+                        category = None,
+                        user_id = None
+                    ):
+        """returns :class:`CachedSearchResult` for the
+        questions found by the search, the search is run
+        only if the result is not in the cache yet or if the
+        content was changed since then
+
+        query is the text search query normalized
+        with :func:`normalize_search_query`
+        """
+        key_data = repr((
+                        query,
+                        sorted(search_state.tags or []),
+                        getattr(search_state, 'scope', None),
+                        getattr(search_state, 'sort', None),
+                        search_state.author,
+                        getattr(category, 'id', None),
+                        user_id,
+                        get_content_generation()
+                    ))
+        cache_key = 'askbot-search-result-' + md5_constructor(
+                                        key_data.encode('utf-8')
+                                    ).hexdigest()
+        cached_result = cache.get(cache_key)
+        if cached_result is None:
+            question_ids = list(
+                        questions.values_list(
+                            'id', flat = True
+                        )[:SEARCH_RESULT_CACHE_SIZE + 1]
+                    )
+            if len(question_ids) > SEARCH_RESULT_CACHE_SIZE:
+                question_ids = question_ids[:SEARCH_RESULT_CACHE_SIZE]
+                count = questions.count()
+            else:
+                count = len(question_ids)
+            cached_result = (question_ids, count)
+            cache.set(cache_key, cached_result, SEARCH_RESULT_CACHE_TIMEOUT)
+
+        question_ids, count = cached_result
+        return CachedSearchResult(questions, question_ids, count)
+
     #todo: this function is similar to get_response_receivers
     #profile this function against the other one
     #todo: maybe this must be a query set method, not manager method
@@ -337,8 +439,66 @@ class QuestionQuerySet(models.query.QuerySet):
     def update_view_count(self, question):
         """
         update counter+1 when user browse question page
+
+        the increment is added to the process-local buffer
+        which is flushed to the database not more often than
+        once per QUESTION_VIEW_FLUSH_INTERVAL seconds
         """
-        self.filter(id=question.id).update(view_count = question.view_count + 1)
+        question.view_count += 1
+        question_view_buffer.add(question.id, 1)
+        question_view_buffer.flush_if_due()
+
+
+def flush_question_views(view_counts):
+    """applies buffered view counts, given as
+    a dictionary {question_id: number_of_new_views}
+    with one UPDATE statement per distinct increment
+
+    then sends the 'view_question' badge event for the questions
+    whose view count has just crossed one of the badge thresholds
+    """
+    question_ids_by_increment = dict()
+    for question_id, increment in view_counts.items():
+        question_ids_by_increment.setdefault(
+                                    increment, list()
+                                ).append(question_id)
+
+    for increment, question_ids in question_ids_by_increment.items():
+        Question.objects.filter(
+                    id__in = question_ids
+                ).update(
+                    view_count = models.F('view_count') + increment
+                )
+
+    #runtime imports to avoid circular dependencies
+    from askbot.conf import settings as askbot_settings
+    from askbot.models.badges import award_badges_signal
+    thresholds = (
+        askbot_settings.POPULAR_QUESTION_BADGE_MIN_VIEWS,
+        askbot_settings.NOTABLE_QUESTION_BADGE_MIN_VIEWS,
+        askbot_settings.FAMOUS_QUESTION_BADGE_MIN_VIEWS,
+    )
+    questions = Question.objects.filter(
+                                id__in = view_counts.keys(),
+                                view_count__gte = min(thresholds)
+                            ).select_related('author')
+    for question in questions:
+        old_view_count = question.view_count - view_counts[question.id]
+        for threshold in thresholds:
+            if old_view_count < threshold <= question.view_count:
+                award_badges_signal.send(None,
+                                event = 'view_question',
+                                actor = question.author,
+                                context_object = question,
+                            )
+                break
+
+question_view_buffer = FlushingBuffer(
+                            flush_function = flush_question_views,
+                            merge_function = operator.add,
+                            interval = QUESTION_VIEW_FLUSH_INTERVAL,
+                            background = True
+                        )
 
 
 class QuestionManager(models.Manager):
@@ -436,38 +596,14 @@ class Question(content.Content, DeletableContent):
     def get_similar_questions(self):
         """
         Get 10 similar questions for given one.
-        Questions with the individual tags will be added to list if above questions are not full.
 
-        This function has a limitation that it will
-        retrieve only 100 records then select 10 most similar
-        from that list as querying entire database may
-        be very expensive - this function will benefit from
-        some sort of optimization
+        Similar questions are calculated in advance
+        by :class:`SimilarQuestionManager`, when the question
+        is retagged and by the management command
+        update_similar_questions, here they are only read
         """
-        #print datetime.datetime.now()
-
         def get_data():
-
-            tags_list = self.tags.all()
-            similar_questions = self.__class__.objects.filter(
-                                            tags__in = self.tags.all()
-                                        ).exclude(
-                                            id = self.id,
-                                        ).exclude(
-                                            deleted = True
-                                        ).distinct()[:100]
-            similar_questions = list(similar_questions)
-            output = list()
-            for question in similar_questions:
-                question.similarity = self.get_similarity(
-                                                    other_question = question
-                                                )
-            #sort in reverse order - x and y are interchanged in cmp() call
-            similar_questions.sort(lambda x,y: cmp(y.similarity, x.similarity))
-            if len(similar_questions) > 10:
-                return similar_questions[:10]
-            else:
-                return similar_questions
+            return SimilarQuestion.objects.get_similar_questions(self)
 
         return LazyList(get_data)
 
@@ -559,6 +695,11 @@ class Question(content.Content, DeletableContent):
         #if there are any modified tags, update their use counts
         if modified_tags:
             Tag.objects.update_use_counts(modified_tags)
+            if self.deleted == False:
+                TagCooccurrence.objects.update_question_tags(
+                    previous_tag_ids = [tag.id for tag in previous_tags],
+                    tag_ids = self.tags.values_list('id', flat = True)
+                )
             signals.tags_updated.send(None,
                                 question = self,
                                 tags = modified_tags,
@@ -571,12 +712,8 @@ class Question(content.Content, DeletableContent):
 
     def delete(self):
         super(Question, self).delete()
-        try:
-            from askbot.conf import settings as askbot_settings
-            if askbot_settings.GOOGLE_SITEMAP_CODE != '':
-                ping_google()
-        except Exception:
-            logging.debug('problem pinging google did you register you sitemap with google?')
+        from askbot.tasks import schedule_google_ping
+        schedule_google_ping()
 
     def get_answers(self, user = None):
         """returns query set for answers to this question
@@ -871,6 +1008,194 @@ class FavoriteQuestion(models.Model):
     def __unicode__(self):
         return '[%s] favorited at %s' %(self.user, self.added_at)
 
+class SimilarQuestionManager(models.Manager):
+    """calculates similarity of questions by their tags:
+    sum of weights of the shared tags divided by
+    the sum of weights of all tags of both questions,
+    rare tags weigh more than the frequently used ones
+    """
+
+    def get_tag_weights(self, tag_ids):
+        """returns dictionary {tag id: weight}"""
+        question_count = Question.objects.filter(deleted = False).count()
+        used_counts = Tag.objects.filter(
+                                id__in = list(tag_ids)
+                            ).values_list('id', 'used_count')
+        weights = dict()
+        for tag_id, used_count in used_counts:
+            weights[tag_id] = math.log(
+                        1 + float(question_count) / max(used_count, 1)
+                    )
+        return weights
+
+    def get_question_tag_ids(self, question_ids):
+        """returns dictionary {question id: set of tag ids}"""
+        question_ids = set(question_ids)
+        tag_links = Tag.objects.filter(
+                                questions__id__in = list(question_ids)
+                            ).values_list('questions', 'id')
+        question_tag_ids = dict()
+        for question_id, tag_id in tag_links:
+            if question_id in question_ids:
+                question_tag_ids.setdefault(question_id, set()).add(tag_id)
+        return question_tag_ids
+
+    def get_candidate_ids(self, question, tag_ids):
+        """returns set of ids of the questions
+        sharing at least one tag with the question
+        """
+        candidate_ids = set()
+        for tag_id in tag_ids:
+            question_ids = Question.objects.filter(
+                                    tags__id = tag_id,
+                                    deleted = False
+                                ).exclude(
+                                    id = question.id
+                                ).order_by(
+                                    '-last_activity_at'
+                                ).values_list(
+                                    'id', flat = True
+                                )[:SIMILAR_QUESTION_CANDIDATES_PER_TAG]
+            candidate_ids.update(question_ids)
+        return candidate_ids
+
+    def calculate_scores(self, question):
+        """returns list of tuples (score, question id)
+        for the questions sharing tags with the question,
+        the most similar questions first
+        """
+        tag_ids = set(question.tags.values_list('id', flat = True))
+        candidate_ids = self.get_candidate_ids(question, tag_ids)
+        if len(candidate_ids) == 0:
+            return list()
+
+        candidate_tag_ids = self.get_question_tag_ids(candidate_ids)
+        all_tag_ids = set(tag_ids)
+        for other_tag_ids in candidate_tag_ids.values():
+            all_tag_ids.update(other_tag_ids)
+        weights = self.get_tag_weights(all_tag_ids)
+
+        scores = list()
+        for question_id, other_tag_ids in candidate_tag_ids.items():
+            shared_weight = sum(
+                [weights.get(tag_id, 0) for tag_id in tag_ids & other_tag_ids]
+            )
+            total_weight = sum(
+                [weights.get(tag_id, 0) for tag_id in tag_ids | other_tag_ids]
+            )
+            if shared_weight > 0:
+                scores.append((shared_weight / total_weight, question_id))
+        scores.sort(reverse = True)
+        return scores
+
+    def store_scores(self, question, scores):
+        """replaces the stored similar questions of the question
+        with the best scoring ones from the list of scores
+        """
+        self.filter(question = question).delete()
+        for score, question_id in scores[:SIMILAR_QUESTIONS_COUNT]:
+            self.create(
+                question = question,
+                similar_question_id = question_id,
+                score = score
+            )
+
+    def update_question(self, question):
+        """recalculates similar questions of the question
+        and places the question into the lists of the
+        other questions, where it is similar enough
+        """
+        scores = self.calculate_scores(question)
+        self.store_scores(question, scores)
+
+        #similarity is symmetric, so the same scores
+        #are used to update the lists of the other questions
+        listing_ids = set(
+            self.filter(
+                    similar_question = question
+                ).values_list('question', flat = True)
+        )
+        self.filter(similar_question = question).delete()
+        if question.deleted:
+            self.backfill(listing_ids)
+            return
+
+        stored_scores = dict()
+        stored_links = self.filter(
+                            question__id__in = [
+                                question_id for score, question_id in scores
+                            ]
+                        ).values_list('question', 'id', 'score')
+        for question_id, link_id, score in stored_links:
+            stored_scores.setdefault(question_id, list()).append((score, link_id))
+
+        for score, question_id in scores:
+            other_scores = stored_scores.get(question_id, list())
+            if len(other_scores) >= SIMILAR_QUESTIONS_COUNT:
+                lowest_score, lowest_link_id = min(other_scores)
+                if lowest_score >= score:
+                    continue
+                self.filter(id = lowest_link_id).delete()
+            self.create(
+                question_id = question_id,
+                similar_question = question,
+                score = score
+            )
+            listing_ids.discard(question_id)
+
+        #lists where the question is no longer similar enough
+        self.backfill(listing_ids)
+
+    def backfill(self, question_ids):
+        """recalculates the lists of the given questions,
+        which lost some of their similar questions
+        """
+        if question_ids:
+            self.rebuild(
+                Question.objects.filter(
+                                id__in = list(question_ids),
+                                deleted = False
+                            )
+            )
+
+    def get_similar_questions(self, question):
+        """returns list of the stored similar questions,
+        the most similar first
+        """
+        return list(
+            Question.objects.filter(
+                            similar_question_links__question = question,
+                            deleted = False
+                        ).order_by(
+                            '-similar_question_links__score'
+                        )[:SIMILAR_QUESTIONS_COUNT]
+        )
+
+    def rebuild(self, questions):
+        """recalculates similar questions of the given questions,
+        lists of the other questions are not changed
+        """
+        for question in questions:
+            self.store_scores(question, self.calculate_scores(question))
+
+
+class SimilarQuestion(models.Model):
+    """precalculated question similar to the other question,
+    see :class:`SimilarQuestionManager`
+    """
+    question = models.ForeignKey(Question, related_name='similarity_links')
+    similar_question = models.ForeignKey(
+                                Question,
+                                related_name='similar_question_links'
+                            )
+    score = models.FloatField(default=0)
+
+    objects = SimilarQuestionManager()
+
+    class Meta:
+        app_label = 'askbot'
+        unique_together = ('question', 'similar_question')
+
 QUESTION_REVISION_TEMPLATE = ('<h3>%(title)s</h3>\n'
                               '<div class="text">%(html)s</div>\n'
                               '<div class="tags">%(tags)s</div>')
@@ -893,10 +1218,9 @@ class QuestionRevision(ContentRevision):
         return reverse('question_revisions', args=[self.question.id])
 
     def as_html(self):
-        markdowner = markup.get_parser()
         return QUESTION_REVISION_TEMPLATE % {
             'title': self.title,
-            'html': sanitize_html(markdowner.convert(self.text)),
+            'html': markup.markdown_to_html(self.text),
             'tags': ' '.join(['<a class="post-tag">%s</a>' % tag
                               for tag in self.tagnames.split(' ')]),
         }
@@ -1,17 +1,37 @@
+import time
 import categories
 from south.modelsinspector import add_introspection_rules
 
 from django.db import models
-from django.db import connection, transaction
+from django.db import connection, transaction, IntegrityError
+from django.conf import settings as django_settings
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.utils.translation import ugettext as _
 
 from askbot.models.base import DeletableContent
+from askbot.utils.db import bulk_insert
 
 
 # So South can introspect the custom m2m field shipped with django-categories
 add_introspection_rules([], ["^categories\.fields\.CategoryM2MField"])
 
+#number of seconds to keep compiled tag filters of the users
+#in the cache, 0 - compile the filter on every request
+TAG_FILTER_CACHE_TIMEOUT = getattr(
+                            django_settings,
+                            'ASKBOT_TAG_FILTER_CACHE_TIMEOUT',
+                            0
+                        )
+TAG_FILTER_CACHE_KEY = 'askbot-tag-filter-%d'
+#changes when tags are added or deleted, because
+#then the wildcards may match a different set of tags
+TAG_SET_VERSION_CACHE_KEY = 'askbot-tag-set-version'
+
+#number of questions whose tags are read at once,
+#when the related tag counts are rebuilt
+COOCCURRENCE_BATCH_SIZE = 500
+
 class TagManager(models.Manager):
     UPDATE_USED_COUNTS_QUERY = """
         UPDATE tag
@@ -51,6 +71,81 @@ class TagManager(models.Manager):
             tag_filter |= models.Q(name__startswith = next_tag[:-1])
         return self.filter(tag_filter)
 
+    def get_filter_for_user(self, user):
+        """returns :class:`UserTagFilter` of the user,
+        taken from the cache when possible
+        """
+        if TAG_FILTER_CACHE_TIMEOUT == 0:
+            return UserTagFilter(user)
+
+        from askbot.conf import settings as askbot_settings
+        tag_set_version = cache.get(TAG_SET_VERSION_CACHE_KEY)
+        if tag_set_version is None:
+            tag_set_version = update_tag_set_version()
+
+        tag_filter = cache.get(TAG_FILTER_CACHE_KEY % user.id)
+        if tag_filter is None \
+            or tag_filter.tag_set_version != tag_set_version \
+            or tag_filter.use_wildcards != askbot_settings.USE_WILDCARD_TAGS:
+            tag_filter = UserTagFilter(user)
+            tag_filter.tag_set_version = tag_set_version
+            cache.set(
+                TAG_FILTER_CACHE_KEY % user.id,
+                tag_filter,
+                TAG_FILTER_CACHE_TIMEOUT
+            )
+        return tag_filter
+
+    def get_related_to_tags(
+                            self,
+                            tag_names = None,
+                            ignored_tag_names = None,
+                            limit = 50
+                        ):
+        """returns list of tags most often used together
+        with all of the given tags, each tag is annotated
+        with the number of shared questions as .local_used_count
+
+        the counts are taken from the tag co-occurrence table,
+        for more than one given tag the count is the smallest of
+        the pairwise counts, i.e. an estimate from above
+        """
+        selected_tags = self.filter(name__in = tag_names)
+        selected_tag_ids = list(selected_tags.values_list('id', flat = True))
+        if len(selected_tag_ids) == 0 \
+            or len(selected_tag_ids) < len(set(tag_names)):
+            #questions with non-existing tags are not there
+            return list()
+
+        related_counts = TagCooccurrence.objects.get_related_counts(
+                                                        selected_tag_ids
+                                                    )
+        if ignored_tag_names:
+            ignored_tag_ids = self.filter(
+                                    name__in = ignored_tag_names
+                                ).values_list('id', flat = True)
+            for tag_id in ignored_tag_ids:
+                related_counts.pop(tag_id, None)
+
+        top_counts = sorted(
+                        related_counts.items(),
+                        key = lambda item: item[1],
+                        reverse = True
+                    )[:limit]
+        top_counts = dict(top_counts)
+
+        tags = list(
+                self.filter(
+                    id__in = top_counts.keys()
+                ).exclude(
+                    deleted = True
+                )
+            )
+        for tag in tags:
+            tag.local_used_count = top_counts[tag.id]
+        tags.sort(key = lambda tag: tag.local_used_count, reverse = True)
+        return tags
+
     def get_related_to_search(
                             self,
                             questions = None,
@@ -58,21 +153,39 @@ class TagManager(models.Manager):
                             ignored_tag_names = None
                         ):
         """must return at least tag names, along with use counts
-        handle several cases to optimize the query performance
+        handle several cases to optimize the query performance:
+
+        * when tags are selected - related tags are looked up
+          in the tag co-occurrence table
+        * otherwise tags are counted on the questions of the search
+          result, if there are at most page_size * 3 of them,
+          if there are more questions - top tags are returned
+
+        in neither case the whole selection of questions is counted
         """
+        if search_state.tags:
+            return self.get_related_to_tags(
+                                tag_names = search_state.tags,
+                                ignored_tag_names = ignored_tag_names
+                            )
+
+        #getting id's is necessary to avoid hitting a heavy query
+        #on entire selection of questions. We actually want
+        #the big questions query to hit only the page to be displayed
+        max_count = search_state.page_size * 3
+        q_id_list = list(
+                        questions.values_list(
+                            'id', flat = True
+                        )[:max_count + 1]
+                    )
+        cheating = len(q_id_list) > max_count
 
-        if questions.count() > search_state.page_size * 3:
+        if cheating:
             """if we have too many questions or
             search query is the most common - just return a list
             of top tags"""
-            cheating = True
             tags = Tag.objects.all().order_by('-used_count')
         else:
-            cheating = False
-            #getting id's is necessary to avoid hitting a heavy query
-            #on entire selection of questions. We actually want
-            #the big questions query to hit only the page to be displayed
-            q_id_list = questions.values_list('id', flat=True)
             tags = self.filter(
                     questions__id__in = q_id_list,
                 ).annotate(
@@ -110,6 +223,280 @@ class Tag(DeletableContent):
 
 categories.register_m2m(Tag, 'categories', {'related_name': 'tags'})
 
+class TagCooccurrenceManager(models.Manager):
+
+    def get_tag_pairs(self, tag_ids):
+        """returns set of all ordered pairs of distinct tag ids"""
+        tag_ids = set(tag_ids)
+        pairs = set()
+        for tag_id in tag_ids:
+            for related_tag_id in tag_ids:
+                if tag_id != related_tag_id:
+                    pairs.add((tag_id, related_tag_id))
+        return pairs
+
+    def group_pairs(self, pairs):
+        """returns list of tuples (tag ids, related tag ids),
+        such that the pairs of tag ids are all combinations of
+        the tag ids and the related tag ids in these tuples,
+        tags with the same related tags make one group
+        """
+        related_ids = dict()
+        for tag_id, related_tag_id in pairs:
+            related_ids.setdefault(tag_id, set()).add(related_tag_id)
+        groups = dict()
+        for tag_id, related_tag_ids in related_ids.items():
+            key = tuple(sorted(related_tag_ids))
+            groups.setdefault(key, list()).append(tag_id)
+        return [(tag_ids, list(key)) for key, tag_ids in groups.items()]
+
+    def adjust_counts(self, pairs, delta, retry = True):
+        """adds delta to the counts of given pairs of tag ids,
+        missing records are created, records
+        with counts dropping to zero are deleted
+
+        pairs are updated with one query per group of tags
+        having the same related tags
+        """
+        pairs = set(pairs)
+        if len(pairs) == 0:
+            return
+
+        missing_pairs = set()
+        if delta > 0:
+            tag_ids = set()
+            for tag_id, related_tag_id in pairs:
+                tag_ids.add(tag_id)
+                tag_ids.add(related_tag_id)
+            existing_pairs = self.filter(
+                                    tag__id__in = list(tag_ids),
+                                    related_tag__id__in = list(tag_ids)
+                                ).values_list('tag', 'related_tag')
+            missing_pairs = pairs - set(existing_pairs)
+
+        #missing pairs are left out of the update, records of them
+        #inserted meanwhile by another transaction would
+        #otherwise be counted again in the second pass
+        groups = self.group_pairs(pairs - missing_pairs)
+        for tag_ids, related_tag_ids in groups:
+            self.filter(
+                    tag__id__in = tag_ids,
+                    related_tag__id__in = related_tag_ids
+                ).update(
+                    used_count = models.F('used_count') + delta
+                )
+
+        if missing_pairs:
+            #records may be inserted by a concurrent update
+            #of another question, then the counts are updated
+            #in the second pass
+            savepoint_id = transaction.savepoint()
+            try:
+                self.insert_counts(
+                    [(pair, delta) for pair in missing_pairs]
+                )
+                transaction.savepoint_commit(savepoint_id)
+            except IntegrityError:
+                transaction.savepoint_rollback(savepoint_id)
+                if retry == False:
+                    raise
+                self.adjust_counts(missing_pairs, delta, retry = False)
+
+        if delta < 0:
+            for tag_ids, related_tag_ids in groups:
+                self.filter(
+                        tag__id__in = tag_ids,
+                        related_tag__id__in = related_tag_ids,
+                        used_count__lte = 0
+                    ).delete()
+
+    def insert_counts(self, pair_counts):
+        """inserts records for the list of tuples
+        ((tag id, related tag id), count) with multi-row
+        INSERT statements
+        """
+        bulk_insert(
+            self.model,
+            ('tag', 'related_tag', 'used_count'),
+            [
+                (tag_id, related_tag_id, count) \
+                for (tag_id, related_tag_id), count in pair_counts
+            ]
+        )
+
+    def update_question_tags(self, previous_tag_ids = None, tag_ids = None):
+        """updates counts after the set of tags
+        of a question has changed from previous_tag_ids to tag_ids
+        """
+        previous_pairs = self.get_tag_pairs(previous_tag_ids or [])
+        pairs = self.get_tag_pairs(tag_ids or [])
+        self.adjust_counts(pairs - previous_pairs, 1)
+        self.adjust_counts(previous_pairs - pairs, -1)
+
+    def get_related_counts(self, tag_ids):
+        """returns dictionary {related tag id: count} of tags
+        used together with every one of the given tags,
+        the given tags themselves are not included
+        """
+        records = self.filter(
+                        tag__id__in = tag_ids
+                    ).values_list('tag', 'related_tag', 'used_count')
+
+        counts_by_tag = dict()
+        for tag_id, related_tag_id, count in records:
+            counts_by_tag.setdefault(tag_id, dict())[related_tag_id] = count
+
+        related_counts = None
+        for tag_id in tag_ids:
+            counts = counts_by_tag.get(tag_id, dict())
+            if related_counts is None:
+                related_counts = counts
+                continue
+            related_counts = dict(
+                (related_tag_id, min(count, counts[related_tag_id]))
+                for related_tag_id, count in related_counts.items()
+                if related_tag_id in counts
+            )
+
+        related_counts = related_counts or dict()
+        for tag_id in tag_ids:
+            related_counts.pop(tag_id, None)
+        return related_counts
+
+    def rebuild(self):
+        """recalculates all counts from the tags of
+        the questions that are not deleted, tags are read
+        for COOCCURRENCE_BATCH_SIZE questions at a time
+        """
+        from askbot.models.question import Question
+        pair_counts = dict()
+        question_ids = list(
+            Question.objects.filter(
+                            deleted = False
+                        ).values_list('id', flat = True)
+        )
+        for start in xrange(0, len(question_ids), COOCCURRENCE_BATCH_SIZE):
+            batch_ids = set(
+                question_ids[start:start + COOCCURRENCE_BATCH_SIZE]
+            )
+            tag_links = Tag.objects.filter(
+                                questions__id__in = list(batch_ids)
+                            ).values_list('questions', 'id')
+            question_tag_ids = dict()
+            for question_id, tag_id in tag_links:
+                if question_id in batch_ids:
+                    question_tag_ids.setdefault(question_id, set()).add(tag_id)
+            for tag_ids in question_tag_ids.values():
+                for pair in self.get_tag_pairs(tag_ids):
+                    pair_counts[pair] = pair_counts.get(pair, 0) + 1
+
+        self.all().delete()
+        self.insert_counts(pair_counts.items())
+        return len(pair_counts)
+
+
+class TagCooccurrence(models.Model):
+    """number of questions (not deleted) tagged
+    with both tag and related_tag, stored for both
+    orders of the tags, so that related tags are looked up
+    instead of being counted over the question table
+    """
+    tag = models.ForeignKey('Tag', related_name='cooccurrences')
+    related_tag = models.ForeignKey('Tag', related_name='reverse_cooccurrences')
+    used_count = models.PositiveIntegerField(default=0)
+
+    objects = TagCooccurrenceManager()
+
+    class Meta:
+        app_label = 'askbot'
+        unique_together = ('tag', 'related_tag')
+
+class UserTagFilter(object):
+    """interesting and ignored tags of the user
+    with the wildcards resolved into the tag ids,
+    so that questions can be filtered by the plain
+    lists of tag ids and annotated after they are fetched
+
+    * interesting_tag_names, ignored_tag_names - names of the marked tags
+    * interesting_tag_ids, ignored_tag_ids - ids of the marked tags and
+      of the tags matching the wildcards
+    * interesting_names, ignored_names - names of the same tags
+    """
+    def __init__(self, user):
+        from askbot.conf import settings as askbot_settings
+        self.tag_set_version = None
+        self.use_wildcards = askbot_settings.USE_WILDCARD_TAGS
+
+        interesting = dict()
+        ignored = dict()
+        marks = MarkedTag.objects.filter(
+                                user = user
+                            ).values_list('tag__id', 'tag__name', 'reason')
+        for tag_id, tag_name, reason in marks:
+            if reason == 'good':
+                interesting[tag_id] = tag_name
+            elif reason == 'bad':
+                ignored[tag_id] = tag_name
+
+        self.interesting_tag_names = interesting.values()
+        self.ignored_tag_names = ignored.values()
+
+        if user.has_interesting_wildcard_tags():
+            wildcards = user.interesting_tags.split()
+            interesting.update(self.get_wildcard_matches(wildcards))
+        if user.has_ignored_wildcard_tags():
+            wildcards = user.ignored_tags.split()
+            ignored.update(self.get_wildcard_matches(wildcards))
+
+        self.interesting_tag_ids = set(interesting.keys())
+        self.interesting_names = set(interesting.values())
+        self.ignored_tag_ids = set(ignored.keys())
+        self.ignored_names = set(ignored.values())
+
+    def get_wildcard_matches(self, wildcards):
+        """returns dictionary {tag id: tag name}
+        of tags matching the wildcards
+        """
+        return dict(
+            Tag.objects.get_by_wildcards(
+                                wildcards
+                            ).values_list('id', 'name')
+        )
+
+    def has_interesting_tags(self):
+        return len(self.interesting_tag_ids) > 0
+
+    def has_ignored_tags(self):
+        return len(self.ignored_tag_ids) > 0
+
+    def annotate_questions(self, questions):
+        """sets interesting_score and ignored_score
+        on the already fetched questions - numbers
+        of the interesting and ignored tags of each question
+        """
+        for question in questions:
+            tag_names = set(question.get_tag_names())
+            question.interesting_score = len(
+                                tag_names & self.interesting_names
+                            )
+            question.ignored_score = len(tag_names & self.ignored_names)
+
+
+def invalidate_user_tag_filter(user):
+    """drops cached tag filter of the user,
+    must be called when the tag selections of the user change
+    """
+    cache.delete(TAG_FILTER_CACHE_KEY % user.id)
+
+def update_tag_set_version():
+    """invalidates all cached tag filters,
+    called when tags are added or deleted
+    """
+    tag_set_version = '%.6f' % time.time()
+    cache.set(TAG_SET_VERSION_CACHE_KEY, tag_set_version)
+    return tag_set_version
+
+
 class MarkedTag(models.Model):
     TAG_MARK_REASONS = (('good', _('interesting')), ('bad', _('ignored')))
     tag = models.ForeignKey('Tag', related_name='user_selections')
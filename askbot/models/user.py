@@ -1,6 +1,7 @@
 import datetime
 import logging
 from django.db import models
+from django.db import transaction
 from django.db.backends.dummy.base import IntegrityError
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes import generic
@@ -9,6 +10,7 @@ from django.utils.translation import ugettext as _
 from django.utils.html import strip_tags
 from askbot import const
 from askbot.utils import functions
+from askbot.utils.db import bulk_insert
 
 class ResponseAndMentionActivityManager(models.Manager):
     def get_query_set(self):
@@ -181,11 +183,28 @@ class Activity(models.Model):
     def add_recipients(self, recipients):
         """have to use a special method, because django does not allow
         auto-adding to M2M with "through" model
+
+        audit status records are inserted with multi-row
+        INSERT statements
         """
+        recipient_ids = list()
+        seen_ids = set()
         for recipient in recipients:
-            #todo: may optimize for bulk addition
-            aas = ActivityAuditStatus(user = recipient, activity = self)
-            aas.save()
+            if recipient.id not in seen_ids:
+                seen_ids.add(recipient.id)
+                recipient_ids.append(recipient.id)
+        if len(recipient_ids) == 0:
+            return
+
+        bulk_insert(
+            ActivityAuditStatus,
+            ('user', 'activity', 'status'),
+            [
+                (user_id, self.id, ActivityAuditStatus.STATUS_NEW) \
+                for user_id in recipient_ids
+            ]
+        )
+        transaction.commit_unless_managed()
 
     def get_mentioned_user(self):
         assert(self.activity_type == const.TYPE_ACTIVITY_MENTION)
@@ -233,6 +252,25 @@ class EmailFeedSettingManager(models.Manager):
 
         return subscriber_set
 
+    def filter_subscriber_ids(
+                        self,
+                        feed_type = None,
+                        frequency = None,
+                        **kwargs
+                    ):
+        """returns set of ids of the users who have matching
+        subscriptions, keyword arguments are additional
+        lookups limiting the subscriptions, e.g. subscriber__in
+
+        unlike :meth:`filter_subscribers` no user objects are loaded
+        """
+        subscriber_ids = self.filter(
+                                feed_type = feed_type,
+                                frequency = frequency,
+                                **kwargs
+                            ).values_list('subscriber', flat = True)
+        return set(subscriber_ids)
+
 class EmailFeedSetting(models.Model):
     #definitions of delays before notification for each type of notification frequency
     DELTA_TABLE = {
@@ -0,0 +1,171 @@
+"""Full text search backends.
+
+A backend selects the questions matching the text query
+and, if it can rank them, adds to the question query set
+an extra column "relevance", by which questions are sorted
+when the "relevance" sort method is chosen.
+
+The backend is chosen with the django setting
+ASKBOT_SEARCH_BACKEND - dotted path to the backend class.
+By default the backend is chosen by the database engine.
+"""
+from django.conf import settings as django_settings
+from django.core import exceptions
+from django.db import models
+from django.utils.importlib import import_module
+
+#at most this many best matches are taken from the inverted index
+MAX_INDEX_RESULTS = 1000
+
+class SearchBackend(object):
+    """base class of the search backends"""
+
+    #True if backend adds column "relevance" to the questions
+    supports_relevance = False
+
+    def filter_questions(self, questions, query):
+        """returns query set of questions matching the query"""
+        raise NotImplementedError()
+
+    def update_question(self, question):
+        """called when question, its tags or its answers change"""
+        pass
+
+    def remove_question(self, question_id):
+        """called when question is deleted from the database"""
+        pass
+
+
+class MysqlSearchBackend(SearchBackend):
+    """uses full text indices of the MyISAM tables"""
+
+    def filter_questions(self, questions, query):
+        return questions.filter(
+                    models.Q(title__search = query) \
+                   | models.Q(text__search = query) \
+                   | models.Q(tagnames__search = query) \
+                   | models.Q(answers__text__search = query)
+                )
+
+
+class PostgresqlSearchBackend(SearchBackend):
+    """uses column text_search_vector maintained by triggers,
+    see management command init_postgresql_full_text_search
+    """
+    supports_relevance = True
+
+    def filter_questions(self, questions, query):
+        rank_clause = "ts_rank(question.text_search_vector, to_tsquery(%s))";
+        query = '&'.join(query.split())
+        extra_params = ("'" + query + "'",)
+        extra_kwargs = {
+            'select': {'relevance': rank_clause},
+            'where': ['text_search_vector @@ to_tsquery(%s)'],
+            'params': extra_params,
+            'select_params': extra_params,
+        }
+        return questions.extra(**extra_kwargs)
+
+
+class TitleSearchBackend(SearchBackend):
+    """fallback to dumb title match search"""
+
+    def filter_questions(self, questions, query):
+        return questions.extra(
+                    where=['title like %s'],
+                    params=['%' + query + '%']
+                )
+
+
+class InvertedIndexSearchBackend(SearchBackend):
+    """looks up questions in the :class:`InvertedIndex`
+    stored in the directory ASKBOT_SEARCH_INDEX_DIR,
+    the index is built with management command rebuild_search_index
+    and then kept up to date via the signals
+    """
+    supports_relevance = True
+
+    def __init__(self):
+        from askbot.search.inverted_index import InvertedIndex
+        directory = getattr(django_settings, 'ASKBOT_SEARCH_INDEX_DIR', None)
+        if directory is None:
+            raise exceptions.ImproperlyConfigured(
+                'ASKBOT_SEARCH_INDEX_DIR must be set to use the search index'
+            )
+        self.index = InvertedIndex(directory)
+        self.index.load()
+
+    def filter_questions(self, questions, query):
+        self.index.refresh()
+        results = self.index.search(query, limit = MAX_INDEX_RESULTS)
+        if len(results) == 0:
+            return questions.none()
+
+        #rank is the position of the question in the results,
+        #so that the relevance column is an integer;
+        #ids and ranks are inlined into the sql as integers,
+        #because bound parameters for a thousand results would
+        #exceed the limit of 999 variables per query of sqlite
+        id_list = list()
+        when_clauses = list()
+        result_count = len(results)
+        for position, (question_id, score) in enumerate(results):
+            question_id = int(question_id)
+            id_list.append(str(question_id))
+            when_clauses.append(
+                'WHEN %d THEN %d' % (question_id, result_count - position)
+            )
+        rank_clause = 'CASE question.id ' + ' '.join(when_clauses) + ' END'
+
+        return questions.extra(
+                            select = {'relevance': rank_clause},
+                            where = ['question.id IN (%s)' % ','.join(id_list)]
+                        )
+
+    def update_question(self, question):
+        from askbot.search.inverted_index import get_document
+        answer_texts = question.answers.filter(
+                                    deleted = False
+                                ).values_list('text', flat = True)
+        self.index.update(
+                    question.id,
+                    get_document(question, answer_texts)
+                )
+
+    def remove_question(self, question_id):
+        self.index.update(question_id, dict())
+
+
+DEFAULT_BACKENDS = {
+    'mysql': 'askbot.search.backends.MysqlSearchBackend',
+    'postgresql_psycopg2': 'askbot.search.backends.PostgresqlSearchBackend',
+}
+DEFAULT_BACKEND = 'askbot.search.backends.TitleSearchBackend'
+
+_backend = None
+
+def get_backend_class_path():
+    backend_path = getattr(django_settings, 'ASKBOT_SEARCH_BACKEND', None)
+    if backend_path is None:
+        backend_path = DEFAULT_BACKENDS.get(
+                                django_settings.DATABASE_ENGINE,
+                                DEFAULT_BACKEND
+                            )
+    return backend_path
+
+def get_search_backend():
+    """returns instance of the configured search backend,
+    the instance is created once per process
+    """
+    global _backend
+    if _backend is None:
+        backend_path = get_backend_class_path()
+        module_path, class_name = backend_path.rsplit('.', 1)
+        try:
+            backend_class = getattr(import_module(module_path), class_name)
+        except (ImportError, AttributeError):
+            raise exceptions.ImproperlyConfigured(
+                'cannot load search backend %s' % backend_path
+            )
+        _backend = backend_class()
+    return _backend
@@ -0,0 +1,320 @@
+"""Pure python full text index of the questions.
+
+The index maps words to the ids of the questions that contain
+them, together with the weight of the word in each question.
+Words of the title and the tags weigh more than the words of
+the question and answer texts.
+
+The index is kept in memory of each process and is stored
+in a directory on disk:
+
+* ``snapshot`` - pickled complete index
+* ``journal`` - text file, to which every process appends
+  the updated documents, one line per question
+
+Before each search the process reads the journal records
+added since the last search, so updates made by other
+processes become visible without reloading the whole index.
+When the index is rebuilt, the journal is replaced with an empty one
+and processes reload the snapshot. The journal is also compacted
+into a new snapshot when it grows over MAX_JOURNAL_SIZE.
+
+Appends to the journal and the compaction are serialized
+between the processes with a lock on file ``lock``.
+"""
+import logging
+import math
+import os
+import re
+import tempfile
+import threading
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+TITLE_WEIGHT = 3
+TAG_WEIGHT = 2
+TEXT_WEIGHT = 1
+#journal larger than that many bytes is merged into the snapshot
+MAX_JOURNAL_SIZE = 10 * 1024 * 1024
+
+def get_words(text):
+    """returns list of lowercased words of the text"""
+    if not text:
+        return list()
+    return WORD_RE.findall(text.lower())
+
+def get_document(question, answer_texts = None):
+    """returns dictionary {word: weight} describing the question,
+    weight of the word is the sum of weights of all its occurrences
+    """
+    document = dict()
+    def add_words(text, weight):
+        for word in get_words(text):
+            document[word] = document.get(word, 0) + weight
+
+    add_words(question.title, TITLE_WEIGHT)
+    add_words(question.tagnames, TAG_WEIGHT)
+    add_words(question.text, TEXT_WEIGHT)
+    for text in answer_texts or []:
+        add_words(text, TEXT_WEIGHT)
+    return document
+
+def format_record(question_id, document):
+    """returns journal line for the document,
+    empty document means that the question is removed
+    """
+    terms = ' '.join(
+                ['%s:%d' % (word, weight) for word, weight in document.items()]
+            )
+    return (u'%d\t%s\n' % (question_id, terms)).encode('utf-8')
+
+def parse_record(line):
+    """inverse of :func:`format_record`"""
+    question_id, terms = line.decode('utf-8').rstrip('\n').split('\t', 1)
+    document = dict()
+    for term in terms.split():
+        word, weight = term.rsplit(':', 1)
+        document[word] = int(weight)
+    return int(question_id), document
+
+
+class InvertedIndex(object):
+    """thread-safe inverted index stored in the directory"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.snapshot_path = os.path.join(directory, 'snapshot')
+        self.journal_path = os.path.join(directory, 'journal')
+        self.lock_path = os.path.join(directory, 'lock')
+        self.lock = threading.RLock()
+        self.clear()
+        self.journal_id = None
+        self.journal_offset = 0
+
+    def clear(self):
+        #word -> {question id: weight}
+        self.postings = dict()
+        #question id -> {word: weight}
+        self.documents = dict()
+
+    def add_document(self, question_id, document):
+        """replaces words of the question in memory"""
+        self.lock.acquire()
+        try:
+            self.remove_document(question_id)
+            if document:
+                self.documents[question_id] = document
+                for word, weight in document.items():
+                    self.postings.setdefault(word, dict())[question_id] = weight
+        finally:
+            self.lock.release()
+
+    def remove_document(self, question_id):
+        self.lock.acquire()
+        try:
+            document = self.documents.pop(question_id, None)
+            for word in document or []:
+                postings = self.postings[word]
+                del postings[question_id]
+                if len(postings) == 0:
+                    del self.postings[word]
+        finally:
+            self.lock.release()
+
+    def update(self, question_id, document):
+        """adds the document and records it in the journal,
+        empty document removes the question from the index
+        """
+        self.lock.acquire()
+        try:
+            self.add_document(question_id, document)
+            lock_file = self.lock_directory()
+            try:
+                journal = open(self.journal_path, 'ab')
+                try:
+                    journal.write(format_record(question_id, document))
+                    journal_size = journal.tell()
+                finally:
+                    journal.close()
+                if journal_size > MAX_JOURNAL_SIZE:
+                    self.compact()
+            finally:
+                self.unlock_directory(lock_file)
+        finally:
+            self.lock.release()
+
+    def compact(self):
+        """merges the journal into the snapshot,
+        must be called with the directory locked
+        """
+        if self.get_journal_id() != self.journal_id:
+            self.load()
+        else:
+            self.read_journal()
+        self.save()
+
+    def ensure_directory(self):
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+    def lock_directory(self):
+        """takes the inter-process lock of the index,
+        returns the file to pass to :meth:`unlock_directory`
+        """
+        self.ensure_directory()
+        lock_file = open(self.lock_path, 'ab')
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        return lock_file
+
+    def unlock_directory(self, lock_file):
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+        lock_file.close()
+
+    def get_journal_id(self):
+        """returns identity of the journal file or None
+        if there is no journal yet
+        """
+        try:
+            stat = os.stat(self.journal_path)
+        except OSError:
+            return None
+        return (stat.st_dev, stat.st_ino)
+
+    def load(self):
+        """reads the snapshot and the whole journal"""
+        self.lock.acquire()
+        try:
+            self.ensure_directory()
+            self.clear()
+            self.journal_id = self.get_journal_id()
+            self.journal_offset = 0
+            if os.path.exists(self.snapshot_path):
+                snapshot = open(self.snapshot_path, 'rb')
+                try:
+                    self.postings, self.documents = pickle.load(snapshot)
+                finally:
+                    snapshot.close()
+            self.read_journal()
+        finally:
+            self.lock.release()
+
+    def read_journal(self):
+        """applies journal records added after the last read"""
+        if self.journal_id is None:
+            return
+        journal = open(self.journal_path, 'rb')
+        try:
+            journal.seek(self.journal_offset)
+            while True:
+                line = journal.readline()
+                if not line.endswith('\n'):
+                    #end of file or a record being written right now
+                    break
+                self.journal_offset += len(line)
+                try:
+                    question_id, document = parse_record(line)
+                except (ValueError, UnicodeDecodeError):
+                    #torn record of a crashed writer
+                    logging.critical(
+                        'skipped corrupt search index record %r' % line
+                    )
+                    continue
+                self.add_document(question_id, document)
+        finally:
+            journal.close()
+
+    def refresh(self):
+        """catches up with the updates made by other processes"""
+        self.lock.acquire()
+        try:
+            if self.get_journal_id() != self.journal_id:
+                #index was rebuilt
+                self.load()
+            else:
+                self.read_journal()
+        finally:
+            self.lock.release()
+
+    def save(self):
+        """writes the in-memory index as the new snapshot
+        and starts an empty journal
+        """
+        self.lock.acquire()
+        try:
+            self.ensure_directory()
+            self.write_file(
+                    self.snapshot_path,
+                    pickle.dumps(
+                        (self.postings, self.documents),
+                        pickle.HIGHEST_PROTOCOL
+                    )
+                )
+            self.write_file(self.journal_path, '')
+            self.journal_id = self.get_journal_id()
+            self.journal_offset = 0
+        finally:
+            self.lock.release()
+
+    def write_file(self, path, data):
+        """replaces the file atomically"""
+        fd, temp_path = tempfile.mkstemp(dir = self.directory)
+        temp_file = os.fdopen(fd, 'wb')
+        try:
+            temp_file.write(data)
+        finally:
+            temp_file.close()
+        os.rename(temp_path, path)
+
+    def search(self, query, limit = None):
+        """returns list of tuples (question id, score),
+        most relevant questions first, questions must
+        contain all words of the query
+        """
+        words = set(get_words(query))
+        if len(words) == 0:
+            return list()
+
+        self.lock.acquire()
+        try:
+            postings_list = list()
+            for word in words:
+                postings = self.postings.get(word)
+                if postings is None:
+                    return list()
+                postings_list.append(postings)
+
+            #start from the rarest word to keep the candidate set small
+            postings_list.sort(key = len)
+            candidates = set(postings_list[0])
+            for postings in postings_list[1:]:
+                candidates.intersection_update(postings)
+                if len(candidates) == 0:
+                    return list()
+
+            document_count = float(len(self.documents))
+            scores = dict()
+            for postings in postings_list:
+                idf = math.log(1 + document_count / len(postings))
+                for question_id in candidates:
+                    scores[question_id] = scores.get(question_id, 0) \
+                                            + postings[question_id] * idf
+        finally:
+            self.lock.release()
+
+        results = sorted(
+                    scores.items(),
+                    key = lambda item: item[1],
+                    reverse = True
+                )
+        if limit:
+            results = results[:limit]
+        return results
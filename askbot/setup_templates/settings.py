@@ -91,6 +91,9 @@ MIDDLEWARE_CLASSES = (
     'askbot.deps.recaptcha_django.middleware.ReCaptchaMiddleware',
     'django.middleware.transaction.TransactionMiddleware',
     #'debug_toolbar.middleware.DebugToolbarMiddleware',
+    #to cache pages for anonymous visitors uncomment the next line
+    #and set ASKBOT_ANONYMOUS_PAGE_CACHE_TIMEOUT (in seconds)
+    #'askbot.middleware.anon_page_cache.AnonymousPageCacheMiddleware',
     'askbot.middleware.view_log.ViewLogMiddleware',
     'askbot.middleware.spaceless.SpacelessMiddleware',
 )
@@ -113,6 +116,46 @@ ASKBOT_ALLOWED_UPLOAD_FILE_TYPES = ('.jpg', '.jpeg', '.gif', '.bmp', '.png', '.t
 ASKBOT_MAX_UPLOAD_FILE_SIZE = 1024 * 1024 #result in bytes
 DEFAULT_FILE_STORAGE = 'django.core.files.storage.FileSystemStorage'
 
+#read pages of the questions listing after the last question
+#of the previous page instead of counting offsets, with this
+#the total number of questions is cached for the given number of seconds
+#ASKBOT_KEYSET_PAGINATION = True
+#ASKBOT_QUESTION_COUNT_CACHE_TIMEOUT = 60
+
+#seconds to cache interesting and ignored tag ids of the users
+#(with the wildcard tags resolved), 0 - resolve on every request
+#ASKBOT_TAG_FILTER_CACHE_TIMEOUT = 600
+
+#full text search engine, by default chosen by the database engine,
+#the search index works with any database, it is stored in the
+#given directory and is built with "python manage.py rebuild_search_index"
+#ASKBOT_SEARCH_BACKEND = 'askbot.search.backends.InvertedIndexSearchBackend'
+#ASKBOT_SEARCH_INDEX_DIR = os.path.join(os.path.dirname(__file__), 'search_index')
+
+#seconds to cache ids of the questions found by the search,
+#cached results are dropped when questions or answers change
+#ASKBOT_SEARCH_RESULT_CACHE_TIMEOUT = 300
+
+#store outgoing email in this directory instead of sending it
+#right away, the messages are sent by the command
+#"python manage.py send_spooled_email", e.g. run from cron every minute
+#ASKBOT_EMAIL_SPOOL_DIR = os.path.join(os.path.dirname(__file__), 'email_spool')
+
+#evaluate badges in a background thread every that many seconds
+#instead of in the request that triggered the award
+#ASKBOT_BADGE_EVENT_INTERVAL = 10
+
+#cache html rendered from markdown for that many seconds,
+#so that unchanged texts are not parsed and sanitized again
+#ASKBOT_MARKDOWN_CACHE_TIMEOUT = 3600
+
+#sanitize html with regular expressions, and use html5lib
+#only for the markup that is not simple enough ('html5lib' or 'fast')
+#ASKBOT_HTML_SANITIZER = 'fast'
+
+#cache diffs between the revisions of the posts for that many seconds
+#ASKBOT_REVISION_DIFF_CACHE_TIMEOUT = 86400
+
 
 #TEMPLATE_DIRS = (,) #template have no effect in askbot, use the variable below
 #ASKBOT_EXTRA_SKIN_DIR = #path to your private skin collection
@@ -192,6 +235,12 @@ ALLOW_UNICODE_SLUGS = False
 #Celery Settings
 BROKER_BACKEND = "djkombu.transport.DatabaseTransport"
 CELERY_ALWAYS_EAGER = True
+#without a celery worker, notifications, mention records and
+#sitemap pings run in a background thread after the response is sent,
+#set to False to run them within the request instead
+#ASKBOT_DEFERRED_TASK_THREAD = True
+#ping google about the sitemap at most once per this many seconds
+#ASKBOT_SITEMAP_PING_INTERVAL = 600
 
 import djcelery
 djcelery.setup_loader()
@@ -1,4 +1,6 @@
 import os.path
+import time
+from django.core.cache import cache
 from django.template.loaders import filesystem
 from django.template import RequestContext
 from django.http import HttpResponse
@@ -6,6 +8,8 @@ from django.utils import translation
 from django.conf import settings as django_settings
 from coffin.common import CoffinEnvironment
 from jinja2 import loaders as jinja_loaders
+from jinja2 import nodes
+from jinja2.ext import Extension
 from jinja2.exceptions import TemplateNotFound
 from jinja2.utils import open_if_exists
 from askbot.conf import settings as askbot_settings
@@ -106,12 +110,136 @@ class SkinEnvironment(CoffinEnvironment):
             return '<link href="%s" rel="stylesheet" type="text/css" />' % url
         return ''
 
+#fragment cache for the post blocks of the question page
+#fragments are stored for POST_FRAGMENT_CACHE_TIMEOUT seconds
+#and are dropped when the post is updated or voted - by
+#renewing the fragment version of the post, which is a part of the keys
+#0 - the cache is disabled
+POST_FRAGMENT_CACHE_TIMEOUT = getattr(
+                                django_settings,
+                                'ASKBOT_POST_FRAGMENT_CACHE_TIMEOUT',
+                                0
+                            )
+#names of fragments, that can be used with the {% cache %} tag
+POST_FRAGMENT_NAMES = ('answer', 'body', 'comments', 'contributors')
+VIEWER_CLASSES = ('anonymous', 'regular', 'moderator')
+POST_FRAGMENT_VERSION_KEY = 'askbot-fragment-version-%s-%d'
+
+def get_viewer_class(user):
+    """returns name of the class of users, for whom
+    cached post fragments are rendered the same way,
+    or None if fragment caching is disabled
+    """
+    if POST_FRAGMENT_CACHE_TIMEOUT == 0:
+        return None
+    if user.is_anonymous():
+        return 'anonymous'
+    elif user.is_administrator() or user.is_moderator():
+        return 'moderator'
+    else:
+        return 'regular'
+
+def get_post_fragment_cache_key(
+                            fragment_name = None,
+                            post = None,
+                            viewer_class = None,
+                            skin = None
+                        ):
+    """cache key of a rendered fragment of the post,
+    fragment version of the post is a part of the key, so that
+    the updated posts are not matched to the old fragments
+    """
+    return 'askbot-fragment-%s-%s-%s-%d-%s-%s' % (
+                                skin,
+                                fragment_name,
+                                post.post_type,
+                                post.id,
+                                get_post_fragment_version(post),
+                                viewer_class
+                            )
+
+def get_post_fragment_version(post):
+    """returns token, which changes when the cached
+    fragments of the post must be rendered again,
+    the token is read once per post object
+    """
+    version = getattr(post, '_fragment_version', None)
+    if version is None:
+        key = POST_FRAGMENT_VERSION_KEY % (post.post_type, post.id)
+        version = cache.get(key)
+        if version is None:
+            version = renew_post_fragment_version(post)
+        post._fragment_version = version
+    return version
+
+def renew_post_fragment_version(post):
+    """stores a new fragment version of the post"""
+    version = '%.6f' % time.time()
+    cache.set(
+        POST_FRAGMENT_VERSION_KEY % (post.post_type, post.id),
+        version,
+        POST_FRAGMENT_CACHE_TIMEOUT * 10
+    )
+    post._fragment_version = version
+    return version
+
+def invalidate_post_fragments(post):
+    """drops all cached fragments of the post
+    with one cache write
+    """
+    if POST_FRAGMENT_CACHE_TIMEOUT == 0:
+        return
+    renew_post_fragment_version(post)
+
+class FragmentCacheExtension(Extension):
+    """jinja2 tag caching rendered fragments of posts
+    usage:
+
+    {% cache 'contributors', answer, viewer_class %}
+        ... content ...
+    {% endcache %}
+
+    when viewer_class is None the content is rendered every time
+    """
+    tags = set(['cache'])
+
+    def parse(self, parser):
+        lineno = parser.stream.next().lineno
+        args = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            args.append(parser.parse_expression())
+        body = parser.parse_statements(['name:endcache'], drop_needle = True)
+        return nodes.CallBlock(
+                    self.call_method('_render_fragment', args),
+                    [], [], body
+                ).set_lineno(lineno)
+
+    def _render_fragment(self, fragment_name, post, viewer_class, caller):
+        assert(fragment_name in POST_FRAGMENT_NAMES)
+        if viewer_class is None or POST_FRAGMENT_CACHE_TIMEOUT == 0:
+            return caller()
+
+        key = get_post_fragment_cache_key(
+                            fragment_name = fragment_name,
+                            post = post,
+                            viewer_class = viewer_class,
+                            skin = self.environment.skin
+                        )
+        fragment = cache.get(key)
+        if fragment is None:
+            fragment = caller()
+            cache.set(key, fragment, POST_FRAGMENT_CACHE_TIMEOUT)
+        return fragment
+
 def load_skins():
     skins = dict()
     for skin_name in utils.get_available_skins():
         skins[skin_name] = SkinEnvironment(
                                 skin = skin_name,
-                                extensions=['jinja2.ext.i18n',]
+                                extensions=[
+                                    'jinja2.ext.i18n',
+                                    FragmentCacheExtension,
+                                ]
                             )
         skins[skin_name].set_language(django_settings.LANGUAGE_CODE)
         #from askbot.templatetags import extra_filters_jinja as filters
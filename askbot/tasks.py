@@ -1,8 +1,104 @@
+import logging
+import time
+from django.conf import settings as django_settings
 from django.contrib.contenttypes.models import ContentType
+from django.contrib.sitemaps import ping_google
+from django.core.cache import cache
 from celery.decorators import task
+from askbot.conf import settings as askbot_settings
 from askbot.models import Activity
 from askbot.models import User
+from askbot.models import Question, SimilarQuestion
+from askbot.models import increment_response_counts
 from askbot.models import send_instant_notifications_about_activity_in_post
+from askbot.utils.deferred import defer
+
+#sitemap is pinged at most once per this number of seconds
+SITEMAP_PING_INTERVAL = getattr(
+                            django_settings,
+                            'ASKBOT_SITEMAP_PING_INTERVAL',
+                            600
+                        )
+SITEMAP_PING_CACHE_KEY = 'askbot-sitemap-pinged'
+#set while the ping at the end of the interval is scheduled
+SITEMAP_PING_PENDING_CACHE_KEY = 'askbot-sitemap-ping-pending'
+
+@task(ignore_results = True)
+def ping_google_task():
+    try:
+        ping_google()
+    except Exception:
+        logging.debug('cannot ping google - did you register with them?')
+
+@task(ignore_results = True)
+def trailing_ping_google_task():
+    """pings google at the end of the interval about the
+    updates made after the previous ping and starts a new interval
+    """
+    cache.delete(SITEMAP_PING_PENDING_CACHE_KEY)
+    cache.set(SITEMAP_PING_CACHE_KEY, time.time(), SITEMAP_PING_INTERVAL)
+    ping_google_task()
+
+def schedule_google_ping():
+    """pings google about the sitemap update off the request path,
+    if it was already pinged within SITEMAP_PING_INTERVAL seconds,
+    one more ping is scheduled for the end of the interval,
+    so that the latest updates are also reported
+    """
+    if askbot_settings.GOOGLE_SITEMAP_CODE == '':
+        return
+    if cache.add(SITEMAP_PING_CACHE_KEY, time.time(), SITEMAP_PING_INTERVAL):
+        defer(ping_google_task)
+    elif cache.add(SITEMAP_PING_PENDING_CACHE_KEY, True, SITEMAP_PING_INTERVAL):
+        pinged_at = cache.get(SITEMAP_PING_CACHE_KEY) or 0
+        countdown = max(pinged_at + SITEMAP_PING_INTERVAL - time.time(), 0)
+        defer(trailing_ping_google_task, countdown = countdown)
+
+@task(ignore_results = True)
+def update_similar_questions_task(question_id):
+    """recalculates similar questions of the question
+    and updates the lists of the other questions
+    """
+    try:
+        question = Question.objects.get(id = question_id)
+    except Question.DoesNotExist:
+        return
+    SimilarQuestion.objects.update_question(question)
+
+@task(ignore_results = True)
+def backfill_similar_questions_task(question_ids):
+    """recalculates lists of the questions, which
+    lost a similar question deleted from the database
+    """
+    SimilarQuestion.objects.backfill(question_ids)
+
+@task(ignore_results = True)
+def record_mentions_task(
+        post_id,
+        post_content_type_id,
+        mentioned_user_id_list = None,
+        removed_mention_id_list = None,
+        mentioned_by_id = None,
+        timestamp = None,
+    ):
+    """deletes mentions removed from the post
+    and records the new ones
+    """
+    if removed_mention_id_list:
+        Activity.objects.filter(id__in = removed_mention_id_list).delete()
+    if not mentioned_user_id_list:
+        return
+
+    post_content_type = ContentType.objects.get(id = post_content_type_id)
+    post = post_content_type.get_object_for_this_type(id = post_id)
+    mentioned_by = User.objects.get(id = mentioned_by_id)
+    for user in User.objects.filter(id__in = mentioned_user_id_list):
+        Activity.objects.create_new_mention(
+                                mentioned_whom = user,
+                                mentioned_in = post,
+                                mentioned_by = mentioned_by,
+                                mentioned_at = timestamp
+                            )
 
 @task(ignore_results = True)
 def record_post_update_task(
@@ -46,9 +142,7 @@ def record_post_update_task(
                                 id__in = newly_mentioned_user_id_list
                             )
 
-    for user in set(recipients) | set(newly_mentioned_users):
-        user.increment_response_count()
-        user.save()
+    increment_response_counts(set(recipients) | set(newly_mentioned_users))
 
     #todo: weird thing is that only comments need the recipients
     #todo: debug these calls and then uncomment in the repo
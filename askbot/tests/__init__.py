@@ -9,3 +9,7 @@ from askbot.tests.management_command_tests import *
 from askbot.tests.search_state_tests import *
 from askbot.tests.form_tests import *
 from askbot.tests.categories_tests import *
+from askbot.tests.cache_tests import *
+from askbot.tests.search_index_tests import *
+from askbot.tests.html_sanitizer_tests import *
+from askbot.tests.diff_tests import *
@@ -3,6 +3,7 @@ from django.test.client import Client
 from askbot.tests.utils import AskbotTestCase
 from askbot.conf import settings
 from askbot import models
+from askbot.models import badges
 from askbot.models.badges import award_badges_signal
 
 class BadgeTests(AskbotTestCase):
@@ -502,3 +503,111 @@ class BadgeTests(AskbotTestCase):
         self.client.get('/')
         self.assert_have_badge('enthusiast', self.u1, 1)
 
+
+
+class BadgeEngineTests(AskbotTestCase):
+
+    def setUp(self):
+        self.u1 = self.create_user(username = 'user1')
+        self.engine = badges.BadgeEngine()
+
+    def test_queued_events_are_evaluated_in_batch(self):
+        self.u1.real_name = 'blah'
+        self.u1.website = 'cnn.com'
+        self.u1.location = 'irvine'
+        self.u1.about = 'blah'
+        self.u1.save()
+        for i in xrange(2):
+            self.engine.add_event(
+                'update_user_profile',
+                self.u1,
+                self.u1,
+                datetime.datetime.now()
+            )
+        self.assertEquals(
+            models.Award.objects.filter(user = self.u1).count(),
+            0
+        )
+        self.assertEquals(self.engine.process_events(), 2)
+        awards = models.Award.objects.filter(
+                                user = self.u1,
+                                badge__slug = 'autobiographer'
+                            )
+        self.assertEquals(awards.count(), 1)
+        self.assertEquals(self.engine.process_events(), 0)
+
+    def test_multiple_award_is_given_once_per_object(self):
+        question = self.post_question(user = self.u1)
+        models.Question.objects.filter(id = question.id).update(
+            view_count = settings.POPULAR_QUESTION_BADGE_MIN_VIEWS
+        )
+        for i in xrange(2):
+            self.engine.add_event(
+                'view_question',
+                self.u1,
+                question,
+                datetime.datetime.now()
+            )
+        self.engine.process_events()
+        awards = models.Award.objects.filter(
+                                user = self.u1,
+                                badge__slug = 'popular-question'
+                            )
+        self.assertEquals(awards.count(), 1)
+
+    def test_failed_event_does_not_drop_the_batch(self):
+        self.u1.real_name = 'blah'
+        self.u1.website = 'cnn.com'
+        self.u1.location = 'irvine'
+        self.u1.about = 'blah'
+        self.u1.save()
+        old_evaluate = self.engine.evaluate
+        def evaluate(event, actor, context_object, timestamp):
+            if context_object is None:
+                raise ValueError('no context object')
+            old_evaluate(event, actor, context_object, timestamp)
+        self.engine.evaluate = evaluate
+        now = datetime.datetime.now()
+        self.engine.add_event('update_user_profile', self.u1, None, now)
+        self.engine.add_event('update_user_profile', self.u1, self.u1, now)
+        self.assertEquals(self.engine.process_events(), 2)
+        awards = models.Award.objects.filter(
+                                user = self.u1,
+                                badge__slug = 'autobiographer'
+                            )
+        self.assertEquals(awards.count(), 1)
+
+    def test_held_badges_are_forgotten_after_batch(self):
+        badge = badges.get_badge('autobiographer')
+        self.engine.record_award(badge, self.u1, self.u1)
+        self.assertTrue(self.engine.has_award(badge, self.u1, self.u1))
+        self.engine.add_event(
+            'update_user_profile',
+            self.u1,
+            self.u1,
+            datetime.datetime.now()
+        )
+        self.engine.process_events()
+        self.assertEquals(self.engine.held_badges, {})
+        self.assertFalse(self.engine.has_award(badge, self.u1, self.u1))
+
+    def test_civic_duty_badge_with_votes_queued_across_threshold(self):
+        settings.update('CIVIC_DUTY_BADGE_MIN_VOTES', 2)
+        u2 = self.create_user(username = 'user2')
+        question = self.post_question(user = u2)
+        answer = self.post_answer(user = u2, question = question)
+        answer2 = self.post_answer(user = u2, question = question)
+        old_engine = badges.badge_engine
+        badges.badge_engine = self.engine
+        try:
+            self.u1.upvote(question)
+            self.u1.upvote(answer)
+            self.u1.upvote(answer2)
+        finally:
+            badges.badge_engine = old_engine
+        self.assertEquals(self.engine.process_events(), 3)
+        awards = models.Award.objects.filter(
+                                user = self.u1,
+                                badge__slug = 'civic-duty'
+                            )
+        self.assertEquals(awards.count(), 1)
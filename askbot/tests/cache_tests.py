@@ -0,0 +1,427 @@
+"""tests for the caching and buffering layers
+"""
+import datetime
+import operator
+import time
+from django.core.cache import cache
+from django.http import HttpRequest, HttpResponse, QueryDict
+from django.test import TestCase
+from askbot.tests.utils import AskbotTestCase
+from askbot import models
+from askbot.models import tag as tag_module
+from askbot.models import question as question_module
+from askbot.models import base as base_module
+from askbot.middleware import anon_page_cache
+from askbot.search.state_manager import SearchState
+from askbot.skins import loaders
+from askbot.utils import markup
+from askbot.utils.buffers import FlushingBuffer
+from askbot.conf import settings as askbot_settings
+from askbot.conf.settings_wrapper import ConfigSettings
+from askbot.conf.settings_wrapper import SNAPSHOT_VERSION_CACHE_KEY
+
+class SettingsSnapshotTests(TestCase):
+
+    def test_value_is_stored_in_snapshot(self):
+        value = askbot_settings.MAX_ALERTS_PER_EMAIL
+        snapshot = ConfigSettings.get_snapshot()
+        self.assertEquals(snapshot['MAX_ALERTS_PER_EMAIL'], value)
+
+    def test_update_drops_snapshot(self):
+        old_value = askbot_settings.MAX_ALERTS_PER_EMAIL
+        askbot_settings.update('MAX_ALERTS_PER_EMAIL', old_value + 1)
+        self.assertEquals(askbot_settings.MAX_ALERTS_PER_EMAIL, old_value + 1)
+        askbot_settings.update('MAX_ALERTS_PER_EMAIL', old_value)
+        self.assertEquals(askbot_settings.MAX_ALERTS_PER_EMAIL, old_value)
+
+    def test_change_of_version_in_another_process(self):
+        askbot_settings.MAX_ALERTS_PER_EMAIL
+        #emulate version change made by another process
+        cache.set(SNAPSHOT_VERSION_CACHE_KEY, 'other-process-version')
+        ConfigSettings._ConfigSettings__snapshot_checked_at = 0
+        self.assertEquals(ConfigSettings.get_snapshot(), {})
+
+
+class UserVisitBufferTests(AskbotTestCase):
+
+    def setUp(self):
+        self.user = self.create_user()
+        self.last_seen = datetime.datetime(2011, 5, 10, 12, 30)
+        self.user.last_seen = self.last_seen
+        self.user.save()
+
+    def test_flush_moves_last_seen_forward(self):
+        later = self.last_seen + datetime.timedelta(0, 600)
+        models.flush_user_visits({self.user.id: later})
+        user = self.reload_object(self.user)
+        self.assertEquals(user.last_seen, later)
+
+    def test_flush_does_not_move_last_seen_back(self):
+        earlier = self.last_seen - datetime.timedelta(0, 600)
+        models.flush_user_visits({self.user.id: earlier})
+        user = self.reload_object(self.user)
+        self.assertEquals(user.last_seen, self.last_seen)
+
+
+class FlushingBufferTests(TestCase):
+
+    def test_background_buffer_is_flushed_without_new_values(self):
+        flushed = list()
+        buffer = FlushingBuffer(
+                        flush_function = flushed.append,
+                        merge_function = operator.add,
+                        interval = 0.05,
+                        background = True
+                    )
+        buffer.add(1, 2)
+        buffer.add(1, 3)
+        time.sleep(0.5)
+        self.assertEquals(flushed, [{1: 5}])
+        self.assertEquals(buffer.get(1), None)
+
+
+class QuestionViewBufferTests(AskbotTestCase):
+
+    def setUp(self):
+        self.user = self.create_user()
+        self.question = self.post_question()
+
+    def test_flush_adds_increments(self):
+        from askbot.models.question import flush_question_views
+        flush_question_views({self.question.id: 3})
+        question = self.reload_object(self.question)
+        self.assertEquals(question.view_count, 3)
+        flush_question_views({self.question.id: 2})
+        question = self.reload_object(self.question)
+        self.assertEquals(question.view_count, 5)
+
+
+class PostFragmentCacheTests(AskbotTestCase):
+
+    def setUp(self):
+        self.old_timeout = loaders.POST_FRAGMENT_CACHE_TIMEOUT
+        loaders.POST_FRAGMENT_CACHE_TIMEOUT = 60
+        self.user = self.create_user()
+        self.question = self.post_question()
+        #fragments cached by the earlier tests for a post with the same id
+        loaders.invalidate_post_fragments(self.question)
+        self.template = loaders.SKINS['default'].from_string(
+            "{% cache 'body', question, viewer_class %}{{ text }}{% endcache %}"
+        )
+
+    def tearDown(self):
+        loaders.POST_FRAGMENT_CACHE_TIMEOUT = self.old_timeout
+
+    def render(self, text, viewer_class = 'anonymous'):
+        data = {
+            'question': self.question,
+            'text': text,
+            'viewer_class': viewer_class
+        }
+        return self.template.render(data)
+
+    def test_fragment_is_cached(self):
+        self.assertEquals(self.render('one'), 'one')
+        self.assertEquals(self.render('two'), 'one')
+
+    def test_fragment_is_not_cached_without_viewer_class(self):
+        self.assertEquals(self.render('one', viewer_class = None), 'one')
+        self.assertEquals(self.render('two', viewer_class = None), 'two')
+
+    def test_edited_post_is_rendered_again(self):
+        self.assertEquals(self.render('one'), 'one')
+        self.user.edit_question(
+                    question = self.question,
+                    title = 'edited title',
+                    body_text = 'edited body text',
+                    revision_comment = 'edit',
+                    tags = 'test',
+                    timestamp = datetime.datetime.now() + datetime.timedelta(0, 5)
+                )
+        self.assertEquals(self.render('two'), 'two')
+
+    def test_vote_renews_fragments(self):
+        self.assertEquals(self.render('one'), 'one')
+        voter = self.create_user('voter')
+        voter.reputation = askbot_settings.MIN_REP_TO_VOTE_UP
+        voter.upvote(self.question)
+        self.question = self.reload_object(self.question)
+        self.assertEquals(self.render('two'), 'two')
+
+    def test_fragment_is_not_cached_when_cache_is_disabled(self):
+        loaders.POST_FRAGMENT_CACHE_TIMEOUT = 0
+        self.assertEquals(self.render('one'), 'one')
+        self.assertEquals(self.render('two'), 'two')
+
+
+class UserTagFilterTests(AskbotTestCase):
+
+    def setUp(self):
+        self.user = self.create_user()
+        self.post_question(tags = 'apple apricot banana cherry')
+        self.old_timeout = tag_module.TAG_FILTER_CACHE_TIMEOUT
+        tag_module.TAG_FILTER_CACHE_TIMEOUT = 60
+        tag_module.invalidate_user_tag_filter(self.user)
+        self.use_wildcards = askbot_settings.USE_WILDCARD_TAGS
+        askbot_settings.update('USE_WILDCARD_TAGS', True)
+
+    def tearDown(self):
+        tag_module.TAG_FILTER_CACHE_TIMEOUT = self.old_timeout
+        askbot_settings.update('USE_WILDCARD_TAGS', self.use_wildcards)
+
+    def get_tag_ids(self, *names):
+        return set(
+            models.Tag.objects.filter(
+                            name__in = names
+                        ).values_list('id', flat = True)
+        )
+
+    def test_wildcards_are_resolved(self):
+        self.user.mark_tags(['banana'], ['ap*'], reason = 'good', action = 'add')
+        tag_filter = models.Tag.objects.get_filter_for_user(self.user)
+        self.assertEquals(
+            tag_filter.interesting_tag_ids,
+            self.get_tag_ids('apple', 'apricot', 'banana')
+        )
+        self.assertEquals(tag_filter.interesting_tag_names, ['banana'])
+        self.assertEquals(tag_filter.ignored_tag_ids, set())
+
+    def test_marking_tags_drops_cached_filter(self):
+        tag_filter = models.Tag.objects.get_filter_for_user(self.user)
+        self.assertEquals(tag_filter.ignored_tag_ids, set())
+        self.user.mark_tags(['cherry'], [], reason = 'bad', action = 'add')
+        tag_filter = models.Tag.objects.get_filter_for_user(self.user)
+        self.assertEquals(tag_filter.ignored_tag_ids, self.get_tag_ids('cherry'))
+
+    def test_new_tag_is_matched_by_cached_filter(self):
+        self.user.mark_tags([], ['ap*'], reason = 'good', action = 'add')
+        models.Tag.objects.get_filter_for_user(self.user)
+        self.post_question(tags = 'apex')
+        tag_filter = models.Tag.objects.get_filter_for_user(self.user)
+        self.assertEquals(
+            tag_filter.interesting_tag_ids,
+            self.get_tag_ids('apple', 'apricot', 'apex')
+        )
+
+    def test_annotate_questions(self):
+        self.user.mark_tags(['cherry'], ['ap*'], reason = 'good', action = 'add')
+        tag_filter = models.Tag.objects.get_filter_for_user(self.user)
+        question = models.Question.objects.all()[0]
+        tag_filter.annotate_questions([question])
+        self.assertEquals(question.interesting_score, 3)
+        self.assertEquals(question.ignored_score, 0)
+
+
+class SearchResultCacheTests(AskbotTestCase):
+
+    def setUp(self):
+        self.user = self.create_user()
+        self.old_timeout = question_module.SEARCH_RESULT_CACHE_TIMEOUT
+        question_module.SEARCH_RESULT_CACHE_TIMEOUT = 60
+        question_module.bump_content_generation()
+        self.search_state = SearchState()
+
+    def tearDown(self):
+        question_module.SEARCH_RESULT_CACHE_TIMEOUT = self.old_timeout
+
+    def run_search(self):
+        qs, meta_data, related_tags = \
+            models.Question.objects.run_advanced_search(
+                                    request_user = self.user,
+                                    search_state = self.search_state
+                                )
+        return qs
+
+    def test_result_is_cached(self):
+        question = self.post_question()
+        qs = self.run_search()
+        self.assertEquals(qs.count(), 1)
+        self.assertEquals(list(qs[0:10]), [question])
+        #emulate change made without the signals
+        models.Question.objects.filter(id = question.id).update(deleted = True)
+        self.assertEquals(self.run_search().count(), 1)
+
+    def test_new_question_outdates_cached_result(self):
+        self.post_question()
+        self.assertEquals(self.run_search().count(), 1)
+        self.post_question()
+        self.assertEquals(self.run_search().count(), 2)
+
+    def test_query_is_normalized(self):
+        question = self.post_question(title = 'unrelated title')
+        self.search_state.query = 'Some  Query'
+        self.assertEquals(self.run_search().count(), 0)
+        #emulate change made without the signals
+        models.Question.objects.filter(
+                                id = question.id
+                            ).update(title = 'some query')
+        self.search_state.query = 'some query'
+        self.assertEquals(self.run_search().count(), 0)
+
+    def test_query_is_normalized_for_the_search(self):
+        self.post_question(title = 'some query')
+        self.search_state.query = '  SOME   Query '
+        self.assertEquals(self.run_search().count(), 1)
+
+    def test_vote_sorted_result_is_not_cached(self):
+        question = self.post_question()
+        self.search_state.sort = 'votes-desc'
+        self.assertEquals(self.run_search().count(), 1)
+        models.Question.objects.filter(id = question.id).update(deleted = True)
+        self.assertEquals(self.run_search().count(), 0)
+
+class MarkdownCacheTests(TestCase):
+
+    def setUp(self):
+        self.old_timeout = markup.MARKDOWN_CACHE_TIMEOUT
+        markup.MARKDOWN_CACHE_TIMEOUT = 60
+
+    def tearDown(self):
+        markup.MARKDOWN_CACHE_TIMEOUT = self.old_timeout
+
+    def test_parser_is_reused(self):
+        self.assertTrue(markup.get_parser() is markup.get_parser())
+
+    def test_html_is_cached(self):
+        text = 'some *markdown* <script>alert(1)</script>'
+        html = markup.markdown_to_html(text)
+        self.assertTrue('<em>markdown</em>' in html)
+        self.assertTrue('<script>' not in html)
+
+        old_get_parser = markup.get_parser
+        def fail():
+            raise AssertionError('parser must not be used')
+        markup.get_parser = fail
+        try:
+            self.assertEquals(markup.markdown_to_html(text), html)
+        finally:
+            markup.get_parser = old_get_parser
+
+class RevisionDiffCacheTests(AskbotTestCase):
+
+    def setUp(self):
+        self.old_timeout = base_module.REVISION_DIFF_CACHE_TIMEOUT
+        base_module.REVISION_DIFF_CACHE_TIMEOUT = 60
+        self.create_user()
+        self.answer = self.post_answer(
+                        question = self.post_question(),
+                        body_text = 'first version of the answer'
+                    )
+        self.user.edit_answer(
+                        answer = self.answer,
+                        body_text = 'second version of the answer'
+                    )
+
+    def tearDown(self):
+        base_module.REVISION_DIFF_CACHE_TIMEOUT = self.old_timeout
+
+    def test_diff_is_cached_per_pair_of_revisions(self):
+        revisions = list(self.answer.revisions.all())
+        diff = revisions[0].get_diff_html(revisions[1])
+        self.assertTrue('<del>first </del><ins>second </ins>' in diff)
+
+        old_as_html = models.AnswerRevision.as_html
+        def fail(revision):
+            raise AssertionError('revision must not be rendered')
+        models.AnswerRevision.as_html = fail
+        try:
+            self.assertEquals(revisions[0].get_diff_html(revisions[1]), diff)
+            self.assertRaises(
+                AssertionError,
+                revisions[0].get_diff_html,
+                revisions[1],
+                ins_start = '<b>',
+                ins_end = '</b>'
+            )
+        finally:
+            models.AnswerRevision.as_html = old_as_html
+
+class AnonymousPageCacheTests(AskbotTestCase):
+
+    def setUp(self):
+        self.old_timeout = anon_page_cache.PAGE_CACHE_TIMEOUT
+        anon_page_cache.PAGE_CACHE_TIMEOUT = 60
+        anon_page_cache.renew_generation(anon_page_cache.LISTING_GENERATION_KEY)
+        self.middleware = anon_page_cache.AnonymousPageCacheMiddleware()
+        self.create_user()
+        self.question = self.post_question()
+        anon_page_cache.renew_generation(
+            anon_page_cache.QUESTION_GENERATION_KEY % self.question.id
+        )
+
+    def tearDown(self):
+        anon_page_cache.PAGE_CACHE_TIMEOUT = self.old_timeout
+
+    def make_request(self, query_string = '', method = 'GET', cookies = None):
+        request = HttpRequest()
+        request.method = method
+        request.path = '/'
+        request.GET = QueryDict(query_string)
+        request.COOKIES = cookies or dict()
+        return request
+
+    def get_listing(self, content, **kwargs):
+        """returns content of the listing page served by
+        the middleware, the content is "rendered" when the page
+        is not in the cache
+        """
+        return self.get_page(anon_page_cache.questions_view, {}, content, **kwargs)
+
+    def get_question_page(self, content, **kwargs):
+        return self.get_page(
+                        anon_page_cache.question_view,
+                        {'id': str(self.question.id)},
+                        content,
+                        **kwargs
+                    )
+
+    def get_page(self, view, view_kwargs, content, **kwargs):
+        request = self.make_request(**kwargs)
+        response = self.middleware.process_view(request, view, (), view_kwargs)
+        if response is None:
+            response = self.middleware.process_response(
+                                                request,
+                                                HttpResponse(content)
+                                            )
+        return response.content
+
+    def test_listing_is_cached(self):
+        self.assertEquals(self.get_listing('one'), 'one')
+        self.assertEquals(self.get_listing('two'), 'one')
+        self.assertEquals(self.get_listing('three', query_string = 'sort=age-asc'), 'three')
+
+    def test_question_page_is_cached(self):
+        self.assertEquals(self.get_question_page('one'), 'one')
+        self.assertEquals(self.get_question_page('two'), 'one')
+
+    def test_new_post_drops_cached_pages(self):
+        self.get_listing('one')
+        self.get_question_page('one')
+        self.post_answer(question = self.question)
+        self.assertEquals(self.get_listing('two'), 'two')
+        self.assertEquals(self.get_question_page('two'), 'two')
+
+    def test_vote_drops_cached_pages(self):
+        self.get_listing('one')
+        self.get_question_page('one')
+        voter = self.create_user(username = 'voter')
+        voter.reputation = askbot_settings.MIN_REP_TO_VOTE_UP
+        voter.upvote(self.question)
+        self.assertEquals(self.get_listing('two'), 'two')
+        self.assertEquals(self.get_question_page('two'), 'two')
+
+    def test_authenticated_requests_are_not_cached(self):
+        cookies = {'sessionid': 'abc'}
+        self.assertEquals(self.get_listing('one', cookies = cookies), 'one')
+        self.assertEquals(self.get_listing('two', cookies = cookies), 'two')
+        self.assertEquals(self.get_listing('three'), 'three')
+
+    def test_post_requests_are_not_cached(self):
+        self.assertEquals(self.get_question_page('one', method = 'POST'), 'one')
+        self.assertEquals(self.get_question_page('two', method = 'POST'), 'two')
+        self.assertEquals(self.get_question_page('three'), 'three')
+
+    def test_invalid_search_parameters_are_not_cached(self):
+        self.assertEquals(self.get_listing('one', query_string = 'sort=bad'), 'one')
+        self.assertEquals(self.get_listing('two', query_string = 'sort=bad'), 'two')
+        self.assertEquals(self.get_listing('three'), 'three')
@@ -3,8 +3,16 @@ functions that happen on behalf of users
 
 e.g. ``some_user.do_something(...)``
 """
+from django.conf import settings as django_settings
+from django.core.cache import cache
 from askbot.tests.utils import AskbotTestCase
 from askbot import models
+from askbot import tasks
+from askbot import const
+from askbot.search.state_manager import SearchState
+from askbot.utils import keyset
+from askbot.utils import deferred
+from askbot.utils import markup
 from askbot.conf import settings as askbot_settings
 import datetime
 
@@ -142,6 +150,25 @@ class DBApiTests(AskbotTestCase):
         count = models.Tag.objects.filter(name='one-tag').count()
         self.assertEquals(count, 0)
 
+    def test_get_votes_for_posts(self):
+        self.post_answer(user = self.other_user)
+        other_answer = self.answer
+        self.post_answer(user = self.other_user)
+        self.user.upvote(other_answer)
+        self.other_user.downvote(self.question)
+        votes = models.Vote.objects.get_votes_for_posts(
+                            user = self.user,
+                            posts = [self.question, other_answer, self.answer]
+                        )
+        self.assertEquals(len(votes), 1)
+        self.assertTrue(votes[other_answer].is_upvote())
+        votes = models.Vote.objects.get_votes_for_posts(
+                            user = self.other_user,
+                            posts = [self.question, other_answer]
+                        )
+        self.assertEquals(len(votes), 1)
+        self.assertTrue(votes[self.question].is_downvote())
+
 class UserLikeTests(AskbotTestCase):
     def setUp(self):
         self.create_user()
@@ -226,3 +253,361 @@ class UserLikeTests(AskbotTestCase):
         self.assert_affinity_is('like', False)
         self.assert_affinity_is('dislike', False)
 
+
+class TagCooccurrenceTests(AskbotTestCase):
+    def setUp(self):
+        self.create_user()
+        self.question1 = self.post_question(tags = 'one two three')
+        self.question2 = self.post_question(tags = 'one two')
+
+    def get_related_counts(self, *tag_names):
+        tag_ids = models.Tag.objects.filter(
+                                name__in = tag_names
+                            ).values_list('id', flat = True)
+        related_counts = models.TagCooccurrence.objects.get_related_counts(
+                                                                    tag_ids
+                                                                )
+        named_counts = dict()
+        for tag in models.Tag.objects.filter(id__in = related_counts.keys()):
+            named_counts[tag.name] = related_counts[tag.id]
+        return named_counts
+
+    def test_counts_are_added_with_questions(self):
+        self.assertEquals(
+            self.get_related_counts('one'),
+            {'two': 2, 'three': 1}
+        )
+        self.assertEquals(
+            self.get_related_counts('one', 'three'),
+            {'two': 1}
+        )
+
+    def test_counts_follow_retagging(self):
+        self.user.retag_question(self.question1, tags = 'one four')
+        self.assertEquals(
+            self.get_related_counts('one'),
+            {'two': 1, 'four': 1}
+        )
+        self.assertEquals(self.get_related_counts('two'), {'one': 1})
+
+    def test_counts_follow_deletion_and_restoring(self):
+        self.user.delete_question(self.question1)
+        self.assertEquals(self.get_related_counts('one'), {'two': 1})
+        self.user.restore_post(self.question1)
+        self.assertEquals(
+            self.get_related_counts('one'),
+            {'two': 2, 'three': 1}
+        )
+
+    def test_counts_follow_removal(self):
+        self.question1.delete()
+        self.assertEquals(self.get_related_counts('one'), {'two': 1})
+        self.assertEquals(self.get_related_counts('three'), {})
+
+    def test_pairs_are_grouped_by_related_tags(self):
+        manager = models.TagCooccurrence.objects
+        pairs = manager.get_tag_pairs([1, 2, 3]) - manager.get_tag_pairs([2, 3])
+        groups = manager.group_pairs(pairs)
+        groups = [(sorted(tag_ids), related_ids) for tag_ids, related_ids in groups]
+        groups.sort()
+        self.assertEquals(groups, [([1], [2, 3]), ([2, 3], [1])])
+
+    def test_rebuild(self):
+        expected_counts = self.get_related_counts('two')
+        models.TagCooccurrence.objects.all().delete()
+        models.TagCooccurrence.objects.rebuild()
+        self.assertEquals(self.get_related_counts('two'), expected_counts)
+
+    def test_get_related_to_tags(self):
+        tags = models.Tag.objects.get_related_to_tags(
+                                    tag_names = set(['one']),
+                                    ignored_tag_names = ['three']
+                                )
+        self.assertEquals(len(tags), 1)
+        self.assertEquals(tags[0].name, 'two')
+        self.assertEquals(tags[0].local_used_count, 2)
+
+    def test_get_related_to_search_counts_listed_questions(self):
+        search_state = SearchState()
+        questions = models.Question.objects.filter(id = self.question1.id)
+        tags = models.Tag.objects.get_related_to_search(
+                                    questions = questions,
+                                    search_state = search_state
+                                )
+        self.assertEquals(
+            set([(tag.name, tag.local_used_count) for tag in tags]),
+            set([('one', 1), ('two', 1), ('three', 1)])
+        )
+
+
+class SimilarQuestionTests(AskbotTestCase):
+    def setUp(self):
+        self.create_user()
+        self.question1 = self.post_question(tags = 'one two three')
+        self.question2 = self.post_question(tags = 'one two')
+        self.question3 = self.post_question(tags = 'three')
+        self.question4 = self.post_question(tags = 'four')
+
+    def test_questions_are_ordered_by_similarity(self):
+        self.assertEquals(
+            self.question1.get_similar_questions().data(),
+            [self.question2, self.question3]
+        )
+
+    def test_new_question_is_added_to_similar_questions(self):
+        #question3 was posted after question2 and still was added
+        self.assertEquals(
+            self.question2.get_similar_questions().data(),
+            [self.question1]
+        )
+        self.assertEquals(
+            self.question3.get_similar_questions().data(),
+            [self.question1]
+        )
+
+    def test_retagging_updates_similar_questions(self):
+        self.user.retag_question(self.question4, tags = 'one two')
+        self.assertEquals(
+            self.question4.get_similar_questions().data(),
+            [self.question2, self.question1]
+        )
+        self.assertEquals(
+            self.question2.get_similar_questions().data()[0],
+            self.question4
+        )
+
+    def test_deleted_questions_are_not_shown(self):
+        self.user.delete_question(self.question2)
+        self.assertEquals(
+            self.question1.get_similar_questions().data(),
+            [self.question3]
+        )
+
+    def shorten_lists(self):
+        """keeps one similar question per question"""
+        from askbot.models import question as question_module
+        self.old_count = question_module.SIMILAR_QUESTIONS_COUNT
+        question_module.SIMILAR_QUESTIONS_COUNT = 1
+        models.SimilarQuestion.objects.rebuild([self.question1])
+        self.assertEquals(
+            self.question1.get_similar_questions().data(),
+            [self.question2]
+        )
+
+    def restore_lists(self):
+        from askbot.models import question as question_module
+        question_module.SIMILAR_QUESTIONS_COUNT = self.old_count
+
+    def test_lists_are_filled_up_after_delete(self):
+        self.shorten_lists()
+        try:
+            self.user.delete_question(self.question2)
+            self.assertEquals(
+                self.question1.get_similar_questions().data(),
+                [self.question3]
+            )
+        finally:
+            self.restore_lists()
+
+    def test_lists_are_filled_up_after_removal(self):
+        self.shorten_lists()
+        try:
+            self.question2.delete()
+            self.assertEquals(
+                self.question1.get_similar_questions().data(),
+                [self.question3]
+            )
+        finally:
+            self.restore_lists()
+
+class ActivityRecipientsTests(AskbotTestCase):
+    def setUp(self):
+        self.user = self.create_user()
+        self.recipient1 = self.create_user('recipient1')
+        self.recipient2 = self.create_user('recipient2')
+        question = self.post_question()
+        self.activity = models.Activity(
+                            user = self.user,
+                            content_object = question,
+                            activity_type = const.TYPE_ACTIVITY_ANSWER,
+                            question = question
+                        )
+        self.activity.save()
+
+    def test_add_recipients(self):
+        self.activity.add_recipients(
+            [self.recipient1, self.recipient2, self.recipient1]
+        )
+        self.assertEquals(
+            set(self.activity.recipients.all()),
+            set([self.recipient1, self.recipient2])
+        )
+        statuses = models.ActivityAuditStatus.objects.filter(
+                                                activity = self.activity
+                                            )
+        for status in statuses:
+            self.assertTrue(status.is_new())
+
+    def test_increment_response_counts(self):
+        self.recipient1.new_response_count = 2
+        self.recipient1.save()
+        models.increment_response_counts([self.recipient1, self.recipient2])
+        self.assertEquals(
+            self.reload_object(self.recipient1).new_response_count,
+            3
+        )
+        self.assertEquals(
+            self.reload_object(self.recipient2).new_response_count,
+            1
+        )
+
+
+class KeysetPaginationTests(AskbotTestCase):
+    def setUp(self):
+        self.create_user()
+        timestamp = datetime.datetime(2011, 1, 1, 10, 30, 15, 250)
+        for title in ('first', 'second', 'third', 'fourth', 'fifth'):
+            #two questions per timestamp, to test the tie breaker
+            self.post_question(title = title, timestamp = timestamp)
+            if title in ('second', 'fourth'):
+                timestamp += datetime.timedelta(seconds = 1)
+        self.questions = models.Question.objects.order_by(
+                                    '-added_at',
+                                    keyset.get_tie_breaker('-added_at')
+                                )
+
+    def test_cursor_roundtrip(self):
+        question = self.questions[0]
+        cursor = keyset.get_cursor(question, '-added_at')
+        self.assertEquals(
+            keyset.parse_cursor(cursor),
+            (question.added_at, question.id)
+        )
+        self.assertRaises(ValueError, keyset.parse_cursor, 'i12')
+        self.assertRaises(ValueError, keyset.parse_cursor, 'x12_3')
+
+    def test_pages_after_cursor_match_pages_by_offset(self):
+        paginator = keyset.KeysetPaginator(
+                                self.questions,
+                                2,
+                                order_by = '-added_at'
+                            )
+        self.assertEquals(paginator.num_pages, 3)
+        page = paginator.page(1)
+        number = 1
+        while page.has_next():
+            cursor = page.get_end_cursor()
+            number = page.next_page_number()
+            page = paginator.page(number, cursor = cursor)
+            offset_page = paginator.page(number)
+            self.assertEquals(page.object_list, offset_page.object_list)
+        self.assertEquals(number, 3)
+        self.assertEquals(len(page.object_list), 1)
+
+class DeferredTaskTests(AskbotTestCase):
+
+    def setUp(self):
+        self.pings = list()
+        self.old_ping_google = tasks.ping_google
+        tasks.ping_google = lambda: self.pings.append(True)
+        self.old_eager = getattr(django_settings, 'CELERY_ALWAYS_EAGER', False)
+        django_settings.CELERY_ALWAYS_EAGER = True
+        self.old_thread = deferred.DEFERRED_TASK_THREAD
+        self.old_task_runner = deferred.task_runner
+        #trailing pings are queued to a runner without a thread
+        self.queued = list()
+        deferred.task_runner = deferred.DeferredTaskRunner()
+        deferred.task_runner.put = lambda task, kwargs: \
+                                    self.queued.append((task, kwargs))
+        askbot_settings.update('GOOGLE_SITEMAP_CODE', 'test')
+        cache.delete(tasks.SITEMAP_PING_CACHE_KEY)
+        cache.delete(tasks.SITEMAP_PING_PENDING_CACHE_KEY)
+
+    def tearDown(self):
+        askbot_settings.update('GOOGLE_SITEMAP_CODE', '')
+        tasks.ping_google = self.old_ping_google
+        django_settings.CELERY_ALWAYS_EAGER = self.old_eager
+        deferred.DEFERRED_TASK_THREAD = self.old_thread
+        deferred.task_runner = self.old_task_runner
+
+    def test_sitemap_ping_is_debounced(self):
+        deferred.DEFERRED_TASK_THREAD = True
+        tasks.schedule_google_ping()
+        tasks.schedule_google_ping()
+        tasks.schedule_google_ping()
+        self.assertEquals(len(self.pings), 1)
+
+    def test_trailing_ping_is_dropped_without_thread(self):
+        deferred.DEFERRED_TASK_THREAD = False
+        tasks.schedule_google_ping()
+        tasks.schedule_google_ping()
+        self.assertEquals(len(self.pings), 1)
+
+    def test_tasks_wait_for_the_end_of_request(self):
+        runner = deferred.DeferredTaskRunner()
+        queued = list()
+        runner.put = lambda task, kwargs: queued.append((task, kwargs))
+        runner.start_request()
+        runner.add(tasks.ping_google_task, {})
+        self.assertEquals(queued, [])
+        runner.finish_request()
+        self.assertEquals(queued, [(tasks.ping_google_task, {})])
+
+    def test_tasks_outside_of_request_are_run_inline(self):
+        runner = deferred.DeferredTaskRunner()
+        queued = list()
+        runner.put = lambda task, kwargs: queued.append((task, kwargs))
+        calls = list()
+        def task(**kwargs):
+            calls.append(kwargs)
+        task.name = 'task'
+        runner.add(task, {'value': 1})
+        self.assertEquals(calls, [{'value': 1}])
+        self.assertEquals(queued, [])
+
+    def test_mentions_are_recorded(self):
+        self.create_user(username = 'author')
+        self.create_user(username = 'reader')
+        question = self.post_question(user = self.author)
+        self.post_comment(
+                    user = self.author,
+                    parent_post = question,
+                    body_text = 'hello @reader'
+                )
+        mentions = models.Activity.objects.filter(
+                                activity_type = const.TYPE_ACTIVITY_MENTION
+                            )
+        self.assertEquals(mentions.count(), 1)
+        self.assertEquals(mentions[0].get_mentioned_user(), self.reader)
+
+class MentionTests(AskbotTestCase):
+
+    def setUp(self):
+        self.create_user(username = 'bob')
+        self.create_user(username = 'bobby')
+
+    def test_mentionize_text(self):
+        users = [self.bob, self.bobby]
+        mentioned, html = markup.mentionize_text(
+                                        '@bobby, hi@bob and @bob!',
+                                        users
+                                    )
+        self.assertEquals(mentioned, [self.bobby, self.bob])
+        self.assertEquals(
+            html,
+            markup.format_mention_in_html(self.bobby) + ', hi@bob and ' \
+            + markup.format_mention_in_html(self.bob) + '!'
+        )
+
+    def test_listed_first_user_wins(self):
+        bob_smith = self.create_user(username = 'bob smith')
+        mentioned, html = markup.mentionize_text(
+                                        'hi @bob smith',
+                                        [bob_smith, self.bob]
+                                    )
+        self.assertEquals(mentioned, [bob_smith])
+        mentioned, html = markup.mentionize_text(
+                                        'hi @bob smith',
+                                        [self.bob, bob_smith]
+                                    )
+        self.assertEquals(mentioned, [self.bob])
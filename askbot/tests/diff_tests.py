@@ -0,0 +1,60 @@
+import random
+from django.test import TestCase
+from askbot.utils.diff import textDiff, html2list, TokenMatcher
+
+class TextDiffTests(TestCase):
+
+    def get_matched_count(self, opcodes):
+        return sum([i2 - i1 for tag, i1, i2, j1, j2 in opcodes if tag == 'equal'])
+
+    def assert_valid_opcodes(self, a, b, opcodes):
+        i = j = 0
+        for tag, i1, i2, j1, j2 in opcodes:
+            self.assertEquals((i1, j1), (i, j))
+            if tag == 'equal':
+                self.assertEquals(a[i1:i2], b[j1:j2])
+            i, j = i2, j2
+        self.assertEquals((i, j), (len(a), len(b)))
+
+    def test_html2list(self):
+        self.assertEquals(
+            html2list('<p class="x">some  text</p>\nend<br'),
+            ['<p class="x">', 'some ', ' ', 'text', '</p>', '\n', 'end', '<br']
+        )
+        self.assertEquals(html2list('a <b>', b = 1), ['a ', '[b]'])
+
+    def test_text_diff(self):
+        self.assertEquals(
+            textDiff('<p>one two three</p>', '<p>one 2 three</p>'),
+            '<p>one <del>two </del><ins>2 </ins>three</p>'
+        )
+        self.assertEquals(
+            textDiff('a b', 'a c', ins_start = '[', ins_end = ']',
+                    del_start = '{', del_end = '}'),
+            'a {b}[c]'
+        )
+
+    def test_repeated_tokens_are_matched(self):
+        a = ['the ', 'a ', '<p>', '</p>'] * 500
+        b = list(a)
+        b[1000:1000] = ['inserted ']
+        del b[10]
+        opcodes = TokenMatcher(a, b).get_opcodes()
+        self.assert_valid_opcodes(a, b, opcodes)
+        self.assertEquals(self.get_matched_count(opcodes), len(a) - 1)
+
+    def test_random_edits(self):
+        generator = random.Random(1)
+        for i in xrange(200):
+            a = [generator.choice('abcd') for k in xrange(generator.randint(0, 40))]
+            b = [generator.choice('abcd') for k in xrange(generator.randint(0, 40))]
+            self.assert_valid_opcodes(a, b, TokenMatcher(a, b).get_opcodes())
+
+    def test_work_limit(self):
+        a = ['x ', 'y '] * 100
+        b = ['y ', 'x '] * 100
+        opcodes = TokenMatcher(a, b, max_work = 10).get_opcodes()
+        self.assertEquals(opcodes, [('replace', 0, 200, 0, 200)])
+        opcodes = TokenMatcher(a, b).get_opcodes()
+        self.assert_valid_opcodes(a, b, opcodes)
+        self.assertEquals(self.get_matched_count(opcodes), 199)
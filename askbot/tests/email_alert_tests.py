@@ -1,6 +1,10 @@
 import datetime
 import functools
 import copy
+import os
+import shutil
+import smtplib
+import tempfile
 from django.conf import settings as django_settings
 from django.core import management
 import django.core.mail
@@ -9,6 +13,7 @@ from django.test import TestCase
 from django.test.client import Client
 from askbot.tests import utils
 from askbot import models
+from askbot import const
 from askbot.utils import mail
 from askbot.conf import settings as askbot_settings
 
@@ -531,6 +536,13 @@ class WeeklyQAnsEmailAlertTests(EmailAlertTests):
         self.expected_results['answer_edit'] = {'message_count': 1, }
         self.expected_results['q_ans_new_answer'] = {'message_count': 1, }
 
+class ParallelWeeklyQAskEmailAlertTests(WeeklyQAskEmailAlertTests):
+    """same as the weekly alerts, but the messages
+    are prepared in batches of one user and sent by two threads
+    """
+    def send_alerts(self):
+        management.call_command('send_email_alerts', batch_size = 1, workers = 2)
+
 class InstantQAskEmailAlertTests(EmailAlertTests):
     @setup_email_alert_tests
     def setUp(self):
@@ -701,6 +713,45 @@ class DelayedAlertSubjectLineTests(TestCase):
                 sorted(order)
             )
 
+class SendDigestsTests(TestCase):
+    def setUp(self):
+        self.old_get_connection = mail.get_connection
+        class Connection(object):
+            def close(self):
+                pass
+        mail.get_connection = Connection
+
+    def tearDown(self):
+        mail.get_connection = self.old_get_connection
+
+    def assert_sent_digests_are_reported(self, worker_count):
+        from askbot.management.commands import send_email_alerts as cmd
+        class Digest(object):
+            def __init__(self, name, fails):
+                self.name = name
+                self.fails = fails
+                self.sent = False
+            def send(self, connection):
+                self.sent = not self.fails
+        digests = [
+            Digest('first', False),
+            Digest('second', True),
+            Digest('third', False)
+        ]
+        reported = list()
+        cmd.send_digests(
+                digests,
+                worker_count,
+                on_sent = lambda digest: reported.append(digest.name)
+            )
+        self.assertEquals(sorted(reported), ['first', 'third'])
+
+    def test_sent_digests_are_reported(self):
+        self.assert_sent_digests_are_reported(1)
+
+    def test_sent_digests_are_reported_by_workers(self):
+        self.assert_sent_digests_are_reported(2)
+
 class FeedbackTests(utils.AskbotTestCase):
     def setUp(self):
         self.create_user(username = 'user1', status='m')
@@ -731,3 +782,190 @@ class FeedbackTests(utils.AskbotTestCase):
         mail.mail_moderators('subject', 'text')
         self.assert_feedback_works()
 
+
+
+class InstantNotificationSubscribersTests(utils.AskbotTestCase):
+    def setUp(self):
+        self.create_user(username = 'author')
+        no_email = models.EmailFeedSetting.NO_EMAIL_SCHEDULE
+        whole_forum = copy.copy(no_email)
+        whole_forum['q_all'] = 'i'
+        self.create_user(username = 'subscriber', notification_schedule = whole_forum)
+        self.create_user(username = 'ignorer', notification_schedule = whole_forum)
+        self.create_user(username = 'bystander', notification_schedule = no_email)
+        self.bystander.email_tag_filter_strategy = const.INCLUDE_ALL
+        self.bystander.save()
+        self.ignorer.mark_tags(['apple'], [], reason = 'bad', action = 'add')
+        self.question = self.post_question(user = self.author, tags = 'apple')
+
+    def test_whole_forum_subscribers_pass_tag_filters(self):
+        subscribers = self.question.get_instant_notification_subscribers(
+                                            exclude_list = [self.author]
+                                        )
+        self.assertEquals(subscribers, [self.subscriber])
+
+
+class EmailSpoolTests(TestCase):
+    def setUp(self):
+        self.old_spool_dir = mail.EMAIL_SPOOL_DIR
+        self.temp_dir = tempfile.mkdtemp()
+        mail.EMAIL_SPOOL_DIR = self.temp_dir
+        self.old_get_connection = mail.get_connection
+        django.core.mail.outbox = []
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+        mail.EMAIL_SPOOL_DIR = self.old_spool_dir
+        mail.get_connection = self.old_get_connection
+
+    def spool_messages(self, count):
+        for i in xrange(count):
+            mail.send_mail(
+                subject_line = 'subject',
+                body_text = 'text',
+                recipient_list = ['one@example.com']
+            )
+
+    def test_spooled_messages_are_sent_by_the_command(self):
+        mail.send_mail(
+            subject_line = 'first',
+            body_text = 'text',
+            recipient_list = ['one@example.com']
+        )
+        messages = [
+            mail.make_message(
+                subject_line = 'second',
+                body_text = 'text',
+                recipient_list = ['two@example.com']
+            )
+        ]
+        self.assertEquals(mail.send_messages(messages), 1)
+        self.assertEquals(len(django.core.mail.outbox), 0)
+        self.assertEquals(len(mail.get_spooled_message_paths()), 2)
+
+        management.call_command('send_spooled_email')
+        self.assertEquals(len(django.core.mail.outbox), 2)
+        self.assertEquals(len(os.listdir(mail.EMAIL_SPOOL_DIR)), 0)
+
+    def test_spool_directory_is_created(self):
+        mail.EMAIL_SPOOL_DIR = os.path.join(self.temp_dir, 'spool')
+        self.assertEquals(mail.get_spooled_message_paths(), [])
+        self.spool_messages(1)
+        self.assertEquals(len(mail.get_spooled_message_paths()), 1)
+
+    def test_messages_stay_in_spool_without_connection(self):
+        self.spool_messages(2)
+        def get_connection():
+            raise smtplib.SMTPConnectError(421, 'unavailable')
+        mail.get_connection = get_connection
+        management.call_command('send_spooled_email')
+        self.assertEquals(len(django.core.mail.outbox), 0)
+        self.assertEquals(len(mail.get_spooled_message_paths()), 2)
+
+    def test_connection_is_reopened_after_disconnect(self):
+        self.spool_messages(2)
+        connections = list()
+        class Connection(object):
+            def __init__(self, disconnected):
+                self.disconnected = disconnected
+                self.sent_messages = list()
+            def send_messages(self, messages):
+                if self.disconnected:
+                    raise smtplib.SMTPServerDisconnected('disconnected')
+                self.sent_messages.extend(messages)
+                return len(messages)
+            def close(self):
+                pass
+        def get_connection():
+            connections.append(Connection(len(connections) == 0))
+            return connections[-1]
+        mail.get_connection = get_connection
+        management.call_command('send_spooled_email')
+        self.assertEquals(len(connections), 2)
+        self.assertEquals(len(connections[1].sent_messages), 2)
+        self.assertEquals(len(os.listdir(mail.EMAIL_SPOOL_DIR)), 0)
+
+    def test_batch_is_stopped_when_server_disconnects_again(self):
+        self.spool_messages(2)
+        class Connection(object):
+            def send_messages(self, messages):
+                raise smtplib.SMTPServerDisconnected('disconnected')
+            def close(self):
+                pass
+        mail.get_connection = Connection
+        management.call_command('send_spooled_email')
+        self.assertEquals(len(mail.get_spooled_message_paths()), 2)
+
+    def test_send_messages_without_spool(self):
+        messages = [
+            mail.make_message(
+                subject_line = 'subject',
+                body_text = 'text',
+                recipient_list = [email]
+            ) for email in ('one@example.com', 'two@example.com')
+        ]
+        self.assertEquals(mail.send_messages(messages, spool = False), 2)
+        self.assertEquals(len(django.core.mail.outbox), 2)
+
+    def test_refused_recipient_does_not_stop_the_others(self):
+        class Connection(object):
+            def __init__(self):
+                self.sent_messages = list()
+            def send_messages(self, messages):
+                for msg in messages:
+                    if 'bad@example.com' in msg.to:
+                        raise smtplib.SMTPRecipientsRefused(
+                            {'bad@example.com': (550, 'no such user')}
+                        )
+                self.sent_messages.extend(messages)
+                return len(messages)
+            def close(self):
+                pass
+        connection = Connection()
+        mail.get_connection = lambda: connection
+        messages = [
+            mail.make_message(
+                subject_line = 'subject',
+                body_text = 'text',
+                recipient_list = [email]
+            ) for email in (
+                'one@example.com', 'bad@example.com', 'two@example.com'
+            )
+        ]
+        self.assertEquals(mail.send_messages(messages, spool = False), 2)
+        self.assertEquals(
+            [msg.to for msg in connection.sent_messages],
+            [['one@example.com'], ['two@example.com']]
+        )
+
+
+class InstantNotificationFormatterTests(utils.AskbotTestCase):
+    def setUp(self):
+        self.create_user(username = 'author')
+        self.create_user(username = 'reader1')
+        self.create_user(username = 'reader2')
+        self.question = self.post_question(user = self.author)
+        self.question.apply_edit(
+                        edited_by = self.author,
+                        text = 'edited question text',
+                        comment = 'edit'
+                    )
+
+    def test_formatter_matches_single_message(self):
+        from askbot.skins.loaders import get_template
+        template = get_template('instant_notification.html')
+        formatter = models.InstantNotificationFormatter(
+                                from_user = self.author,
+                                post = self.question,
+                                update_type = 'question_update',
+                                template = template
+                            )
+        for user in (self.reader1, self.reader2):
+            expected = models.format_instant_notification_email(
+                                to_user = user,
+                                from_user = self.author,
+                                post = self.question,
+                                update_type = 'question_update',
+                                template = template
+                            )
+            self.assertEquals(formatter.format(user), expected)
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+import random
+from django.test import TestCase
+from askbot.utils import markup
+from askbot.utils.html import sanitize_html_html5lib, sanitize_html_fast
+from askbot.utils.html import FastHTMLSanitizer, UnsupportedMarkup
+
+MARKDOWN_SAMPLES = (
+    u'# Heading\n\nsome **bold** and _emphasized_ text',
+    u'* one\n* two\n\n    * nested\n\n1. first\n2. second',
+    u'    def f(x):\n        return x < 1 and x > 0 & 1',
+    u'> quote\n> > nested quote\n\n---',
+    u'[link](http://example.com/?a=1&b=2 "title") and ![image](/img.png "t")',
+    u'[bad link](javascript:alert(1)) <http://askbot.org/>',
+    u'mail <user@example.com> and `code <b>&amp;</b>`',
+    u'<script>alert(1)</script> <div onclick="x()">raw html</div>',
+    u'<a href="http://x.com" style="color:red" title="&quot;q&quot;">a</a>',
+    u'unicode текст é &copy; &nbsp; &#8212; &#x41;',
+    u'a <!-- comment --> b <? pi ?> <!DOCTYPE html>',
+    u'<p>unclosed <b>bold\n\n<table><tr><td>cell</td></tr></table>',
+    u'<pre>\ncode</pre> <ul><li>a<li>b</ul>',
+)
+
+#pieces of markup, random concatenations of which are sanitized
+#by both engines in the differential test
+MARKUP_PIECES = (
+    u'<p>', u'</p>', u'<b>', u'</b>', u'<em>', u'</em>', u'<div>', u'</div>',
+    u'<ul>', u'</ul>', u'<li>', u'</li>', u'<pre>', u'</pre>', u'<code>',
+    u'</code>', u'<h2>', u'</h2>', u'<blockquote>', u'</blockquote>',
+    u'<a href="http://x.com/?a=1&amp;b=2" title=\'a "b"\'>', u'</a>',
+    u'<a href=javascript:alert(1) NAME=x>', u'<A HREF="  JaVa&#09;script:x">',
+    u'<img src="/i.png" alt="a&b" onerror="x()"/>', u'<br>', u'<hr />',
+    u'<span title="">', u'</span>', u'<font color=red>', u'</font>',
+    u'<script>', u'</script>', u'<foo bar="&lt;1&gt;"/>', u'</foo>',
+    u'<table>', u'<td>', u'</br>', u'<!-- c -->', u'<!-->', u'<?x?>',
+    u'text', u' ', u'\n', u'\t', u'a & b', u'&amp;', u'&lt;', u'&gt;',
+    u'&quot;', u'&copy;', u'&copy', u'&#106;', u'&#x6A;', u'&#0;', u'&#128;',
+    u'<', u'>', u'<3', u'</', u'"', u"'", u'=', u'é', u'\r\n',
+)
+
+class HTMLSanitizerTests(TestCase):
+
+    def assert_same_output(self, html):
+        self.assertEquals(sanitize_html_fast(html), sanitize_html_html5lib(html))
+
+    def test_markdown_output(self):
+        parser = markup.get_parser()
+        for text in MARKDOWN_SAMPLES:
+            self.assert_same_output(parser.convert(text))
+
+    def test_random_markup(self):
+        generator = random.Random(1)
+        for i in xrange(500):
+            piece_count = generator.randint(1, 12)
+            html = u''.join(
+                [generator.choice(MARKUP_PIECES) for j in xrange(piece_count)]
+            )
+            self.assert_same_output(html)
+
+    def test_markdown_output_takes_fast_path(self):
+        html = markup.get_parser().convert(
+            u'## Title\n\n* item with `code & <tags>`\n\n'
+            u'[link](http://example.com/?a=1&b=2 "t")'
+        )
+        self.assertEquals(
+            FastHTMLSanitizer(html).sanitize(),
+            sanitize_html_html5lib(html)
+        )
+
+    def test_unusual_markup_is_left_to_html5lib(self):
+        for html in (
+                    u'<p>a<div>b</div></p>',
+                    u'<b><i>x</b></i>',
+                    u'<table><tr><td>x</td></tr></table>',
+                    u'a &copy b',
+                    u'<a href=x title=y title=z>',
+                    u'line\r\nbreak',
+                ):
+            self.assertRaises(
+                UnsupportedMarkup,
+                FastHTMLSanitizer(html).sanitize
+            )
+            self.assert_same_output(html)
+
+    def test_disallowed_markup_is_removed(self):
+        html = u'<a href="javascript:x()" onclick="y()">a</a>' \
+                + u'<script>z()</script><!-- c -->'
+        self.assertEquals(
+            sanitize_html_fast(html),
+            u'<a>a</a>&lt;script&gt;z()&lt;/script&gt;'
+        )
@@ -2,6 +2,7 @@ from django.core import management
 from django.contrib import auth
 from askbot.tests.utils import AskbotTestCase
 from askbot import models
+from askbot.conf import settings as askbot_settings
 
 class ManagementCommandTests(AskbotTestCase):
     def test_add_askbot_user(self):
@@ -27,3 +28,36 @@ class ManagementCommandTests(AskbotTestCase):
         #try to log in
         user = auth.authenticate(username = username, password = password)
         self.assertTrue(user is not None)
+
+    def test_recompute_badges(self):
+        user = self.create_user()
+        question = self.post_question(user = user)
+        min_views = askbot_settings.POPULAR_QUESTION_BADGE_MIN_VIEWS
+        models.Question.objects.filter(
+                                id = question.id
+                            ).update(view_count = min_views)
+
+        management.call_command('recompute_badges', badge = 'popular-question')
+        awards = models.Award.objects.filter(
+                                user = user,
+                                badge__slug = 'popular-question'
+                            )
+        self.assertEquals(awards.count(), 1)
+        self.assertEquals(awards[0].content_object, question)
+        self.assertEquals(self.reload_object(user).bronze, 1)
+        badge_data = models.BadgeData.objects.get(slug = 'popular-question')
+        self.assertEquals(badge_data.awarded_count, 1)
+
+        #running again does not duplicate the award
+        management.call_command('recompute_badges', badge = 'popular-question')
+        self.assertEquals(awards.count(), 1)
+
+        askbot_settings.update('POPULAR_QUESTION_BADGE_MIN_VIEWS', min_views + 1)
+        management.call_command(
+                            'recompute_badges',
+                            badge = 'popular-question',
+                            delete_undeserved = True
+                        )
+        askbot_settings.update('POPULAR_QUESTION_BADGE_MIN_VIEWS', min_views)
+        self.assertEquals(awards.count(), 0)
+        self.assertEquals(self.reload_object(user).bronze, 0)
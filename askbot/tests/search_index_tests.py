@@ -0,0 +1,151 @@
+import os
+import shutil
+import tempfile
+from django.conf import settings as django_settings
+from django.test import TestCase
+from askbot import models
+from askbot.search import backends
+from askbot.search import inverted_index
+from askbot.search.inverted_index import InvertedIndex, get_document
+from askbot.tests.utils import AskbotTestCase
+
+class FakeQuestion(object):
+    def __init__(self, title = '', tagnames = '', text = ''):
+        self.title = title
+        self.tagnames = tagnames
+        self.text = text
+
+class InvertedIndexTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.index = InvertedIndex(self.directory)
+        self.index.load()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def add_question(self, question_id, title, tagnames = '', text = ''):
+        question = FakeQuestion(title, tagnames, text)
+        self.index.update(question_id, get_document(question))
+
+    def get_ids(self, query, index = None):
+        if index is None:
+            index = self.index
+        return [question_id for question_id, score in index.search(query)]
+
+    def test_all_words_must_match(self):
+        self.add_question(1, 'How to install askbot', 'django')
+        self.add_question(2, 'How to upgrade django')
+        self.assertEquals(set(self.get_ids('how to')), set([1, 2]))
+        self.assertEquals(self.get_ids('django askbot'), [1])
+        self.assertEquals(self.get_ids('flask'), [])
+
+    def test_title_weighs_more_than_text(self):
+        self.add_question(1, 'Question about mail', text = 'smtp server')
+        self.add_question(2, 'Smtp server settings')
+        self.assertEquals(self.get_ids('smtp'), [2, 1])
+
+    def test_update_replaces_words(self):
+        self.add_question(1, 'Old title')
+        self.add_question(1, 'New title')
+        self.assertEquals(self.get_ids('old'), [])
+        self.assertEquals(self.get_ids('new'), [1])
+        self.index.update(1, dict())
+        self.assertEquals(self.get_ids('new'), [])
+
+    def test_updates_of_other_process_are_read(self):
+        other_index = InvertedIndex(self.directory)
+        other_index.load()
+        self.add_question(1, 'Journal record')
+        other_index.refresh()
+        self.assertEquals(self.get_ids('journal', index = other_index), [1])
+
+    def test_snapshot_is_reloaded_after_rebuild(self):
+        self.add_question(1, 'Before rebuild')
+        other_index = InvertedIndex(self.directory)
+        other_index.load()
+        self.index.clear()
+        self.index.add_document(2, {'after': 1})
+        self.index.save()
+        other_index.refresh()
+        self.assertEquals(self.get_ids('before', index = other_index), [])
+        self.assertEquals(self.get_ids('after', index = other_index), [2])
+
+    def test_update_creates_directory(self):
+        directory = os.path.join(self.directory, 'not', 'created')
+        index = InvertedIndex(directory)
+        index.load()
+        index.update(1, {'word': 1})
+        other_index = InvertedIndex(directory)
+        other_index.load()
+        self.assertEquals(self.get_ids('word', index = other_index), [1])
+
+    def test_corrupt_record_is_skipped(self):
+        self.add_question(1, 'First record')
+        journal = open(self.index.journal_path, 'ab')
+        journal.write('torn\n')
+        journal.close()
+        self.add_question(2, 'Second record')
+        other_index = InvertedIndex(self.directory)
+        other_index.load()
+        self.assertEquals(
+            set(self.get_ids('record', index = other_index)),
+            set([1, 2])
+        )
+        self.add_question(3, 'Third record')
+        other_index.refresh()
+        self.assertEquals(
+            set(self.get_ids('record', index = other_index)),
+            set([1, 2, 3])
+        )
+
+    def test_journal_is_compacted(self):
+        old_max_size = inverted_index.MAX_JOURNAL_SIZE
+        inverted_index.MAX_JOURNAL_SIZE = 100
+        try:
+            for question_id in range(1, 6):
+                self.add_question(question_id, 'Question number %d' % question_id)
+        finally:
+            inverted_index.MAX_JOURNAL_SIZE = old_max_size
+        self.assertTrue(os.path.getsize(self.index.journal_path) <= 100)
+        other_index = InvertedIndex(self.directory)
+        other_index.load()
+        self.assertEquals(
+            set(self.get_ids('question', index = other_index)),
+            set([1, 2, 3, 4, 5])
+        )
+
+
+class InvertedIndexSearchBackendTests(AskbotTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.old_directory = getattr(
+                                django_settings,
+                                'ASKBOT_SEARCH_INDEX_DIR',
+                                None
+                            )
+        django_settings.ASKBOT_SEARCH_INDEX_DIR = self.directory
+        self.backend = backends.InvertedIndexSearchBackend()
+
+    def tearDown(self):
+        django_settings.ASKBOT_SEARCH_INDEX_DIR = self.old_directory
+        shutil.rmtree(self.directory)
+
+    def test_many_matches_are_ranked(self):
+        user = self.create_user()
+        best = self.post_question(user = user, title = 'common common')
+        other = self.post_question(user = user, title = 'common')
+        self.backend.update_question(best)
+        self.backend.update_question(other)
+        #more matches than sqlite allows bound variables in one query
+        first_id = max(best.id, other.id) + 1
+        for question_id in xrange(first_id, first_id + 400):
+            self.backend.index.update(question_id, {'common': 1})
+        questions = self.backend.filter_questions(
+                                        models.Question.objects.all(),
+                                        'common'
+                                    )
+        self.assertEquals(
+            [question.id for question in questions.order_by('-relevance')],
+            [best.id, other.id]
+        )
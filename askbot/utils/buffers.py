@@ -0,0 +1,109 @@
+"""Process-local write buffers.
+
+A buffer accumulates values per key in memory and
+passes them to a flush function in one batch,
+which allows to replace many small database writes
+made on every request with a periodic bulk update.
+
+Values are lost if the process dies before the flush,
+so buffers must only be used for data where that is acceptable,
+like "last seen" timestamps or view counters. Buffers created
+with background = True are also flushed by a daemon thread
+once per interval and when the process exits, so that the values
+do not wait in an idle process for the next request.
+"""
+import atexit
+import logging
+import time
+import threading
+
+class FlushingBuffer(object):
+    """thread-safe dictionary of pending values
+
+    * flush_function - callable taking a dictionary {key: value}
+    * merge_function - callable taking old and new value
+      for the same key and returning the value to keep
+    * interval - minimal number of seconds between
+      the automatic flushes
+    * background - if True, the first added value starts
+      a thread flushing the buffer every interval seconds
+      and the buffer is flushed at exit of the process
+    """
+    def __init__(self, flush_function = None,
+                merge_function = None, interval = 0,
+                background = False):
+        self.flush_function = flush_function
+        self.merge_function = merge_function
+        self.interval = interval
+        self.background = background
+        self.data = dict()
+        self.lock = threading.Lock()
+        self.flushed_at = time.time()
+        self.thread = None
+
+    def add(self, key, value):
+        """adds value to the buffer, merging it
+        with the value already stored under the same key
+        """
+        self.lock.acquire()
+        try:
+            if self.background and self.thread is None and self.interval:
+                self.thread = threading.Thread(target = self.run)
+                self.thread.setDaemon(True)
+                self.thread.start()
+                atexit.register(self.flush_safely)
+            if key in self.data:
+                value = self.merge_function(self.data[key], value)
+            self.data[key] = value
+        finally:
+            self.lock.release()
+
+    def get(self, key, default = None):
+        """returns pending value for the key"""
+        return self.data.get(key, default)
+
+    def is_flush_due(self):
+        return time.time() - self.flushed_at >= self.interval
+
+    def pop_all(self):
+        """returns all pending values and empties the buffer"""
+        self.lock.acquire()
+        try:
+            data = self.data
+            self.data = dict()
+            self.flushed_at = time.time()
+        finally:
+            self.lock.release()
+        return data
+
+    def flush(self):
+        """passes all pending values to the flush function,
+        returns number of flushed keys
+        """
+        data = self.pop_all()
+        if data:
+            self.flush_function(data)
+        return len(data)
+
+    def flush_if_due(self):
+        """flushes the buffer if more than interval
+        seconds have passed since the last flush
+        """
+        if self.is_flush_due():
+            return self.flush()
+        return 0
+
+    def flush_safely(self):
+        """flushes the buffer, errors are logged"""
+        try:
+            self.flush()
+        except Exception, error:
+            logging.critical(
+                'buffered values could not be flushed: %s' % unicode(error)
+            )
+
+    def run(self):
+        """body of the background thread"""
+        while True:
+            time.sleep(self.interval)
+            self.flush_safely()
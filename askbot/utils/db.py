@@ -0,0 +1,38 @@
+"""Utilities for writing many rows to the database at once."""
+from django.db import connection
+
+#older sqlite builds allow at most this many variables per statement
+MAX_QUERY_VARIABLES = 999
+
+def bulk_insert(model, field_names, rows):
+    """inserts rows - sequences of values of the fields
+    named in field_names - with multi-row INSERT statements,
+    each statement binds at most MAX_QUERY_VARIABLES values
+
+    the values are not converted by the model fields
+    and the model signals are not sent, the transaction
+    is not committed, because the rows may be inserted
+    within a savepoint of the caller
+    """
+    rows = list(rows)
+    if len(rows) == 0:
+        return
+    qn = connection.ops.quote_name
+    meta = model._meta
+    query_start = 'INSERT INTO %s (%s) VALUES ' % (
+                        qn(meta.db_table),
+                        ', '.join([
+                            qn(meta.get_field(name).column) \
+                            for name in field_names
+                        ])
+                    )
+    row_values = '(%s)' % ', '.join(['%s'] * len(field_names))
+    batch_size = MAX_QUERY_VARIABLES // len(field_names)
+
+    cursor = connection.cursor()
+    for start in xrange(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        params = list()
+        for row in batch:
+            params.extend(row)
+        cursor.execute(query_start + ', '.join([row_values] * len(batch)), params)
@@ -0,0 +1,129 @@
+"""Deferred execution of the celery tasks.
+
+Function :func:`defer` runs a task off the request path.
+Normally the task is simply sent to celery. When celery
+executes tasks eagerly (setting CELERY_ALWAYS_EAGER), i.e.
+there is no celery worker, the task is run by a background
+thread of the same process instead, unless django setting
+ASKBOT_DEFERRED_TASK_THREAD is False - then the tasks
+are run eagerly and the tasks with a countdown are dropped,
+because eager celery would run them right away.
+
+Tasks deferred while a request is processed are handed
+over to the thread only when the request is finished,
+so that they see the data committed by the request.
+Tasks deferred outside of the requests, e.g. by the
+management commands, are run right away, because the
+thread may not outlive the process. Tasks still waiting
+in the thread when the process stops are lost.
+"""
+import logging
+import threading
+import Queue
+from django.conf import settings as django_settings
+from django.core import signals as django_signals
+from django.db import transaction
+
+DEFERRED_TASK_THREAD = getattr(
+                        django_settings,
+                        'ASKBOT_DEFERRED_TASK_THREAD',
+                        True
+                    )
+
+class DeferredTaskRunner(object):
+    """runs tasks in a daemon thread one by one,
+    each task in its own transaction
+    """
+    def __init__(self):
+        self.queue = Queue.Queue()
+        self.lock = threading.Lock()
+        self.thread = None
+        #tasks deferred by the requests being processed
+        self.local = threading.local()
+
+    def start_request(self, **kwargs):
+        self.local.pending_tasks = list()
+
+    def finish_request(self, **kwargs):
+        pending_tasks = getattr(self.local, 'pending_tasks', None)
+        self.local.pending_tasks = None
+        for task, kwargs in pending_tasks or []:
+            self.put(task, kwargs)
+
+    def add(self, task, kwargs):
+        """keeps the task until the end of the request
+        if called within a request, otherwise runs it right away
+        """
+        pending_tasks = getattr(self.local, 'pending_tasks', None)
+        if pending_tasks is None:
+            self.run_inline(task, kwargs)
+        else:
+            pending_tasks.append((task, kwargs))
+
+    def add_later(self, task, kwargs, countdown):
+        """queues the task after countdown seconds"""
+        timer = threading.Timer(countdown, self.put, (task, kwargs))
+        timer.setDaemon(True)
+        timer.start()
+
+    def run_inline(self, task, kwargs):
+        try:
+            task(**kwargs)
+        except Exception, error:
+            logging.critical(
+                'deferred task %s failed: %s' % (task.name, unicode(error))
+            )
+
+    def put(self, task, kwargs):
+        self.lock.acquire()
+        try:
+            if self.thread is None:
+                self.thread = threading.Thread(target = self.run)
+                self.thread.setDaemon(True)
+                self.thread.start()
+        finally:
+            self.lock.release()
+        self.queue.put((task, kwargs))
+
+    def run(self):
+        """body of the worker thread"""
+        while True:
+            task, kwargs = self.queue.get()
+            try:
+                self.run_task(task, kwargs)
+            except Exception, error:
+                logging.critical(
+                    'deferred task %s failed: %s' % (task.name, unicode(error))
+                )
+
+    @transaction.commit_on_success
+    def run_task(self, task, kwargs):
+        task(**kwargs)
+
+
+task_runner = DeferredTaskRunner()
+if DEFERRED_TASK_THREAD:
+    django_signals.request_started.connect(task_runner.start_request)
+    django_signals.request_finished.connect(task_runner.finish_request)
+
+def defer(task, countdown = None, **kwargs):
+    """runs celery task with the keyword arguments
+    off the request path - see the module docstring,
+    if countdown is given, the task is run not earlier
+    than in that number of seconds
+    """
+    eager = getattr(django_settings, 'CELERY_ALWAYS_EAGER', False)
+    if eager and DEFERRED_TASK_THREAD:
+        if countdown:
+            task_runner.add_later(task, kwargs, countdown)
+        else:
+            task_runner.add(task, kwargs)
+    elif eager and countdown:
+        logging.debug(
+            'deferred task %s dropped, it cannot wait without '
+            'a celery worker or the deferred task thread' % task.name
+        )
+    elif countdown:
+        task.apply_async(kwargs = kwargs, countdown = countdown)
+    else:
+        task.delay(**kwargs)
@@ -6,7 +6,17 @@ __author__ = 'Aaron Swartz <me@aaronsw.com>'
 __copyright__ = '(C) 2003 Aaron Swartz. GNU GPL 2.'
 __version__ = '0.22'
 
-import difflib, string
+import bisect
+import re
+
+#tags, words with one trailing whitespace character and
+#words followed by a tag or the end of the text
+TOKEN_RE = re.compile(r'<[^>]*>?|[^<\s]*\s|[^<\s]+')
+
+#cap on the number of token comparisons made by :class:`TokenMatcher`,
+#parts of the texts left unmatched when the cap is reached
+#are shown as replaced in whole
+MAX_DIFF_WORK = 200000
 
 def isTag(x): return x[0] == "<" and x[-1] == ">"
 
@@ -18,7 +28,7 @@ def textDiff(a, b,
 
     out = []
     a, b = html2list(a), html2list(b)
-    s = difflib.SequenceMatcher(None, a, b)
+    s = TokenMatcher(a, b)
     for e in s.get_opcodes():
         if e[0] == "replace":
             # @@ need to do something more complicated here
@@ -38,35 +48,219 @@ def textDiff(a, b,
     return ''.join(out)
 
 def html2list(x, b=0):
-    mode = 'char'
-    cur = ''
-    out = []
-    for c in x:
-        if mode == 'tag':
-            if c == '>': 
-                if b: 
-                    cur += ']'
-                else: 
-                    cur += c
-                out.append(cur)
-                cur = ''
-                mode = 'char'
-            else: cur += c
-        elif mode == 'char':
-            if c == '<': 
-                out.append(cur)
-                if b:
-                    cur = '['
+    """splits html into tags and words, each word
+    keeps the whitespace character that follows it,
+    with b set brackets are used in the tags instead of < and >
+    """
+    out = TOKEN_RE.findall(x)
+    if b:
+        for i, token in enumerate(out):
+            if token[0] == '<':
+                if token[-1] == '>':
+                    token = token[:-1] + ']'
+                out[i] = '[' + token[1:]
+    return out
+
+class TokenMatcher(object):
+    """finds the differences between two lists of tokens,
+    :meth:`get_opcodes` returns the same kind of opcodes as
+    that of ``difflib.SequenceMatcher``
+
+    common prefix and suffix are matched first, then the
+    tokens that occur once in both lists are used as anchors
+    (the patience diff), parts between the anchors are matched
+    in the same way, and the parts without unique common tokens
+    are compared with the Myers algorithm.
+    The total number of comparisons is limited by ``max_work``.
+    """
+    def __init__(self, a, b, max_work = MAX_DIFF_WORK):
+        self.a = a
+        self.b = b
+        self.work_left = max_work
+
+    def get_opcodes(self):
+        """returns list of tuples (tag, i1, i2, j1, j2), where tag
+        is one of 'replace', 'delete', 'insert' and 'equal'
+        """
+        blocks = list()
+        for i, j in self.get_matching_pairs():
+            if blocks:
+                block = blocks[-1]
+                if block[0] + block[2] == i and block[1] + block[2] == j:
+                    block[2] += 1
+                    continue
+            blocks.append([i, j, 1])
+        blocks.append([len(self.a), len(self.b), 0])
+
+        opcodes = list()
+        i = j = 0
+        for block_i, block_j, size in blocks:
+            if i < block_i and j < block_j:
+                opcodes.append(('replace', i, block_i, j, block_j))
+            elif i < block_i:
+                opcodes.append(('delete', i, block_i, j, j))
+            elif j < block_j:
+                opcodes.append(('insert', i, i, j, block_j))
+            if size:
+                opcodes.append(
+                    ('equal', block_i, block_i + size, block_j, block_j + size)
+                )
+            i = block_i + size
+            j = block_j + size
+        return opcodes
+
+    def get_matching_pairs(self):
+        """returns sorted list of pairs (i, j) of indices
+        of the matched tokens a[i] == b[j]
+        """
+        a = self.a
+        b = self.b
+        matches = list()
+        regions = [(0, len(a), 0, len(b))]
+        while regions:
+            alo, ahi, blo, bhi = regions.pop()
+            self.work_left -= (ahi - alo) + (bhi - blo)
+            if self.work_left < 0:
+                continue
+            while alo < ahi and blo < bhi and a[alo] == b[blo]:
+                matches.append((alo, blo))
+                alo += 1
+                blo += 1
+            while alo < ahi and blo < bhi and a[ahi - 1] == b[bhi - 1]:
+                ahi -= 1
+                bhi -= 1
+                matches.append((ahi, bhi))
+            if alo == ahi or blo == bhi:
+                continue
+
+            anchors = self.get_unique_anchors(alo, ahi, blo, bhi)
+            if anchors:
+                for i, j in anchors:
+                    matches.append((i, j))
+                    regions.append((alo, i, blo, j))
+                    alo = i + 1
+                    blo = j + 1
+                regions.append((alo, ahi, blo, bhi))
+            else:
+                matches.extend(self.get_myers_matches(alo, ahi, blo, bhi))
+        matches.sort()
+        return matches
+
+    def get_unique_anchors(self, alo, ahi, blo, bhi):
+        """returns the longest increasing sequence of pairs (i, j)
+        of the tokens that occur once in both a[alo:ahi] and b[blo:bhi]
+        """
+        a_positions = dict()
+        for i in xrange(alo, ahi):
+            token = self.a[i]
+            if token in a_positions:
+                a_positions[token] = None
+            else:
+                a_positions[token] = i
+        b_positions = dict()
+        for j in xrange(blo, bhi):
+            token = self.b[j]
+            if token in a_positions:
+                if token in b_positions:
+                    b_positions[token] = None
                 else:
-                    cur = c
-                mode = 'tag'
-            elif c in string.whitespace:
-                out.append(cur+c);
-                cur = ''
+                    b_positions[token] = j
+
+        pairs = list()
+        for token, j in b_positions.iteritems():
+            i = a_positions[token]
+            if i is not None and j is not None:
+                pairs.append((i, j))
+        pairs.sort()
+
+        #patience sorting - tails[n] is the index of the pair
+        #ending the best found sequence of length n + 1
+        tails = list()
+        tail_js = list()
+        previous = [None] * len(pairs)
+        for index, (i, j) in enumerate(pairs):
+            length = bisect.bisect_left(tail_js, j)
+            if length > 0:
+                previous[index] = tails[length - 1]
+            if length == len(tails):
+                tails.append(index)
+                tail_js.append(j)
+            else:
+                tails[length] = index
+                tail_js[length] = j
+
+        anchors = list()
+        if tails:
+            index = tails[-1]
+            while index is not None:
+                anchors.append(pairs[index])
+                index = previous[index]
+            anchors.reverse()
+        return anchors
+
+    def get_myers_matches(self, alo, ahi, blo, bhi):
+        """returns pairs of matched tokens on the shortest
+        edit path between a[alo:ahi] and b[blo:bhi], or
+        an empty list if the work limit is reached first
+        """
+        a = self.a
+        b = self.b
+        n = ahi - alo
+        m = bhi - blo
+        offset = n + m + 1
+        #v[k + offset] - furthest x reached on the diagonal k = x - y
+        v = [0] * (2 * offset + 1)
+        trace = list()
+        for d in xrange(n + m + 1):
+            self.work_left -= d + 1
+            if self.work_left < 0:
+                return list()
+            for k in xrange(-d, d + 1, 2):
+                if k == -d or (k != d and v[offset + k - 1] < v[offset + k + 1]):
+                    x = v[offset + k + 1]
+                else:
+                    x = v[offset + k - 1] + 1
+                y = x - k
+                start_x = x
+                while x < n and y < m and a[alo + x] == b[blo + y]:
+                    x += 1
+                    y += 1
+                self.work_left -= x - start_x
+                v[offset + k] = x
+                if x >= n and y >= m:
+                    return self.get_myers_path(trace, alo, blo, n, m, d)
+            trace.append(v[offset - d:offset + d + 1])
+        raise AssertionError('edit path not found')
+
+    def get_myers_path(self, trace, alo, blo, x, y, d):
+        """walks back the edit path found by :meth:`get_myers_matches`,
+        trace[d] holds the furthest x on diagonals -d..d after d edits
+        """
+        matches = list()
+        while d > 0:
+            previous_v = trace[d - 1]
+            k = x - y
+            if k == -d or (k != d and \
+                previous_v[k - 1 + d - 1] < previous_v[k + 1 + d - 1]):
+                previous_k = k + 1
+                previous_x = previous_v[previous_k + d - 1]
+                snake_x = previous_x
             else:
-                cur += c
-    out.append(cur)
-    return filter(lambda x: x is not '', out)
+                previous_k = k - 1
+                previous_x = previous_v[previous_k + d - 1]
+                snake_x = previous_x + 1
+            while x > snake_x:
+                x -= 1
+                y -= 1
+                matches.append((alo + x, blo + y))
+            x = previous_x
+            y = previous_x - previous_k
+            d -= 1
+        while x > 0:
+            x -= 1
+            y -= 1
+            matches.append((alo + x, blo + y))
+        return matches
 
 if __name__ == '__main__':
     import sys
@@ -1,6 +1,10 @@
 """Utilities for working with HTML."""
+import re
+from xml.sax.saxutils import escape, unescape
 import html5lib
 from html5lib import sanitizer, serializer, tokenizer, treebuilders, treewalkers
+from html5lib.constants import booleanAttributes, entities
+from django.conf import settings as django_settings
 
 class HTMLSanitizerMixin(sanitizer.HTMLSanitizerMixin):
     acceptable_elements = ('a', 'abbr', 'acronym', 'address', 'b', 'big',
@@ -38,8 +42,8 @@ class HTMLSanitizer(tokenizer.HTMLTokenizer, HTMLSanitizerMixin):
             if token:
                 yield token
 
-def sanitize_html(html):
-    """Sanitizes an HTML fragment."""
+def sanitize_html_html5lib(html):
+    """Sanitizes an HTML fragment with html5lib."""
     p = html5lib.HTMLParser(tokenizer=HTMLSanitizer,
                             tree=treebuilders.getTreeBuilder("dom"))
     dom_tree = p.parseFragment(html)
@@ -49,3 +53,322 @@ def sanitize_html(html):
                                   quote_attr_values=True)
     output_generator = s.serialize(stream)
     return u''.join(output_generator)
+
+#engine of function sanitize_html, 'html5lib' or 'fast' - see
+#function sanitize_html_fast, both produce the same output
+HTML_SANITIZER = getattr(django_settings, 'ASKBOT_HTML_SANITIZER', 'html5lib')
+
+#input that sanitize_html_fast leaves to html5lib
+UNSUPPORTED_CHARS_RE = re.compile(
+                        u'[\x00-\x08\x0b-\x1f\x7f-\x9f'
+                        u'\ud800-\udfff\ufdd0-\ufdef\ufffe\uffff]'
+                    )
+MARKUP_RE = re.compile(r'[<&]')
+START_TAG_RE = re.compile(
+                r'<([a-zA-Z][a-zA-Z0-9]*)'
+                r'((?:\s+[a-zA-Z_:][-a-zA-Z0-9_:.]*'
+                r'(?:\s*=\s*(?:"[^"]*"|\'[^\']*\'|[^\s"\'=<>`]+))?)*)'
+                r'\s*(/?)>'
+            )
+ATTRIBUTE_RE = re.compile(
+                r'\s+([a-zA-Z_:][-a-zA-Z0-9_:.]*)'
+                r'(?:\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s"\'=<>`]+)))?'
+            )
+END_TAG_RE = re.compile(r'</([a-zA-Z][a-zA-Z0-9]*)\s*>')
+ENTITY_RE = re.compile(
+                r'&(?:([a-zA-Z][a-zA-Z0-9]*);|#([0-9]{1,7});|#[xX]([0-9a-fA-F]{1,6});)'
+            )
+URI_SCHEME_RE = re.compile(r'^[a-z0-9][-+.a-z0-9]*:')
+URI_IGNORED_CHARS_RE = re.compile(u'[`\000-\040\177-\240\s]+')
+
+#characters after which "&" is not a character reference
+ENTITY_TERMINATORS = u' \t\n<&'
+
+ALLOWED_ELEMENTS = frozenset(HTMLSanitizerMixin.allowed_elements)
+ALLOWED_ATTRIBUTES = frozenset(HTMLSanitizerMixin.allowed_attributes)
+ALLOWED_PROTOCOLS = frozenset(HTMLSanitizerMixin.allowed_protocols)
+URI_ATTRIBUTES = frozenset(HTMLSanitizerMixin.attr_val_is_uri)
+VOID_ELEMENTS = frozenset(('br', 'hr', 'img'))
+#elements, start tag of which closes an open paragraph
+CLOSE_P_ELEMENTS = frozenset(('address', 'blockquote', 'center', 'dir', 'div',
+    'dl', 'ol', 'p', 'ul', 'pre', 'li', 'dd', 'dt', 'hr',
+    'h1', 'h2', 'h3', 'h4', 'h5', 'h6'))
+HEADING_ELEMENTS = frozenset(('h1', 'h2', 'h3', 'h4', 'h5', 'h6'))
+LIST_ITEM_ELEMENTS = frozenset(('li', 'dd', 'dt'))
+#elements that stop the search of an open list item
+LIST_ITEM_SCOPE_ELEMENTS = frozenset(('blockquote', 'center', 'dir', 'dl',
+    'ol', 'pre', 'ul', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6'))
+TABLE_ELEMENTS = frozenset(('caption', 'col', 'colgroup', 'table', 'tbody',
+    'td', 'tfoot', 'th', 'thead', 'tr'))
+
+class UnsupportedMarkup(Exception):
+    """raised by the fast sanitizer on input that
+    must be sanitized by html5lib
+    """
+    pass
+
+def decode_entities(text, terminators = ENTITY_TERMINATORS):
+    """replaces character references in the text, raises
+    :class:`UnsupportedMarkup` on references that html5lib
+    would decode in a less obvious way, e.g. without the semicolon
+    """
+    if '&' not in text:
+        return text
+    chunks = list()
+    position = 0
+    while True:
+        ampersand = text.find('&', position)
+        if ampersand == -1:
+            chunks.append(text[position:])
+            return u''.join(chunks)
+        chunks.append(text[position:ampersand])
+        match = ENTITY_RE.match(text, ampersand)
+        if match is None:
+            next_char = text[ampersand + 1:ampersand + 2]
+            if next_char == '' or next_char in terminators:
+                chunks.append(u'&')
+                position = ampersand + 1
+                continue
+            raise UnsupportedMarkup()
+        name, decimal, hexadecimal = match.groups()
+        if name:
+            if name + ';' not in entities:
+                raise UnsupportedMarkup()
+            chunks.append(entities[name + ';'])
+        else:
+            if decimal:
+                code = int(decimal)
+            else:
+                code = int(hexadecimal, 16)
+            if code in (9, 10) or 0x20 <= code <= 0x7e \
+                or 0xa0 <= code <= 0xd7ff or 0xe000 <= code <= 0xfdcf \
+                or 0xfdf0 <= code <= 0xfffd:
+                chunks.append(unichr(code))
+            else:
+                raise UnsupportedMarkup()
+        position = match.end()
+
+def escape_attribute_value(value):
+    """quotes attribute value like the html5lib serializer"""
+    value = value.replace('&', '&amp;')
+    if '"' in value and "'" not in value:
+        return "'" + value + "'"
+    return '"' + value.replace('"', '&quot;') + '"'
+
+def sanitize_start_tag(name, attributes):
+    """returns serialized start tag of an allowed element"""
+    attrs = list()
+    for attr_name, value in attributes:
+        if attr_name not in ALLOWED_ATTRIBUTES:
+            continue
+        if attr_name in URI_ATTRIBUTES:
+            uri = URI_IGNORED_CHARS_RE.sub('', unescape(value)).lower()
+            uri = uri.replace(u'\ufffd', '')
+            if URI_SCHEME_RE.match(uri) and \
+                uri.split(':')[0] not in ALLOWED_PROTOCOLS:
+                continue
+        attrs.append((attr_name, value))
+    attrs.sort()
+    boolean_attributes = booleanAttributes.get(name, frozenset()) \
+                        | booleanAttributes.get('', frozenset())
+    chunks = [u'<', name]
+    for attr_name, value in attrs:
+        chunks.append(u' ')
+        chunks.append(attr_name)
+        if attr_name not in boolean_attributes:
+            chunks.append(u'=')
+            chunks.append(escape_attribute_value(value))
+    chunks.append(u'>')
+    return u''.join(chunks)
+
+def get_disallowed_tag_text(name, attributes, self_closing):
+    """returns text to which html5lib sanitizer turns
+    the start tag of a disallowed element
+    """
+    text = u'<' + name
+    for attr_name, value in attributes:
+        text += u' %s="%s"' % (attr_name, escape(value))
+    if self_closing:
+        return text + u'/>'
+    return text + u'>'
+
+def parse_attributes(attributes_source):
+    """returns list of (name, value) of the attributes,
+    names are in lower case and values are decoded
+    """
+    attributes = list()
+    names = set()
+    for match in ATTRIBUTE_RE.finditer(attributes_source):
+        name = match.group(1).lower()
+        if name in names:
+            raise UnsupportedMarkup()
+        names.add(name)
+        double_quoted, single_quoted, unquoted = match.groups()[1:]
+        if double_quoted is not None:
+            value = decode_entities(double_quoted, ENTITY_TERMINATORS + '"')
+        elif single_quoted is not None:
+            value = decode_entities(single_quoted, ENTITY_TERMINATORS + "'")
+        elif unquoted is not None:
+            value = decode_entities(unquoted, ENTITY_TERMINATORS + '>')
+        else:
+            value = u''
+        attributes.append((name, value))
+    return attributes
+
+def sanitize_html_fast(html):
+    """Sanitizes an HTML fragment like :func:`sanitize_html_html5lib`.
+
+    Tags are matched with regular expressions, and the tree is
+    not built - only a stack of the open elements is kept.
+    This is enough for well formed markup, e.g. the output of markdown.
+    Any markup, for which html5lib would do more than to
+    drop the disallowed parts of it and to close the elements left
+    open at the end, is handed over to :func:`sanitize_html_html5lib`.
+    """
+    try:
+        return FastHTMLSanitizer(html).sanitize()
+    except UnsupportedMarkup:
+        return sanitize_html_html5lib(html)
+
+class FastHTMLSanitizer(object):
+    """one run of the fast sanitizer,
+    raises :class:`UnsupportedMarkup` on unusual input
+    """
+    def __init__(self, html):
+        self.html = html
+        self.output = list()
+        #decoded text not yet written to the output
+        self.text = list()
+        self.open_elements = list()
+        self.pre_started = False
+
+    def sanitize(self):
+        html = self.html
+        if not isinstance(html, unicode) or UNSUPPORTED_CHARS_RE.search(html):
+            raise UnsupportedMarkup()
+        position = 0
+        while True:
+            match = MARKUP_RE.search(html, position)
+            if match is None:
+                self.text.append(html[position:])
+                break
+            start = match.start()
+            if html[start] == '&':
+                #text up to the next tag
+                end = html.find('<', start)
+                if end == -1:
+                    end = len(html)
+                self.text.append(html[position:start])
+                self.text.append(decode_entities(html[start:end]))
+                position = end
+                continue
+
+            self.text.append(html[position:start])
+            next_char = html[start + 1:start + 2]
+            if next_char.isalpha():
+                position = self.process_start_tag(start)
+            elif next_char == '/':
+                position = self.process_end_tag(start)
+            elif next_char == '!':
+                position = self.skip_comment(start)
+            elif next_char == '?':
+                raise UnsupportedMarkup()
+            else:
+                self.text.append(u'<')
+                position = start + 1
+
+        self.flush_text()
+        for name in reversed(self.open_elements):
+            self.output.append(u'</%s>' % name)
+        return u''.join(self.output)
+
+    def flush_text(self):
+        text = u''.join(self.text)
+        self.text = list()
+        if text == '':
+            return
+        if self.pre_started:
+            #html5lib drops newline at the start of <pre>
+            if text.startswith('\n'):
+                raise UnsupportedMarkup()
+            self.pre_started = False
+        self.output.append(escape(text))
+
+    def process_start_tag(self, start):
+        match = START_TAG_RE.match(self.html, start)
+        if match is None:
+            raise UnsupportedMarkup()
+        name = match.group(1).lower()
+        attributes = parse_attributes(match.group(2))
+        if name not in ALLOWED_ELEMENTS:
+            self.text.append(
+                get_disallowed_tag_text(name, attributes, match.group(3))
+            )
+            return match.end()
+
+        open_elements = self.open_elements
+        if name in TABLE_ELEMENTS:
+            raise UnsupportedMarkup()
+        if name in CLOSE_P_ELEMENTS and 'p' in open_elements:
+            raise UnsupportedMarkup()
+        if name == 'a' and 'a' in open_elements:
+            raise UnsupportedMarkup()
+        if name in HEADING_ELEMENTS and open_elements \
+            and open_elements[-1] in HEADING_ELEMENTS:
+            raise UnsupportedMarkup()
+        if name in LIST_ITEM_ELEMENTS:
+            for open_name in reversed(open_elements):
+                if open_name in LIST_ITEM_ELEMENTS:
+                    raise UnsupportedMarkup()
+                if open_name in LIST_ITEM_SCOPE_ELEMENTS:
+                    break
+
+        self.flush_text()
+        self.pre_started = False
+        self.output.append(sanitize_start_tag(name, attributes))
+        if name not in VOID_ELEMENTS:
+            open_elements.append(name)
+            if name == 'pre':
+                self.pre_started = True
+        return match.end()
+
+    def process_end_tag(self, start):
+        match = END_TAG_RE.match(self.html, start)
+        if match is None:
+            raise UnsupportedMarkup()
+        name = match.group(1).lower()
+        if name not in ALLOWED_ELEMENTS:
+            self.text.append(u'</%s>' % name)
+            return match.end()
+        #end tags that do not close the current element
+        #are handled by html5lib in many different ways
+        if not self.open_elements or self.open_elements[-1] != name \
+            or name in TABLE_ELEMENTS:
+            raise UnsupportedMarkup()
+        self.flush_text()
+        self.pre_started = False
+        self.output.append(u'</%s>' % name)
+        self.open_elements.pop()
+        return match.end()
+
+    def skip_comment(self, start):
+        """comments are removed by the sanitizer"""
+        html = self.html
+        if not html.startswith('<!--', start):
+            raise UnsupportedMarkup()
+        end = html.find('-->', start + 4)
+        if end == -1:
+            raise UnsupportedMarkup()
+        comment = html[start + 4:end]
+        if comment.startswith('>') or comment.startswith('->') \
+            or comment.endswith('-') or '--' in comment:
+            raise UnsupportedMarkup()
+        return end + 3
+
+def sanitize_html(html):
+    """Sanitizes an HTML fragment
+    with the engine chosen by setting ASKBOT_HTML_SANITIZER
+    """
+    if HTML_SANITIZER == 'fast':
+        return sanitize_html_fast(html)
+    return sanitize_html_html5lib(html)
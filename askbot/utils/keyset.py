@@ -0,0 +1,182 @@
+"""Keyset ("seek") pagination.
+
+Instead of skipping rows with OFFSET, the next page is
+selected with a condition on the sort column and the id
+of the last row on the previous page, which allows the
+database to start reading right at the page with an index.
+
+Position in the sorted list is passed around as a cursor -
+a string made of the sort column value and the object id.
+"""
+import datetime
+import math
+from django.core.cache import cache
+from django.core.paginator import EmptyPage, PageNotAnInteger
+from django.db.models import Q
+
+DATETIME_FORMAT = '%Y%m%d%H%M%S'
+
+def encode_value(value):
+    """returns string representation of the sort column value,
+    prefixed with the value type
+    """
+    if isinstance(value, datetime.datetime):
+        return 'd' + value.strftime(DATETIME_FORMAT) \
+                + '%06d' % value.microsecond
+    elif isinstance(value, (int, long)):
+        return 'i%d' % value
+    raise ValueError('cannot make cursor from %s' % repr(value))
+
+def decode_value(value_str):
+    """inverse of :func:`encode_value`, raises ValueError
+    if the string is not a valid encoded value
+    """
+    value_type, value_str = value_str[:1], value_str[1:]
+    if value_type == 'd':
+        if len(value_str) != 20 or not value_str.isdigit():
+            raise ValueError('bad datetime in cursor %s' % value_str)
+        parts = [
+            int(value_str[start:end]) for start, end in (
+                (0, 4), (4, 6), (6, 8), (8, 10), (10, 12), (12, 14), (14, 20)
+            )
+        ]
+        return datetime.datetime(*parts)
+    elif value_type == 'i':
+        return int(value_str)
+    raise ValueError('bad cursor value %s' % value_str)
+
+def get_field_name(order_by):
+    """name of the sort column, i.e. order_by without the minus"""
+    return order_by.lstrip('-')
+
+def get_cursor(obj, order_by):
+    """returns cursor pointing at the object
+    in the list sorted by order_by
+    """
+    value = getattr(obj, get_field_name(order_by))
+    return '%s_%d' % (encode_value(value), obj.id)
+
+def parse_cursor(cursor):
+    """returns tuple (sort column value, object id)
+    or raises ValueError
+    """
+    value_str, obj_id = cursor.split('_', 1)
+    return decode_value(value_str), int(obj_id)
+
+def filter_after(queryset, order_by, cursor):
+    """returns queryset limited to the objects following
+    the cursor, queryset must be sorted by order_by and by id
+    in the same direction
+    """
+    value, obj_id = parse_cursor(cursor)
+    field_name = get_field_name(order_by)
+    if order_by.startswith('-'):
+        lookup = '__lt'
+    else:
+        lookup = '__gt'
+    return queryset.filter(
+                Q(**{field_name + lookup: value}) \
+                | Q(**{field_name: value, 'id' + lookup: obj_id})
+            )
+
+def get_tie_breaker(order_by):
+    """returns ordering by id in the same direction as order_by,
+    which makes positions of the objects with equal sort values unique
+    """
+    if order_by.startswith('-'):
+        return '-id'
+    return 'id'
+
+def get_cached_count(queryset, cache_key, timeout):
+    """returns count of the objects in the queryset,
+    which may be up to timeout seconds old
+    """
+    count = cache.get(cache_key)
+    if count is None:
+        count = queryset.count()
+        cache.set(cache_key, count, timeout)
+    return count
+
+
+class KeysetPage(object):
+    """page of objects, has the same interface
+    as the django.core.paginator.Page
+    """
+    def __init__(self, object_list, number, paginator, has_next):
+        self.object_list = object_list
+        self.number = number
+        self.paginator = paginator
+        self._has_next = has_next
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self.number > 1
+
+    def next_page_number(self):
+        return self.number + 1
+
+    def previous_page_number(self):
+        return self.number - 1
+
+    def get_end_cursor(self):
+        """returns cursor pointing at the last object
+        of the page, which is used to read the next page
+        """
+        if len(self.object_list) == 0:
+            return None
+        return get_cursor(self.object_list[-1], self.paginator.order_by)
+
+
+class KeysetPaginator(object):
+    """paginator reading pages after a cursor where
+    the cursor is known and falling back to the offset otherwise
+
+    * queryset - must be ordered by order_by and the matching
+      tie breaker (see :func:`get_tie_breaker`)
+    * count - total number of objects or a callable returning it,
+      it is not used to read the pages, so it may be approximate
+    """
+    def __init__(self, queryset, per_page, order_by = None, count = None):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.order_by = order_by
+        self._count = count
+
+    def _get_count(self):
+        if callable(self._count):
+            self._count = self._count()
+        elif self._count is None:
+            self._count = self.queryset.count()
+        return self._count
+    count = property(_get_count)
+
+    def _get_num_pages(self):
+        page_count = int(math.ceil(self.count / float(self.per_page)))
+        return max(page_count, 1)
+    num_pages = property(_get_num_pages)
+
+    def page(self, number, cursor = None):
+        """returns :class:`KeysetPage`, cursor
+        should point at the last object of the previous page
+        """
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('That page number is not an integer')
+        if number < 1:
+            raise EmptyPage('That page number is less than 1')
+
+        if cursor:
+            queryset = filter_after(self.queryset, self.order_by, cursor)
+            object_list = list(queryset[:self.per_page + 1])
+        else:
+            start = (number - 1) * self.per_page
+            object_list = list(self.queryset[start:start + self.per_page + 1])
+
+        if number > 1 and len(object_list) == 0:
+            raise EmptyPage('That page contains no results')
+
+        has_next = len(object_list) > self.per_page
+        return KeysetPage(object_list[:self.per_page], number, self, has_next)
@@ -1,8 +1,22 @@
 """functions that send email in askbot
 these automatically catch email-related exceptions
+
+messages may be sent in batches over one connection
+to the mail server with :func:`send_messages`, and if
+django setting ASKBOT_EMAIL_SPOOL_DIR is set, :func:`send_mail`
+only stores messages in that directory, so that request and task
+workers are not blocked by a slow mail server,
+the spooled messages are sent by the management command
+send_spooled_email
 """
+import os
 import smtplib
 import logging
+import tempfile
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
 from django.core import mail
 from django.conf import settings as django_settings
 from askbot.conf import settings as askbot_settings
@@ -19,6 +33,39 @@ def prefix_the_subject_line(subject):
         subject = prefix + ' ' + subject
     return subject
 
+#directory where messages are stored instead of sending, None - send
+EMAIL_SPOOL_DIR = getattr(django_settings, 'ASKBOT_EMAIL_SPOOL_DIR', None)
+SPOOLED_MESSAGE_EXTENSION = '.msg'
+CLAIMED_MESSAGE_EXTENSION = '.sending'
+
+def make_message(
+            subject_line = None,
+            body_text = None,
+            recipient_list = None,
+            headers = None
+        ):
+    """returns html email message with the prefixed subject line"""
+    assert(subject_line is not None)
+    prefix = askbot_settings.EMAIL_SUBJECT_PREFIX.strip() + ' '
+    msg = mail.EmailMessage(
+                    prefix + subject_line,
+                    body_text,
+                    django_settings.DEFAULT_FROM_EMAIL,
+                    recipient_list,
+                    headers = headers
+                )
+    msg.content_subtype = 'html'
+    return msg
+
+def get_connection():
+    """returns open connection to the mail server, which
+    can be passed to :func:`send_mail` to send several messages,
+    the connection must be closed by the caller
+    """
+    connection = mail.get_connection()
+    connection.open()
+    return connection
+
 def send_mail(
             subject_line = None,
             body_text = None,
@@ -27,6 +74,8 @@ def send_mail(
             related_object = None,
             headers = None,
             raise_on_failure = False,
+            connection = None,
+            spool = True
         ):
     """sends email message
     logs email sending activity
@@ -37,21 +86,24 @@ def send_mail(
     are. related_object (if given, will be saved in
     the activity record)
 
+    if connection is given, the message is sent through it,
+    otherwise, if the spool directory is set and spool is True,
+    the message is stored in the spool directory
+
     if raise_on_failure is True, exceptions.EmailNotSent is raised
     """
-    prefix = askbot_settings.EMAIL_SUBJECT_PREFIX.strip() + ' '
     try:
-        assert(subject_line is not None)
-        subject_line = prefix + subject_line
-        msg = mail.EmailMessage(
-                        subject_line, 
-                        body_text, 
-                        django_settings.DEFAULT_FROM_EMAIL,
-                        recipient_list,
-                        headers = headers
-                    )
-        msg.content_subtype = 'html'
-        msg.send()
+        msg = make_message(
+                    subject_line = subject_line,
+                    body_text = body_text,
+                    recipient_list = recipient_list,
+                    headers = headers
+                )
+        if connection is None and spool and EMAIL_SPOOL_DIR:
+            spool_message(msg)
+        else:
+            msg.connection = connection
+            msg.send()
         if related_object is not None:
             assert(activity_type is not None)
     except Exception, error:
@@ -59,6 +111,129 @@ def send_mail(
         if raise_on_failure == True:
             raise exceptions.EmailNotSent(unicode(error))
 
+def send_messages(messages, raise_on_failure = False, spool = True):
+    """sends list of messages made with :func:`make_message`
+    over a single connection to the mail server,
+    or stores them in the spool directory - see :func:`send_mail`,
+    returns number of the sent or spooled messages
+
+    each message is sent separately, so that a message refused
+    by the server does not stop the others, if the server
+    disconnects, the connection is reopened once
+
+    if raise_on_failure is True, exceptions.EmailNotSent
+    is raised after all messages were tried, if any of them failed
+    """
+    if len(messages) == 0:
+        return 0
+    if spool and EMAIL_SPOOL_DIR:
+        send = spool_message
+        connection = None
+    else:
+        send = lambda msg: msg.send()
+        try:
+            connection = get_connection()
+        except Exception, error:
+            logging.critical(unicode(error))
+            if raise_on_failure == True:
+                raise exceptions.EmailNotSent(unicode(error))
+            return 0
+
+    sent_count = 0
+    errors = list()
+    reconnected = False
+    try:
+        for msg in messages:
+            try:
+                try:
+                    msg.connection = connection
+                    send(msg)
+                except smtplib.SMTPServerDisconnected:
+                    if reconnected:
+                        raise
+                    reconnected = True
+                    close_connection(connection)
+                    connection = None
+                    connection = get_connection()
+                    msg.connection = connection
+                    send(msg)
+                sent_count += 1
+            except Exception, error:
+                logging.critical(unicode(error))
+                errors.append(unicode(error))
+    finally:
+        close_connection(connection)
+
+    if errors and raise_on_failure == True:
+        raise exceptions.EmailNotSent('; '.join(errors))
+    return sent_count
+
+def close_connection(connection):
+    """closes connection to the mail server, errors are ignored"""
+    if connection is None:
+        return
+    try:
+        connection.close()
+    except Exception:
+        pass
+
+def spool_message(msg):
+    """stores message in the spool directory,
+    the file appears in the directory completely written
+    """
+    msg.connection = None
+    if not os.path.isdir(EMAIL_SPOOL_DIR):
+        try:
+            os.makedirs(EMAIL_SPOOL_DIR)
+        except OSError:
+            #may be created by another process at the same time
+            if not os.path.isdir(EMAIL_SPOOL_DIR):
+                raise
+    fd, temp_path = tempfile.mkstemp(suffix = '.tmp', dir = EMAIL_SPOOL_DIR)
+    temp_file = os.fdopen(fd, 'wb')
+    try:
+        pickle.dump(msg, temp_file, pickle.HIGHEST_PROTOCOL)
+    finally:
+        temp_file.close()
+    message_path = temp_path[:-len('.tmp')] + SPOOLED_MESSAGE_EXTENSION
+    os.rename(temp_path, message_path)
+
+def get_spooled_message_paths(extension = SPOOLED_MESSAGE_EXTENSION):
+    """returns paths of the spooled messages, oldest first"""
+    dated_paths = list()
+    if not os.path.isdir(EMAIL_SPOOL_DIR):
+        #nothing was spooled yet
+        return dated_paths
+    for file_name in os.listdir(EMAIL_SPOOL_DIR):
+        if file_name.endswith(extension):
+            path = os.path.join(EMAIL_SPOOL_DIR, file_name)
+            try:
+                dated_paths.append((os.path.getmtime(path), path))
+            except OSError:
+                #taken by another process
+                continue
+    dated_paths.sort()
+    return [path for mtime, path in dated_paths]
+
+def claim_spooled_message(message_path):
+    """renames the message file, so that no other process
+    sends it, and returns the message and the new path or
+    None if the message was already taken by another process
+    """
+    claimed_path = message_path + CLAIMED_MESSAGE_EXTENSION
+    try:
+        os.rename(message_path, claimed_path)
+        #time of the claim tells abandoned messages
+        os.utime(claimed_path, None)
+    except OSError:
+        return None
+    message_file = open(claimed_path, 'rb')
+    try:
+        msg = pickle.load(message_file)
+    finally:
+        message_file.close()
+    return msg, claimed_path
+
 def mail_moderators(
             subject_line = '',
             body_text = '',
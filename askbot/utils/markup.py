@@ -1,8 +1,23 @@
 import re
+import threading
+from django.conf import settings as django_settings
+from django.core.cache import cache
+from django.utils.hashcompat import md5_constructor
 from askbot import const
 from askbot.conf import settings as askbot_settings
+from askbot.utils.html import sanitize_html
 from markdown2 import Markdown
 
+#seconds to keep the html rendered from markdown in the cache,
+#0 - do not cache
+MARKDOWN_CACHE_TIMEOUT = getattr(
+                            django_settings,
+                            'ASKBOT_MARKDOWN_CACHE_TIMEOUT',
+                            0
+                        )
+#longer texts are not cached
+MARKDOWN_CACHE_MAX_LENGTH = 100000
+
 #url taken from http://regexlib.com/REDetails.aspx?regexp_id=501 by Brian Bothwell
 URL_RE = re.compile("((?<!(href|.src)=['\"])((http|https|ftp)\://([a-zA-Z0-9\.\-]+(\:[a-zA-Z0-9\.&amp;%\$\-]+)*@)*((25[0-5]|2[0-4][0-9]|[0-1]{1}[0-9]{2}|[1-9]{1}[0-9]{1}|[1-9])\.(25[0-5]|2[0-4][0-9]|[0-1]{1}[0-9]{2}|[1-9]{1}[0-9]{1}|[1-9]|0)\.(25[0-5]|2[0-4][0-9]|[0-1]{1}[0-9]{2}|[1-9]{1}[0-9]{1}|[1-9]|0)\.(25[0-5]|2[0-4][0-9]|[0-1]{1}[0-9]{2}|[1-9]{1}[0-9]{1}|[0-9])|localhost|([a-zA-Z0-9\-]+\.)*[a-zA-Z0-9\-]+\.(com|edu|gov|int|mil|net|org|biz|arpa|info|name|pro|aero|coop|museum|[a-zA-Z]{2}))(\:[0-9]+)*(/($|[a-zA-Z0-9\.\,\?\'\\\+&amp;%\$#\=~_\-]+))*))")
 
@@ -10,17 +25,54 @@ LINK_PATTERNS = [
     (URL_RE, r'\1'),
 ]
 
-def get_parser():
-    extras = ['link-patterns',]  
+#markdown parsers of the thread by the parser options
+_parsers = threading.local()
+
+def get_parser_key():
+    """returns the key of the settings the parser depends on"""
     if askbot_settings.ENABLE_MATHJAX or \
         askbot_settings.MARKUP_CODE_FRIENDLY:
-        extras.append('code-friendly')
+        return 'code-friendly'
+    return 'default'
 
-    return Markdown(
-                html4tags=True,
-                extras=extras,
-                link_patterns = LINK_PATTERNS
-            )
+def get_parser():
+    """returns markdown parser for the current settings,
+    parsers are reused within the thread, because
+    creating one is relatively expensive
+    """
+    key = get_parser_key()
+    parsers = getattr(_parsers, 'parsers', None)
+    if parsers is None:
+        parsers = _parsers.parsers = dict()
+    parser = parsers.get(key)
+    if parser is None:
+        extras = ['link-patterns',]  
+        if key == 'code-friendly':
+            extras.append('code-friendly')
+
+        parser = Markdown(
+                    html4tags=True,
+                    extras=extras,
+                    link_patterns = LINK_PATTERNS
+                )
+        parsers[key] = parser
+    return parser
+
+def markdown_to_html(text):
+    """returns sanitized html rendered from the markdown text,
+    if the ASKBOT_MARKDOWN_CACHE_TIMEOUT setting is set,
+    the results are cached by the hash of the text
+    """
+    if not MARKDOWN_CACHE_TIMEOUT or len(text) > MARKDOWN_CACHE_MAX_LENGTH:
+        return sanitize_html(get_parser().convert(text))
+
+    text_hash = md5_constructor(text.encode('utf-8')).hexdigest()
+    cache_key = 'askbot-markdown-%s-%s' % (get_parser_key(), text_hash)
+    html = cache.get(cache_key)
+    if html is None:
+        html = sanitize_html(get_parser().convert(text))
+        cache.set(cache_key, html, MARKDOWN_CACHE_TIMEOUT)
+    return html
 
 
 def format_mention_in_html(mentioned_user):
@@ -28,24 +80,62 @@ def format_mention_in_html(mentioned_user):
     username = mentioned_user.username
     return '<a href="%s">@%s</a>' % (url, username)
 
-def extract_first_matching_mentioned_author(text, anticipated_authors):
-
-    if len(text) == 0:
-        return None, ''
-
-    for a in anticipated_authors:
-        if text.startswith(a.username):
-            ulen = len(a.username)
-            if len(text) == ulen:
-                text = ''
-            elif text[ulen] in const.TWITTER_STYLE_MENTION_TERMINATION_CHARS:
-                text = text[ulen:]
-            else:
-                #near miss, here we could insert a warning that perhaps
-                #a termination character is needed
+class MentionMatcher(object):
+    """finds usernames at given positions of the text,
+    the usernames are stored in a trie, so that all
+    candidate usernames are checked in one pass over the text
+
+    when several usernames match at the same position,
+    the user listed first wins
+    """
+    def __init__(self, users):
+        self.trie = dict()
+        for position, user in enumerate(users):
+            if not user.username:
                 continue
-            return a, text
-    return None, text
+            node = self.trie
+            for char in user.username:
+                node = node.setdefault(char, dict())
+            #key None marks the end of a username
+            node.setdefault(None, (position, user))
+
+    def match(self, text, start):
+        """returns tuple (user, end position) for the username
+        starting at the position start and followed by the end
+        of text or by a mention termination character,
+        or (None, start) if there is no such username
+        """
+        termination_chars = const.TWITTER_STYLE_MENTION_TERMINATION_CHARS
+        best_match = None
+        node = self.trie
+        position = start
+        text_length = len(text)
+        while node is not None:
+            user_entry = node.get(None)
+            if user_entry is not None:
+                if position == text_length or text[position] in termination_chars:
+                    if best_match is None or user_entry[0] < best_match[0][0]:
+                        best_match = (user_entry, position)
+            if position == text_length:
+                break
+            node = node.get(text[position])
+            position += 1
+
+        if best_match is None:
+            return None, start
+        (user_position, user), end = best_match
+        return user, end
+
+def has_ambiguous_usernames(users):
+    """True if username of some user is the beginning
+    of the username of another user, i.e. the order of users
+    matters for the :class:`MentionMatcher`
+    """
+    usernames = sorted([user.username for user in users])
+    for index in range(1, len(usernames)):
+        if usernames[index].startswith(usernames[index - 1]):
+            return True
+    return False
 
 def extract_mentioned_name_seeds(text):
     extra_name_seeds = set()
@@ -75,61 +165,35 @@ def extract_mentioned_name_seeds(text):
     return extra_name_seeds
 
 def mentionize_text(text, anticipated_authors):
-    output = ''
+    """converts occurences of '@mention' to user account links,
+    leading space is required unless @ is the first character
+    in whole text or follows right after the previous '@mention',
+    also, either a punctuation or a ' ' char is required after the name
+
+    returns tuple (list of mentioned users, html)
+    """
+    matcher = MentionMatcher(anticipated_authors)
+    termination_chars = const.TWITTER_STYLE_MENTION_TERMINATION_CHARS
+    output = list()
     mentioned_authors = list()
-    while '@' in text:
-        #the purpose of this loop is to convert any occurance of 
-        #'@mention ' syntax
-        #to user account links leading space is required unless @ is the first
-        #character in whole text, also, either a punctuation or 
-        #a ' ' char is required after the name
-        pos = text.index('@')
-
-        #save stuff before @mention to the output
-        output += text[:pos]#this works for pos == 0 too
-
-        if len(text) == pos + 1:
-            #finish up if the found @ is the last symbol
-            output += '@'
-            text = ''
-            break
-
-        if pos > 0:
-
-            if text[pos-1] in const.TWITTER_STYLE_MENTION_TERMINATION_CHARS:
-                #if there is a termination character before @mention
-                #indeed try to find a matching person
-                text = text[pos+1:]
-                mentioned_author, text = \
-                                    extract_first_matching_mentioned_author(
-                                                            text, 
-                                                            anticipated_authors
-                                                        )
-                if mentioned_author:
-                    mentioned_authors.append(mentioned_author)
-                    output += format_mention_in_html(mentioned_author)
-                else:
-                    output += '@'
-
-            else:
-                #if there isn't, i.e. text goes like something@mention,
-                #do not look up people
-                output += '@'
-                text = text[pos+1:]
+    #start of the text not processed yet
+    segment_start = 0
+    pos = text.find('@')
+    while pos != -1:
+        mentioned_author = None
+        if pos == segment_start or text[pos - 1] in termination_chars:
+            mentioned_author, end = matcher.match(text, pos + 1)
+
+        output.append(text[segment_start:pos])
+        if mentioned_author:
+            mentioned_authors.append(mentioned_author)
+            output.append(format_mention_in_html(mentioned_author))
+            segment_start = end
         else:
-            #do this if @ is the first character
-            text = text[1:]
-            mentioned_author, text = \
-                                extract_first_matching_mentioned_author(
-                                                    text, 
-                                                    anticipated_authors
-                                                )
-            if mentioned_author:
-                mentioned_authors.append(mentioned_author)
-                output += format_mention_in_html(mentioned_author)
-            else:
-                output += '@'
+            output.append('@')
+            segment_start = pos + 1
+        pos = text.find('@', segment_start)
 
     #append the rest of text that did not have @ symbols
-    output += text
-    return mentioned_authors, output
+    output.append(text[segment_start:])
+    return mentioned_authors, ''.join(output)
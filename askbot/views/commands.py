@@ -16,9 +16,11 @@ from django.utils import simplejson
 from django.utils.translation import ugettext as _
 from askbot import models
 from askbot import forms
+from askbot.models.question import QUESTION_ORDER_BY_MAP
 from askbot.conf import should_show_sort_by_relevance
 from askbot.conf import settings as askbot_settings
 from askbot.utils import decorators
+from askbot.utils import keyset
 from askbot.skins.loaders import render_into_skin
 from askbot import const
 import logging
@@ -430,25 +432,52 @@ def api_get_questions(request):
     """json api for retrieving questions
     todo - see if it is possible to integrate this with the
     questions view
+
+    unless questions are sorted by relevance, each question
+    has a "cursor", which may be passed as parameter "after"
+    to get the questions that follow it
     """
     form = forms.AdvancedSearchForm(request.GET)
     if form.is_valid():
         query = form.cleaned_data['query']
         questions = models.Question.objects.get_by_text_query(query)
+        order_by = None
         if should_show_sort_by_relevance():
             questions = questions.extra(order_by = ['-relevance'])
+        else:
+            order_by = QUESTION_ORDER_BY_MAP[const.DEFAULT_POST_SORT_METHOD]
+            questions = questions.order_by(
+                                    order_by,
+                                    keyset.get_tie_breaker(order_by)
+                                )
+            cursor = request.GET.get('after', None)
+            if cursor:
+                try:
+                    questions = keyset.filter_after(
+                                            questions,
+                                            order_by,
+                                            cursor
+                                        )
+                except ValueError:
+                    raise ValidationError('InvalidInput')
         questions = questions.distinct()
-        page_size = form.cleaned_data.get('page_size', 30)
+        page_size = form.cleaned_data.get('page_size') or 30
         questions = questions[:page_size]
 
 
         question_list = list()
         for question in questions:
-            question_list.append({
+            question_data = {
                 'url': question.get_absolute_url(),
                 'title': question.title,
                 'answer_count': question.answer_count
-            })
+            }
+            if order_by:
+                question_data['cursor'] = keyset.get_cursor(
+                                                    question,
+                                                    order_by
+                                                )
+            question_list.append(question_data)
         json_data = simplejson.dumps(question_list)
         return HttpResponse(json_data, mimetype = "application/json")
     else:
@@ -13,8 +13,10 @@ from django.db.models import Q
 from django.shortcuts import get_object_or_404
 from django.http import HttpResponseRedirect, HttpResponse, Http404
 from django.core.paginator import Paginator, EmptyPage, InvalidPage
+from django.conf import settings as django_settings
 from django.template import Context
 from django.utils.http import urlencode
+from django.utils.hashcompat import md5_constructor
 from django.utils import simplejson
 from django.utils.translation import ugettext as _
 from django.utils.translation import ungettext
@@ -27,18 +29,19 @@ from categories.models import Category
 
 import askbot
 from askbot import exceptions
-from askbot.utils.diff import textDiff as htmldiff
 from askbot.forms import AdvancedSearchForm, AnswerForm, ShowQuestionForm
 from askbot import models
-from askbot.models.badges import award_badges_signal
+from askbot.models.question import QUESTION_ORDER_BY_MAP, CachedSearchResult
 from askbot import const
 from askbot.utils import functions
+from askbot.utils import keyset
 from askbot.utils.decorators import anonymous_forbidden, ajax_only, get_only
 from askbot.search.state_manager import SearchState
 from askbot.templatetags import extra_tags
 from askbot.templatetags import extra_filters
 import askbot.conf
 from askbot.skins.loaders import render_into_skin, get_template#jinja2 template loading enviroment
+from askbot.skins.loaders import get_viewer_class
 
 # used in index page
 #todo: - take these out of const or settings
@@ -48,6 +51,18 @@ INDEX_TAGS_SIZE = 25
 # used in tags list
 DEFAULT_PAGE_SIZE = 60
 # used in questions
+#read the listing pages after the last question of the previous page
+#instead of using offsets, total question count is then cached
+KEYSET_PAGINATION = getattr(
+                        django_settings,
+                        'ASKBOT_KEYSET_PAGINATION',
+                        False
+                    )
+QUESTION_COUNT_CACHE_TIMEOUT = getattr(
+                        django_settings,
+                        'ASKBOT_QUESTION_COUNT_CACHE_TIMEOUT',
+                        60
+                    )
 # used in answers
 
 #refactor? - we have these
@@ -61,6 +76,55 @@ def index(request):#generates front page - shows listing of questions sorted in
     """
     return HttpResponseRedirect(reverse('questions', kwargs=dict(category_name='')))
 
+def get_keyset_page(request, questions, search_state, order_by, category_name):
+    """returns paginator and page of the questions listing,
+    pages following the already seen ones are read after
+    the cursors of the previous pages, which are stored in the session
+    for the current selection of questions
+    """
+    selection = repr((
+                    request.user.id,
+                    search_state.scope,
+                    search_state.query,
+                    sorted(search_state.tags or []),
+                    search_state.author,
+                    search_state.sort,
+                    search_state.page_size,
+                    category_name
+                ))
+    selection_key = md5_constructor(selection).hexdigest()
+
+    def get_count():
+        return keyset.get_cached_count(
+                            questions,
+                            'askbot-question-count-' + selection_key,
+                            QUESTION_COUNT_CACHE_TIMEOUT
+                        )
+
+    paginator = keyset.KeysetPaginator(
+                            questions,
+                            search_state.page_size,
+                            order_by = order_by,
+                            count = get_count
+                        )
+
+    page_cursors = request.session.get('question_page_cursors')
+    if page_cursors is None or page_cursors['selection'] != selection_key:
+        page_cursors = {'selection': selection_key}
+
+    try:
+        page = paginator.page(
+                        search_state.page,
+                        cursor = page_cursors.get(search_state.page)
+                    )
+    except InvalidPage:
+        raise Http404
+
+    if page.has_next():
+        page_cursors[page.next_page_number()] = page.get_end_cursor()
+    request.session['question_page_cursors'] = page_cursors
+    return paginator, page
+
 def questions(request, category_name):
     """
     List of Questions, Tagged questions, and Unanswered questions.
@@ -106,12 +170,26 @@ def questions(request, category_name):
                                             category = category,
                                         )
 
-    paginator = Paginator(qs, search_state.page_size)
+    order_by = QUESTION_ORDER_BY_MAP.get(search_state.sort)
+    #pages of the cached search result are read by ids anyway
+    if KEYSET_PAGINATION and order_by \
+        and not isinstance(qs, CachedSearchResult):
+        paginator, page = get_keyset_page(
+                                request, qs, search_state,
+                                order_by, category_name
+                            )
+    else:
+        paginator = Paginator(qs, search_state.page_size)
 
-    if paginator.num_pages < search_state.page:
-        raise Http404
+        if paginator.num_pages < search_state.page:
+            raise Http404
+
+        page = paginator.page(search_state.page)
 
-    page = paginator.page(search_state.page)
+    tag_filter = meta_data.get('tag_filter', None)
+    if tag_filter:
+        #mark interesting and ignored questions on the page
+        tag_filter.annotate_questions(page.object_list)
 
     contributors = models.Question.objects.get_question_and_answer_contributors(page.object_list)
 
@@ -485,15 +563,6 @@ def question(request, id):#refactor - long subroutine. display question body, an
     answers = question.get_answers(user = request.user)
     answers = answers.select_related(depth=1)
 
-    user_answer_votes = {}
-    for answer in answers:
-        vote = answer.get_user_vote(request.user)
-        if vote is not None and not user_answer_votes.has_key(answer.id):
-            vote_value = -1
-            if vote.is_upvote():
-                vote_value = 1
-            user_answer_votes[answer.id] = vote_value
-
     view_dic = {"latest":"-added_at", "oldest":"added_at", "votes":"-score" }
     orderby = view_dic[answer_sort_method]
     if answers is not None:
@@ -543,22 +612,15 @@ def question(request, id):#refactor - long subroutine. display question body, an
                                                     datetime.datetime.now()
 
         if update_view_count:
-            question.view_count += 1
-            question.save()
+            #badges for question views are awarded
+            #when the view count is flushed to the database
+            models.Question.objects.update_view_count(question)
 
         #2) question view count per user and clear response displays
         if request.user.is_authenticated():
             #get response notifications
             request.user.visit_question(question)
 
-        #3) send award badges signal for any badges
-        #that are awarded for question views
-        award_badges_signal.send(None,
-                        event = 'view_question',
-                        actor = request.user,
-                        context_object = question,
-                    )
-
     paginator_data = {
         'is_paginated' : (objects_list.count > const.ANSWERS_PAGE_SIZE),
         'pages': objects_list.num_pages,
@@ -573,13 +635,30 @@ def question(request, id):#refactor - long subroutine. display question body, an
     paginator_context = extra_tags.cnprog_paginator(paginator_data)
 
     favorited = question.has_favorite_by_user(request.user)
-    if request.user.is_authenticated():
-        question_vote = question.votes.select_related().filter(user=request.user)
-    else:
-        question_vote = None #is this correct?
-    if question_vote is not None and question_vote.count() > 0:
-        question_vote = question_vote[0]
 
+    #load votes of the user on the question and the displayed answers
+    #with one query
+    user_votes = models.Vote.objects.get_votes_for_posts(
+                            user = request.user,
+                            posts = [question] + list(page_objects.object_list)
+                        )
+    question_vote = user_votes.get(question, None)
+    user_answer_votes = {}
+    for answer in page_objects.object_list:
+        vote = user_votes.get(answer, None)
+        if vote is not None:
+            if vote.is_upvote():
+                user_answer_votes[answer.id] = 1
+            else:
+                user_answer_votes[answer.id] = -1
+
+
+    if show_comment:
+        #permalinked comments are expanded, so post
+        #fragments are rendered without the cache
+        fragment_viewer_class = None
+    else:
+        fragment_viewer_class = get_viewer_class(request.user)
 
     data = {
         'page_class': 'question-page',
@@ -598,7 +677,8 @@ def question(request, id):#refactor - long subroutine. display question body, an
         'paginator_context' : paginator_context,
         'show_post': show_post,
         'show_comment': show_comment,
-        'comment_order_number': comment_order_number
+        'comment_order_number': comment_order_number,
+        'fragment_viewer_class': fragment_viewer_class,
     }
     return render_into_skin('question.html', data, request)
 
@@ -608,12 +688,11 @@ def revisions(request, id, object_name=None):
     revisions = list(post.revisions.all())
     revisions.reverse()
     for i, revision in enumerate(revisions):
-        revision.html = revision.as_html()
         if i == 0:
-            revision.diff = revisions[i].html
+            revision.diff = revision.as_html()
             revision.summary = _('initial version')
         else:
-            revision.diff = htmldiff(revisions[i-1].html, revision.html)
+            revision.diff = revision.get_diff_html(revisions[i-1])
     data = {
         'page_class':'revisions-page',
         'active_tab':'questions',